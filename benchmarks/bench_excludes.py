@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+
+Micro benchmark for the per-call cost of checking dir and file
+excludes, comparing the old loop over excluded_dirs patterns
+with the compiled matchers in diskover_matchers.py.
+
+Example:
+python bench_excludes.py -p 200 -n 100000
+"""
+
+import argparse
+import random
+import time
+import sys
+import os
+import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from diskover_matchers import DirMatcher, FileMatcher
+
+
+def old_dir_excluded(path, excluded_dirs, included_dirs):
+    # loop over patterns like dir_excluded used to do (without *str patterns
+    # which gave an invalid regex)
+    name = os.path.basename(path)
+    if name in included_dirs or path in included_dirs:
+        return False
+    if name in excluded_dirs or path in excluded_dirs:
+        return True
+    if name.startswith('.') and u'.*' in excluded_dirs:
+        return True
+    for d in excluded_dirs:
+        if d == '.*':
+            continue
+        if d.startswith('*') and d.endswith('*'):
+            d = d.replace('*', '')
+            if re.search(d, name) or re.search(d, path):
+                return True
+        elif d.endswith('*'):
+            d = '^' + d
+            if re.search(d, name) or re.search(d, path):
+                return True
+        elif d == name or d == path:
+            return True
+    return False
+
+
+def old_file_excluded(filename, excluded_files, included_files):
+    if filename in included_files:
+        return False
+    if filename in excluded_files:
+        return True
+    extension = os.path.splitext(filename)[1][1:].strip().lower()
+    if (not extension and 'NULLEXT' in excluded_files) or \
+            '*.' + extension in excluded_files or \
+            (filename.startswith('.') and u'.*' in excluded_files):
+        return True
+    return False
+
+
+def make_patterns(n):
+    dirs = set(['.*', '.snapshot', '.zfs', '/proc', '/sys'])
+    i = 0
+    while len(dirs) < n:
+        dirs.add('exclude_%s' % i)
+        dirs.add('/mnt/share/exclude_%s' % i)
+        dirs.add('*tmp_%s*' % i)
+        dirs.add('cache_%s*' % i)
+        i += 1
+    files = set(['NULLEXT', '.*', 'Thumbs.db'])
+    i = 0
+    while len(files) < n:
+        files.add('*.ext%s' % i)
+        files.add('file_%s.dat' % i)
+        i += 1
+    return dirs, files
+
+
+def make_paths(n):
+    paths = []
+    names = []
+    for i in range(n):
+        depth = random.randint(2, 8)
+        path = '/mnt/share/' + '/'.join('dir_%s' % random.randint(0, 1000) for d in range(depth))
+        # some paths which are excluded
+        if i % 10 == 0:
+            path += random.choice(['/x_tmp_%s_y', '/cache_%sx', '/exclude_%s']) % random.randint(0, 100)
+        paths.append(path)
+        names.append('file_%s.%s' % (i, random.choice(['txt', 'jpg', 'mp4', 'ext5', 'dat', 'ext999'])))
+    return paths, names
+
+
+def bench(func, items, *args):
+    starttime = time.time()
+    count = 0
+    for item in items:
+        if func(item, *args):
+            count += 1
+    elapsed = time.time() - starttime
+    return elapsed / len(items) * 1e6, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--patterns", type=int, default=200,
+                        help="Number of exclude patterns for dirs and files (default: 200)")
+    parser.add_argument("-n", "--numpaths", type=int, default=100000,
+                        help="Number of paths/file names to check (default: 100000)")
+    args = parser.parse_args()
+
+    random.seed(42)
+    excluded_dirs, excluded_files = make_patterns(args.patterns)
+    included_dirs = set(['.keep'])
+    included_files = set(['.gitignore'])
+    paths, names = make_paths(args.numpaths)
+
+    dir_matcher = DirMatcher(excluded_dirs, included_dirs)
+    file_matcher = FileMatcher(excluded_files, included_files)
+
+    print('%s dir patterns, %s file patterns, %s paths' % (len(excluded_dirs), len(excluded_files), len(paths)))
+    old, old_count = bench(old_dir_excluded, paths, excluded_dirs, included_dirs)
+    new, new_count = bench(dir_matcher.excluded, paths)
+    print('dir excluded:  old %.3f us/call, compiled %.3f us/call (%.1fx), excluded %s/%s'
+          % (old, new, old / new, old_count, new_count))
+    old, old_count = bench(old_file_excluded, names, excluded_files, included_files)
+    new, new_count = bench(file_matcher.excluded, names)
+    print('file excluded: old %.3f us/call, compiled %.3f us/call (%.1fx), excluded %s/%s'
+          % (old, new, old / new, old_count, new_count))
+
+
+if __name__ == "__main__":
+    main()
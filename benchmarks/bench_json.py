@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+
+Benchmark for building ES bulk bodies for crawl docs, docs/sec on
+one core for the old helpers.bulk way (stdlib json str lines) and
+NDJSON bytes bodies with each serializer in BulkSerializer (json,
+ujson and orjson if installed), with and without gzip (httpcompress
+setting in diskover.cfg).
+
+Example:
+python bench_json.py -n 200000
+"""
+
+from datetime import datetime
+import argparse
+import hashlib
+import random
+import json
+import time
+import zlib
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from diskover_bulk import BulkIndexer, BulkSerializer, orjson, ujson
+
+
+def make_docs(n):
+    # file docs like get_file_meta's
+    random.seed(42)
+    docs = []
+    for i in range(n):
+        mtime = 1500000000 + random.randint(0, 100000000)
+        docs.append({
+            "filename": 'file_%s.%s' % (i, random.choice(('txt', 'jpg', 'dat', 'mp4'))),
+            "extension": random.choice(('txt', 'jpg', 'dat', 'mp4')),
+            "path_parent": '/mnt/isilon/projects/level_0_dir_%s/level_1_dir_%s/level_2_dir_%s' % (i % 7, i % 13, i % 101),
+            "filesize": random.randint(0, 10 ** 9),
+            "owner": 'user%s' % (i % 50),
+            "group": 'group%s' % (i % 10),
+            "last_modified": datetime.utcfromtimestamp(mtime).isoformat(),
+            "last_access": datetime.utcfromtimestamp(mtime + 100).isoformat(),
+            "last_change": datetime.utcfromtimestamp(mtime + 50).isoformat(),
+            "hardlinks": 1,
+            "inode": str(1000000 + i),
+            "filehash": hashlib.md5(str(i).encode('utf-8')).hexdigest(),
+            "tag": "",
+            "tag_custom": "",
+            "dupe_md5": "",
+            "worker_name": 'host.12345',
+            "indexing_date": datetime.utcnow().isoformat(),
+            "_type": "file"
+        })
+    return docs
+
+
+def helpers_body(docs, chunksize):
+    # like elasticsearch helpers.bulk, stdlib json str lines joined and encoded
+    from diskover_connections import helpers
+    bodies = []
+    lines = []
+    for doc in docs:
+        action, data = helpers.expand_action(doc)
+        lines.append(json.dumps(action, ensure_ascii=False))
+        lines.append(json.dumps(data, ensure_ascii=False))
+        if len(lines) >= chunksize * 2:
+            bodies.append(('\n'.join(lines) + '\n').encode('utf-8', 'surrogatepass'))
+            lines = []
+    if lines:
+        bodies.append(('\n'.join(lines) + '\n').encode('utf-8', 'surrogatepass'))
+    return bodies
+
+
+def ndjson_body(docs, chunksize, serializer):
+    # chunks doesn't use es
+    indexer = BulkIndexer(None, chunksize=chunksize, serializer=serializer)
+    bodies = []
+    for chunk in indexer.chunks(docs):
+        lines = []
+        for action, data in chunk:
+            lines.append(action)
+            lines.append(data)
+        lines.append(b'')
+        bodies.append(b'\n'.join(lines))
+    return bodies
+
+
+def gzip_bodies(bodies):
+    out = []
+    for body in bodies:
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        out.append(compressor.compress(body) + compressor.flush())
+    return out
+
+
+def run(name, func, docs, runs, gzip):
+    best = None
+    for _ in range(runs):
+        starttime = time.time()
+        bodies = func()
+        if gzip:
+            bodies = gzip_bodies(bodies)
+        elapsed = time.time() - starttime
+        best = elapsed if best is None else min(best, elapsed)
+    size = sum(len(body) for body in bodies)
+    print('%-24s %8.0f docs/sec  %6.1f bytes/doc' % (name + (' + gzip' if gzip else ''),
+                                                     len(docs) / best, float(size) / len(docs)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--numdocs", type=int, default=100000,
+                        help="Number of file docs (default: 100000)")
+    parser.add_argument("-c", "--chunksize", type=int, default=1000,
+                        help="Docs per bulk request (default: 1000)")
+    parser.add_argument("-r", "--runs", type=int, default=3,
+                        help="Number of runs, best is shown (default: 3)")
+    args = parser.parse_args()
+
+    docs = make_docs(args.numdocs)
+    names = ['json']
+    if ujson is not None:
+        names.append('ujson')
+    if orjson is not None:
+        names.append('orjson')
+    for gzip in (False, True):
+        run('helpers.bulk json', lambda: helpers_body(docs, args.chunksize), docs, args.runs, gzip)
+        for name in names:
+            serializer = BulkSerializer(name)
+            run('ndjson ' + name, lambda: ndjson_body(docs, args.chunksize, serializer), docs, args.runs, gzip)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+
+Benchmark for the size of crawl job payloads in Redis, comparing
+the old (batch, cliargs, reindex_dict) job args with the compact
+batch encoding and crawl settings record in diskover_payload.py
+using no compression, zlib and lz4 (if installed).
+
+Batches are made from walking a directory (-d) or generated for
+a deep tree.
+
+Example:
+python bench_payload.py -d /mnt/share -b 50
+"""
+
+import argparse
+import pickle
+import random
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from diskover_payload import encode_batch, decode_batch, compression_supported
+
+
+def walk_batches(path, batchsize, embedstats):
+    batch = []
+    for root, dirs, files in os.walk(path):
+        if embedstats:
+            files = [(os.path.join(root, f), (1024, 1500000000.0, 1500000000.0, 1500000000.0, 0, 0, 1, 1))
+                     for f in files]
+            root = (root, (1500000000.0, 1500000000.0, 1500000000.0, 0, 0, 1, 1))
+        batch.append((root, dirs, files))
+        if len(batch) >= batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generated_batches(numdirs, batchsize, embedstats):
+    random.seed(42)
+    batch = []
+    for i in range(numdirs):
+        depth = 8 + i // 1000 % 6
+        root = '/mnt/isilon/projects/' + '/'.join('level_%s_dir_%s' % (d, (i // (d + 1)) % 20) for d in range(depth))
+        dirs = ['subdir_%s' % d for d in range(random.randint(0, 10))]
+        # new name strings for each dir like scandir, names repeat across dirs
+        files = ['file_%s.%s' % (random.randint(0, 50), random.choice(('txt', 'jpg', 'dat')))
+                 for f in range(random.randint(0, 60))]
+        if embedstats:
+            files = [(os.path.join(root, f), (1024, 1500000000.0, 1500000000.0, 1500000000.0, 0, 0, 1, 1))
+                     for f in files]
+            root = (root, (1500000000.0, 1500000000.0, 1500000000.0, 0, 0, 1, 1))
+        batch.append((root, dirs, files))
+        if len(batch) >= batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--dir", metavar='PATH',
+                        help="Directory to walk for batches (default: generate batches)")
+    parser.add_argument("-n", "--numdirs", type=int, default=20000,
+                        help="Number of dirs to generate when not using -d (default: 20000)")
+    parser.add_argument("-b", "--batchsize", type=int, default=50,
+                        help="Batch size (number of dirs) (default: 50)")
+    parser.add_argument("--embedstats", action="store_true",
+                        help="Batches have embeded stats like --embedstats")
+    args = parser.parse_args()
+
+    # cliargs dict like the one diskover.py sends with every job
+    cliargs = dict(('arg%s' % i, None) for i in range(60))
+    cliargs.update({'index': 'diskover-benchmark', 'rootdir': '/mnt/isilon/projects', 'batchsize': args.batchsize,
+                    'excludeddirs': ['.snapshot', '.zfs'], 'walkthreads': 8})
+    reindex_dict = {'key': 'diskover_reindex_diskover-benchmark', 'file': 0, 'directory': 0}
+    ref = 'diskover_settings_diskover-benchmark_' + '0' * 32
+
+    if args.dir:
+        batches = list(walk_batches(args.dir, args.batchsize, args.embedstats))
+    else:
+        batches = list(generated_batches(args.numdirs, args.batchsize, args.embedstats))
+    numdirs = sum(len(batch) for batch in batches)
+    print('%s dirs in %s batches' % (numdirs, len(batches)))
+
+    starttime = time.time()
+    old = sum(len(pickle.dumps((batch, cliargs, reindex_dict), protocol=2)) for batch in batches)
+    elapsed = time.time() - starttime
+    print('%-8s %10.1f bytes/dir %10.3f ms/batch' % ('old', old / float(numdirs), elapsed / len(batches) * 1000))
+    for compression in ('none', 'zlib', 'lz4'):
+        if not compression_supported(compression):
+            print('%-8s not installed' % compression)
+            continue
+        starttime = time.time()
+        size = 0
+        for batch in batches:
+            data = encode_batch(batch, compression)
+            size += len(pickle.dumps((data, ref, reindex_dict), protocol=2))
+        elapsed = time.time() - starttime
+        for batch in batches[:10]:
+            assert decode_batch(encode_batch(batch, compression)) == batch
+        print('%-8s %10.1f bytes/dir %10.3f ms/batch (%.1fx smaller)'
+              % (compression, size / float(numdirs), elapsed / len(batches) * 1000, old / float(size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+
+Benchmark for stat'ing files in directory (scandir) order
+vs inode order (inodeorder setting in diskover.cfg).
+
+Creates a large directory of files (unless -d is used) and
+lstat's all the files in each order. Use --dropcaches (linux,
+root) to drop the page/inode caches before each run, otherwise
+the inodes will be cached after the first run.
+
+Example:
+python bench_stat_order.py -n 500000 -d /mnt/nfs/benchdir --dropcaches
+"""
+
+from scandir import scandir
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import os
+
+
+def drop_caches():
+    os.system('sync')
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def make_files(path, n):
+    print('Creating %s files in %s...' % (n, path))
+    # create files in random name order so directory order isn't inode order
+    names = ['file_%08d' % i for i in range(n)]
+    random.shuffle(names)
+    for name in names:
+        open(os.path.join(path, name), 'w').close()
+    # remove and recreate some files so inodes get reused out of order
+    for name in names[::10]:
+        os.remove(os.path.join(path, name))
+    for name in names[::10]:
+        open(os.path.join(path, name), 'w').close()
+
+
+def stat_files(path, order):
+    entries = [entry for entry in scandir(path) if entry.is_file(follow_symlinks=False)]
+    if order == 'inode':
+        entries.sort(key=lambda entry: entry.inode())
+    elif order == 'random':
+        random.shuffle(entries)
+    starttime = time.time()
+    for entry in entries:
+        os.lstat(os.path.join(path, entry.name))
+    return len(entries), time.time() - starttime
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--numfiles", type=int, default=200000,
+                        help="Number of files to create (default: 200000)")
+    parser.add_argument("-d", "--dir", metavar='PATH',
+                        help="Directory to use, files are created if it's empty (default: temp dir)")
+    parser.add_argument("-r", "--runs", type=int, default=3,
+                        help="Number of runs for each order (default: 3)")
+    parser.add_argument("--dropcaches", action="store_true",
+                        help="Drop page/inode caches before each run (linux, needs root)")
+    parser.add_argument("--random", action="store_true",
+                        help="Also stat files in random order")
+    args = parser.parse_args()
+
+    if args.dir:
+        path = args.dir
+        tempdir = None
+        if not os.path.exists(path):
+            os.makedirs(path)
+    else:
+        tempdir = path = tempfile.mkdtemp(prefix='diskover_bench_')
+    try:
+        if not os.listdir(path):
+            make_files(path, args.numfiles)
+        orders = ['scandir', 'inode']
+        if args.random:
+            orders.append('random')
+        results = dict((order, []) for order in orders)
+        for run in range(args.runs):
+            for order in orders:
+                if args.dropcaches:
+                    drop_caches()
+                count, elapsed = stat_files(path, order)
+                results[order].append(elapsed)
+                print('run %s: %s order stat %s files in %.3f sec (%.0f files/sec)'
+                      % (run + 1, order, count, elapsed, count / elapsed))
+        print('')
+        for order in orders:
+            best = min(results[order])
+            print('%s order best: %.3f sec (%.0f files/sec)' % (order, best, count / best))
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+
+Benchmark for bots stat'ing files of a directory in a thread pool
+(statthreads and statchunksize settings in diskover.cfg) vs one at
+a time.
+
+Creates a directory of files (unless -d is used) and lstat's them
+with each number of threads, results are read in order like bots
+do. Use --latency to add a sleep to each lstat to simulate a high
+latency filer (nfs) when you don't have one to test on.
+
+Example:
+python bench_stat_threads.py -d /mnt/nfs/benchdir -t 1 8 32
+python bench_stat_threads.py -n 20000 --latency 2
+"""
+
+from multiprocessing.pool import ThreadPool
+import argparse
+import shutil
+import tempfile
+import time
+import os
+
+
+def make_files(path, n):
+    print('Creating %s files in %s...' % (n, path))
+    for i in range(n):
+        open(os.path.join(path, 'file_%08d' % i), 'w').close()
+
+
+def lstat_file(args):
+    fullpath, latency = args
+    if latency:
+        time.sleep(latency)
+    s = os.lstat(fullpath)
+    return fullpath, tuple(s[:10]) + (s.st_blocks,)
+
+
+def stat_files(paths, latency, threads, chunksize):
+    args = [(path, latency) for path in paths]
+    starttime = time.time()
+    if threads > 1:
+        pool = ThreadPool(threads)
+        for _ in pool.imap(lstat_file, args, chunksize):
+            pass
+        pool.close()
+        pool.join()
+    else:
+        for arg in args:
+            lstat_file(arg)
+    return time.time() - starttime
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--numfiles", type=int, default=50000,
+                        help="Number of files to create (default: 50000)")
+    parser.add_argument("-d", "--dir", metavar='PATH',
+                        help="Directory to use, files are created if it's empty (default: temp dir)")
+    parser.add_argument("-t", "--threads", type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of stat threads to test (default: 1 2 4 8 16 32)")
+    parser.add_argument("-c", "--chunksize", type=int, default=4,
+                        help="Files per thread pool task (default: 4)")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Simulated latency (ms) added to each lstat (default: 0)")
+    args = parser.parse_args()
+
+    if args.dir:
+        path = args.dir
+        tempdir = None
+        if not os.path.exists(path):
+            os.makedirs(path)
+    else:
+        tempdir = path = tempfile.mkdtemp(prefix='diskover_bench_')
+    try:
+        if not os.listdir(path):
+            make_files(path, args.numfiles)
+        paths = [os.path.join(path, name) for name in os.listdir(path)]
+        if args.latency:
+            # don't sleep for hours with 1 thread
+            paths = paths[:max(100, int(5000 / args.latency))]
+        latency = args.latency / 1000.0
+        # warm inode cache so the first run isn't slower
+        stat_files(paths, 0, 1, 1)
+        base = None
+        for threads in args.threads:
+            elapsed = stat_files(paths, latency, threads, args.chunksize)
+            if base is None:
+                base = elapsed
+            print('%s threads: stat %s files in %.3f sec (%.0f files/sec, %.1fx)'
+                  % (threads, len(paths), elapsed, len(paths) / elapsed, base / elapsed))
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,20 +21,27 @@ try:
 except ImportError:
     import ConfigParser
 from multiprocessing import cpu_count
-from threading import Thread, Lock
-try:
-    from queue import Queue as PyQueue
-except ImportError:
-    from Queue import Queue as PyQueue
+from threading import Lock
+from diskover_checkpoint import CrawlCheckpoint, load_checkpoint, delete_checkpoint, unfinished_jobs
+from diskover_matchers import DirMatcher, FileMatcher
+from diskover_reindex import reindex_ref, store_tags, delete_tags
+from diskover_payload import encode_batch, settings_ref
+from diskover_enqueue import BulkEnqueuer
+from diskover_jobs import JobTracker, STATS_FIELDS, deferred_jobs
+from diskover_namespaces import namespaced, register_namespace, unregister_namespace
+from diskover_local import LocalPool
+from diskover_bulk import BulkIndexer, BulkSerializer
+from diskover_walk import WalkController, TreeWalker, ProcessTreeWalker, DirFiles, getdents, getdents_supported, \
+    entry_type, DT_DIR, DT_REG
 import progressbar
 import argparse
 import logging
 import imp
 import time
 import math
-import re
 import os
 import sys
+import atexit
 import json
 
 
@@ -171,6 +178,11 @@ def load_config():
             configsettings['included_files'] = set(files)
         except ConfigParser.NoOptionError:
             configsettings['included_files'] = set([])
+        # compile excludes/includes
+        configsettings['dir_matcher'] = DirMatcher(configsettings['excluded_dirs'],
+                                                   configsettings['included_dirs'])
+        configsettings['file_matcher'] = FileMatcher(configsettings['excluded_files'],
+                                                     configsettings['included_files'])
         try:
             configsettings['ownersgroups_uidgidonly'] = config.get('ownersgroups', 'uidgidonly').lower()
         except ConfigParser.NoOptionError:
@@ -277,6 +289,58 @@ def load_config():
             configsettings['es_chunksize'] = int(config.get('elasticsearch', 'chunksize'))
         except ConfigParser.NoOptionError:
             configsettings['es_chunksize'] = 500
+        try:
+            configsettings['es_serializer'] = config.get('elasticsearch', 'serializer').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['es_serializer'] = "auto"
+        try:
+            configsettings['es_httpcompress'] = config.get('elasticsearch', 'httpcompress').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['es_httpcompress'] = "false"
+        try:
+            configsettings['es_maxchunkbytes'] = int(config.get('elasticsearch', 'maxchunkbytes'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_maxchunkbytes'] = 10485760
+        try:
+            configsettings['es_bulkmaxretries'] = int(config.get('elasticsearch', 'bulkmaxretries'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkmaxretries'] = 8
+        try:
+            configsettings['es_bulkinitialbackoff'] = float(config.get('elasticsearch', 'bulkinitialbackoff'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkinitialbackoff'] = 1.0
+        try:
+            configsettings['es_bulkmaxbackoff'] = float(config.get('elasticsearch', 'bulkmaxbackoff'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkmaxbackoff'] = 60.0
+        try:
+            configsettings['es_bulkthreads'] = int(config.get('elasticsearch', 'bulkthreads'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkthreads'] = 4
+        try:
+            configsettings['es_bulktargetlatency'] = float(config.get('elasticsearch', 'bulktargetlatency'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulktargetlatency'] = 2.0
+        try:
+            configsettings['es_healthcheckinterval'] = float(config.get('elasticsearch', 'healthcheckinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_healthcheckinterval'] = 30.0
+        try:
+            configsettings['es_bulkbuffer'] = config.get('elasticsearch', 'bulkbuffer').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkbuffer'] = "true"
+        try:
+            configsettings['es_bulkflushinterval'] = float(config.get('elasticsearch', 'bulkflushinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkflushinterval'] = 1.0
+        try:
+            configsettings['es_bulkmaxbytes'] = int(config.get('elasticsearch', 'bulkmaxbytes'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_bulkmaxbytes'] = 10485760
+        try:
+            configsettings['es_workerstatsinterval'] = float(config.get('elasticsearch', 'workerstatsinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['es_workerstatsinterval'] = 60.0
         try:
             configsettings['index_shards'] = int(config.get('elasticsearch', 'shards'))
         except ConfigParser.NoOptionError:
@@ -337,6 +401,22 @@ def load_config():
             configsettings['redis_ttl'] = int(config.get('redis', 'ttl'))
         except ConfigParser.NoOptionError:
             configsettings['redis_ttl'] = 500
+        try:
+            configsettings['redis_payloadcompression'] = config.get('redis', 'payloadcompression').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['redis_payloadcompression'] = "zlib"
+        try:
+            configsettings['redis_settingsttl'] = int(config.get('redis', 'settingsttl'))
+        except ConfigParser.NoOptionError:
+            configsettings['redis_settingsttl'] = 604800
+        try:
+            configsettings['redis_enqueueflushsize'] = int(config.get('redis', 'enqueueflushsize'))
+        except ConfigParser.NoOptionError:
+            configsettings['redis_enqueueflushsize'] = 500
+        try:
+            configsettings['redis_enqueueflushinterval'] = float(config.get('redis', 'enqueueflushinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['redis_enqueueflushinterval'] = 1.0
         try:
             configsettings['redis_queue'] = config.get('redis', 'queue')
         except ConfigParser.NoOptionError:
@@ -349,6 +429,10 @@ def load_config():
             configsettings['redis_queue_calcdir'] = config.get('redis', 'queuecalcdir')
         except ConfigParser.NoOptionError:
             configsettings['redis_queue_calcdir'] = "diskover_calcdir"
+        try:
+            configsettings['redis_queuenamespaces'] = config.get('redis', 'queuenamespaces').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['redis_queuenamespaces'] = "false"
         try:
             configsettings['adaptivebatch_startsize'] = int(config.get('adaptivebatch', 'startsize'))
         except ConfigParser.NoOptionError:
@@ -413,6 +497,74 @@ def load_config():
             configsettings['crawlbot_dirlisttime'] = int(config.get('crawlbot', 'dirlisttime'))
         except ConfigParser.NoOptionError:
             configsettings['crawlbot_dirlisttime'] = 3600
+        try:
+            configsettings['treewalk_getdentsbufsize'] = int(config.get('treewalk', 'getdentsbufsize'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_getdentsbufsize'] = 4194304
+        try:
+            configsettings['treewalk_splitfiles'] = int(config.get('treewalk', 'splitfiles'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_splitfiles'] = 50000
+        try:
+            configsettings['treewalk_inodeorder'] = config.get('treewalk', 'inodeorder').lower()
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_inodeorder'] = "true"
+        try:
+            configsettings['treewalk_statthreads'] = int(config.get('treewalk', 'statthreads'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_statthreads'] = 1
+        try:
+            configsettings['treewalk_statchunksize'] = int(config.get('treewalk', 'statchunksize'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_statchunksize'] = 4
+        try:
+            configsettings['treewalk_targetlatency'] = float(config.get('treewalk', 'targetlatency'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_targetlatency'] = 20.0
+        try:
+            configsettings['treewalk_adaptiveinterval'] = float(config.get('treewalk', 'adaptiveinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_adaptiveinterval'] = 1.0
+        try:
+            configsettings['treewalk_checkpointinterval'] = int(config.get('treewalk', 'checkpointinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_checkpointinterval'] = 0
+        try:
+            configsettings['treewalk_checkpointpath'] = config.get('treewalk', 'checkpointpath')
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_checkpointpath'] = ""
+        try:
+            configsettings['treewalk_prioritydepth'] = int(config.get('treewalk', 'prioritydepth'))
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_prioritydepth'] = 5
+        try:
+            configsettings['treewalk_priorityfield'] = config.get('treewalk', 'priorityfield')
+        except ConfigParser.NoOptionError:
+            configsettings['treewalk_priorityfield'] = "items"
+        try:
+            configsettings['botsupervisor_minbots'] = int(config.get('botsupervisor', 'minbots'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_minbots'] = 1
+        try:
+            configsettings['botsupervisor_maxbots'] = int(config.get('botsupervisor', 'maxbots'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_maxbots'] = 0
+        try:
+            configsettings['botsupervisor_jobsperbot'] = int(config.get('botsupervisor', 'jobsperbot'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_jobsperbot'] = 10
+        try:
+            configsettings['botsupervisor_scaleinterval'] = float(config.get('botsupervisor', 'scaleinterval'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_scaleinterval'] = 5.0
+        try:
+            configsettings['botsupervisor_maxbulklatency'] = float(config.get('botsupervisor', 'maxbulklatency'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_maxbulklatency'] = 5.0
+        try:
+            configsettings['botsupervisor_maxload'] = float(config.get('botsupervisor', 'maxload'))
+        except ConfigParser.NoOptionError:
+            configsettings['botsupervisor_maxload'] = 2.0
         try:
             configsettings['gource_maxfilelag'] = float(config.get('gource', 'maxfilelag'))
         except ConfigParser.NoOptionError:
@@ -495,6 +647,9 @@ def index_create(indexname):
             return
         elif cliargs['crawlbot']:
             return
+        elif cliargs['resume']:
+            logger.info('Resuming crawl from checkpoint (--resume)')
+            return
         # delete existing index
         else:
             logger.warning('es index exists, deleting')
@@ -548,6 +703,36 @@ def index_create(indexname):
                         "crawl_time": {
                             "type": "float"
                         },
+                        "walk_threads": {
+                            "type": "integer"
+                        },
+                        "walk_latency": {
+                            "type": "float"
+                        },
+                        "walk_iops": {
+                            "type": "float"
+                        },
+                        "walk_throttle_time": {
+                            "type": "float"
+                        },
+                        "walk_increases": {
+                            "type": "integer"
+                        },
+                        "walk_decreases": {
+                            "type": "integer"
+                        },
+                        "bot_dir_count": {
+                            "type": "long"
+                        },
+                        "bot_file_count": {
+                            "type": "long"
+                        },
+                        "bot_crawl_time": {
+                            "type": "float"
+                        },
+                        "bot_bulk_time": {
+                            "type": "float"
+                        },
                         "indexing_date": {
                             "type": "date"
                         }
@@ -720,18 +905,44 @@ def index_create(indexname):
     time.sleep(.5)
 
 
+def get_bulk_indexer(es, config):
+    """This is the get bulk indexer function.
+    It returns the process's BulkIndexer for es, it's created the
+    first time so bulk threads are adapted across bulk adds.
+    """
+    global bulk_indexer
+    bulk_es = diskover_connections.bulk_connection(es)
+    if bulk_indexer is None or bulk_indexer.es is not bulk_es:
+        bulk_indexer = BulkIndexer(bulk_es, chunksize=config['es_chunksize'],
+                                   maxchunkbytes=config['es_maxchunkbytes'],
+                                   maxretries=config['es_bulkmaxretries'],
+                                   initialbackoff=config['es_bulkinitialbackoff'],
+                                   maxbackoff=config['es_bulkmaxbackoff'],
+                                   maxthreads=config['es_bulkthreads'],
+                                   targetlatency=config['es_bulktargetlatency'],
+                                   request_timeout=config['es_timeout'],
+                                   serializer=BulkSerializer(config['es_serializer']))
+    return bulk_indexer
+
+
 def index_bulk_add(es, doclist, config, cliargs):
     """This is the es index bulk add function.
     It bulk adds/updates/removes using file/directory
     meta data lists from worker's crawl results.
+    Docs es rejects are retried with backoff (BulkIndexer).
     """
-    if config['es_wait_status_yellow'] == "true":
+    global last_health_check
+    if config['es_wait_status_yellow'] == "true" and \
+            time.time() - last_health_check >= config['es_healthcheckinterval']:
         # wait for es health to be at least yellow
         es.cluster.health(wait_for_status='yellow',
                           request_timeout=config['es_timeout'])
+        last_health_check = time.time()
     # bulk load data to Elasticsearch index
-    diskover_connections.helpers.bulk(es, doclist, index=cliargs['index'],
-            chunk_size=config['es_chunksize'], request_timeout=config['es_timeout'])
+    starttime = time.time()
+    get_bulk_indexer(es, config).bulk(doclist, cliargs['index'])
+    if bulk_timer is not None:
+        bulk_timer(time.time() - starttime)
 
 
 def index_delete_path(path, cliargs, logger, reindex_dict, recursive=False):
@@ -739,7 +950,7 @@ def index_delete_path(path, cliargs, logger, reindex_dict, recursive=False):
     It finds all file and directory docs in path and deletes them from es
     including the directory (path).
     Recursive will also find and delete all docs in subdirs of path.
-    Stores any existing tags in reindex_dict.
+    Stores any existing tags in the Redis hash reindex_dict refers to.
     Returns reindex_dict.
     """
     file_id_list = []
@@ -788,11 +999,9 @@ def index_delete_path(path, cliargs, logger, reindex_dict, recursive=False):
         for hit in res['hits']['hits']:
             # add doc id to file_id_list
             file_id_list.append(hit['_id'])
-            # add file path info inc. tags to reindex_file_list
-            reindex_dict['file'].append((hit['_source']['path_parent'] +
-                                      '/' + hit['_source']['filename'],
-                                      hit['_source']['tag'],
-                                      hit['_source']['tag_custom']))
+        # add any existing tags to reindex tags hash in Redis
+        store_tags(reindex_dict, 'file', [hit['_source'] for hit in res['hits']['hits']],
+                                    redis_conn)
         # get es scroll id
         scroll_id = res['_scroll_id']
         # use es scroll api
@@ -849,11 +1058,9 @@ def index_delete_path(path, cliargs, logger, reindex_dict, recursive=False):
         for hit in res['hits']['hits']:
             # add directory doc id to dir_id_list
             dir_id_list.append(hit['_id'])
-            # add directory path info inc. tags, filesize, items to reindex_dir_list
-            reindex_dict['directory'].append((hit['_source']['path_parent'] +
-                                     '/' + hit['_source']['filename'],
-                                     hit['_source']['tag'],
-                                     hit['_source']['tag_custom']))
+        # add any existing tags to reindex tags hash in Redis
+        store_tags(reindex_dict, 'directory', [hit['_source'] for hit in res['hits']['hits']],
+                                    redis_conn)
         # get es scroll id
         scroll_id = res['_scroll_id']
         # use es scroll api
@@ -881,7 +1088,7 @@ def index_delete_path(path, cliargs, logger, reindex_dict, recursive=False):
 
 
 def index_get_docs(cliargs, logger, doctype='directory', copytags=False, hotdirs=False,
-                   index=None, path=None, sort=False, maxdepth=None, pathid=False):
+                   index=None, path=None, sort=False, maxdepth=None, pathid=False, priority=False):
     """This is the es get docs function.
     It finds all docs (by doctype) in es and returns doclist
     which contains doc id, fullpath and mtime for all docs.
@@ -889,10 +1096,12 @@ def index_get_docs(cliargs, logger, doctype='directory', copytags=False, hotdirs
     If path is specified will return just documents in and under directory path.
     If sort is True, will return paths in asc path order.
     if pathid is True, will return dict with path and their id.
+    If priority is True, will return dict with path and their
+    (items, crawl_time) for walk ordering.
     """
 
-    data = _index_get_docs_data(index, cliargs, logger, doctype=doctype, path=path, 
-                                maxdepth=maxdepth, sort=sort)
+    data = _index_get_docs_data(index, cliargs, logger, doctype=doctype, path=path,
+                                maxdepth=maxdepth, sort=sort, priority=priority)
 
     # refresh index
     es.indices.refresh(index)
@@ -915,6 +1124,8 @@ def index_get_docs(cliargs, logger, doctype='directory', copytags=False, hotdirs
                                 hit['_source']['items_files'], hit['_source']['items_subdirs']))
             elif pathid:
                 pathdict[rel_path] = hit['_id']
+            elif priority:
+                pathdict[fullpath] = (hit['_source'].get('items', 0), hit['_source'].get('crawl_time', 0))
             else:
                 # convert es time to unix time format
                 mtime = time.mktime(datetime.strptime(
@@ -928,14 +1139,28 @@ def index_get_docs(cliargs, logger, doctype='directory', copytags=False, hotdirs
 
     logger.info('Found %s %s docs' % (str(doccount), doctype))
 
-    if pathid:
+    if pathid or priority:
         return pathdict
     else:
         return doclist
 
 
-def _index_get_docs_data(index, cliargs, logger, doctype='directory', path=None, maxdepth=None, sort=False):
-    if cliargs['copytags']:
+def _index_get_docs_data(index, cliargs, logger, doctype='directory', path=None, maxdepth=None, sort=False,
+                         priority=False):
+    if priority:
+        logger.info('Searching for %s docs in %s for walk order (maxdepth %s)...', doctype, index, maxdepth)
+        data = {
+            '_source': ['path_parent', 'filename', 'items', 'crawl_time'],
+            'query': {
+                'match_all': {}
+            }
+        }
+        if maxdepth:
+            # depth at rootdir
+            num_sep = cliargs['rootdir'].count(os.path.sep)
+            n = num_sep + maxdepth - 1
+            data['query'] = {'regexp': {'path_parent': '(/[^/]+){1,' + str(n) + '}|/?'}}
+    elif cliargs['copytags']:
         logger.info('Searching for all %s docs with tags in %s...', doctype, index)
         data = {
             '_source': ['path_parent', 'filename', 'tag', 'tag_custom'],
@@ -1067,79 +1292,29 @@ def add_diskspace(index, logger, path):
     es.index(index=index, doc_type='diskspace', body=data)
 
 
-def add_crawl_stats(es, index, path, crawltime, state):
+def add_crawl_stats(es, index, path, crawltime, state, stats=None):
     """This is the add crawl stats function.
     It adds crawl stats info to es when crawl starts and finishes.
+    Any stats (dict) are added to the crawl stats doc.
     """
     data = {
         "path": path,
-        "state": state,  # running, finished_crawl, finished_dircalc
+        "state": state,  # running, checkpointed, finished_crawl, finished_dircalc
         "crawl_time": round(crawltime, 6),
         "indexing_date": datetime.utcnow().isoformat()
     }
+    if stats:
+        data.update(stats)
     es.index(index=index, doc_type='crawlstat', body=data)
 
 
 def dir_excluded(path, config, cliargs):
     """Return True if path in excluded_dirs set,
     False if not in the list"""
-    name = os.path.basename(path)
-    # return if directory in included list (whitelist)
-    if name in config['included_dirs'] or path in config['included_dirs']:
-        return False
-    # skip any dirs in excluded_dirs
-    if name in config['excluded_dirs'] or path in config['excluded_dirs']:
+    if config['dir_matcher'].excluded(path):
         if cliargs['verbose']:
             logger.info('Skipping (excluded dir) %s', path)
         return True
-    # skip any dirs which start with . (dot) and in excluded_dirs
-    if name.startswith('.') and u'.*' in config['excluded_dirs']:
-        if cliargs['verbose']:
-            logger.info('Skipping (.* dir) %s', path)
-        return True
-    # skip any dirs that are found in reg exp checks including wildcard searches
-    found_dir = False
-    found_path = False
-    for d in config['excluded_dirs']:
-        if d == '.*':
-            continue
-        if d.startswith('*') and d.endswith('*'):
-            d = d.replace('*', '')
-            if re.search(d, name):
-                found_dir = True
-                break
-            elif re.search(d, path):
-                found_path = True
-                break
-        elif d.startswith('*'):
-            d = d + '$'
-            if re.search(d, name):
-                found_dir = True
-                break
-            elif re.search(d, path):
-                found_path = True
-                break
-        elif d.endswith('*'):
-            d = '^' + d
-            if re.search(d, name):
-                found_dir = True
-                break
-            elif re.search(d, path):
-                found_path = True
-                break
-        else:
-            if d == name:
-                found_dir = True
-                break
-            elif d == path:
-                found_path = True
-                break
-
-    if found_dir or found_path:
-        if cliargs['verbose']:
-            logger.info('Skipping (excluded dir) %s', path)
-        return True
-
     return False
 
 
@@ -1218,6 +1393,16 @@ def parse_cli_args(indexname):
                         help="Adaptive batch size for sending to worker bots (intelligent crawl)")
     parser.add_argument("-T", "--walkthreads", type=int, default=cpu_count()*2,
                         help="Number of threads for treewalk (default: cpu core count x 2)")
+    parser.add_argument("--walkprocs", type=int, metavar='N', default=0,
+                        help="Number of processes for treewalk, walkthreads are split between them (default: 0, walk in dispatcher process only)")
+    parser.add_argument("--adaptivewalk", action="store_true",
+                        help="Adjust number of active treewalk threads (up to -T walkthreads) using directory listing latency, \
+                            see targetlatency in treewalk section in config")
+    parser.add_argument("--maxiops", type=int, metavar='N', default=0,
+                        help="Maximum metadata ops (directory listings and stats) per second for treewalk (default: 0, no limit)")
+    parser.add_argument("--priorindex", metavar='INDEX2',
+                        help="Walk the largest (or slowest) sub trees first using directory items/crawl_time \
+                            from index2 (prev index), see treewalk section in config")
     parser.add_argument("-A", "--autotag", action="store_true",
                         help="Get bots to auto-tag files/dirs based on patterns in config")
     parser.add_argument("-G", "--costpergb", action="store_true",
@@ -1247,6 +1432,18 @@ def parse_cli_args(indexname):
                         help="Port number for tree walk client socket server (default: from config)")
     parser.add_argument("--dirsonly", action="store_true",
                         help="Don't include files in batch sent to bots, only send dirs, bots scan for files")
+    parser.add_argument("--getdents", action="store_true",
+                        help="Use getdents64 (linux) to read directories in large chunks instead of scandir, good for dirs with millions of files")
+    parser.add_argument("--embedstats", action="store_true",
+                        help="Embed file/directory stats from the tree walk in batches sent to bots, minsize and mtime are checked before sending (bots don't stat again)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume a stopped crawl into the same index from it's last checkpoint, \
+                            see checkpoint settings in treewalk section in config")
+    parser.add_argument("--max-crawl-time", type=int, metavar='SECONDS', dest="maxcrawltime", default=0,
+                        help="Stop crawling at a checkpoint after this many seconds, continue with --resume (default: 0, no limit)")
+    parser.add_argument("--local", type=int, metavar='N', default=0,
+                        help="Crawl and calculate dir sizes in N local processes instead of worker bots, \
+                            doesn't use Redis (default: 0, use worker bots)")
     parser.add_argument("--replacepath", nargs=2, metavar="PATH",
                         help="Replace path, example: --replacepath Z:\\ /mnt/share/")
     parser.add_argument("--crawlbot", action="store_true",
@@ -1278,6 +1475,8 @@ def parse_cli_args(indexname):
         args.index = args.index.lower()
     if args.index2:
         args.index2 = args.index2.lower()
+    if args.priorindex:
+        args.priorindex = args.priorindex.lower()
     return args
 
 
@@ -1367,9 +1566,10 @@ def calc_dir_sizes(cliargs, logger, path=None):
 
     try:
         # wait for worker bots to be idle and all queues are empty
-        logger.info('Waiting for diskover worker bots to be done with any jobs in rq...')
-        while worker_bots_busy([q, q_crawl, q_calc]):
-            time.sleep(1)
+        if not cliargs['local']:
+            logger.info('Waiting for diskover worker bots to be done with any jobs in rq...')
+            while worker_bots_busy([q, q_crawl, q_calc]):
+                time.sleep(1)
 
         if cliargs['adaptivebatch']:
             batchsize = ab_start
@@ -1399,6 +1599,12 @@ def calc_dir_sizes(cliargs, logger, path=None):
 
         dirlist = []
         dircount = 0
+        if cliargs['local']:
+            tracker = enqueuer = queue = local_jobs(cliargs)
+        else:
+            tracker = job_tracker(cliargs, 'dircalc')
+            enqueuer = bulk_enqueuer(q_calc, tracker)
+            queue = q_crawl
         while res['hits']['hits'] and len(res['hits']['hits']) > 0:
             for hit in res['hits']['hits']:
                 fullpath = os.path.join(hit['_source']['path_parent'], hit['_source']['filename'])
@@ -1413,20 +1619,21 @@ def calc_dir_sizes(cliargs, logger, path=None):
                 dircount += 1
                 dirlist_len = len(dirlist)
                 if dirlist_len >= batchsize:
-                    q_calc.enqueue(calc_dir_size, args=(dirlist, cliargs,), result_ttl=config['redis_ttl'])
+                    enqueuer.enqueue(calc_dir_size, args=(dirlist, cliargs,))
                     jobcount += 1
                     if cliargs['debug'] or cliargs['verbose']:
                         logger.info("enqueued batchsize: %s (batchsize: %s)" % (dirlist_len, batchsize))
                     del dirlist[:]
                     if cliargs['adaptivebatch']:
-                        batchsize = adaptive_batch(q_crawl, cliargs, batchsize)
+                        batchsize = adaptive_batch(queue, cliargs, batchsize)
                         if cliargs['debug'] or cliargs['verbose']:
                             logger.info("batchsize set to: %s" % batchsize)
 
             # update progress bar
             if bar:
                 try:
-                    bar.update(len(q_calc))
+                    counts = tracker.counts()
+                    bar.update(counts['enqueued'] - counts['finished'] - counts['failed'])
                 except (ZeroDivisionError, ValueError):
                     bar.update(0)
 
@@ -1436,30 +1643,17 @@ def calc_dir_sizes(cliargs, logger, path=None):
                             request_timeout=config['es_timeout'])
         
         # enqueue dir calc job for any remaining in dirlist
-        q_calc.enqueue(calc_dir_size, args=(dirlist, cliargs,), result_ttl=config['redis_ttl'])
+        enqueuer.enqueue(calc_dir_size, args=(dirlist, cliargs,))
+        enqueuer.flush()
         jobcount += 1
 
         logger.info('Found %s directory docs' % str(dircount))
         
-        # set up progress bar with time remaining
         if bar:
             bar.finish()
-            bar_max_val = len(q_calc)
-            bar = progressbar.ProgressBar(max_value=bar_max_val)
-            bar.start()
-
-        # update progress bar until all worker bots are idle and q_calc queue is empty
-        while worker_bots_busy([q_calc]):
-            if bar:
-                q_len = len(q_calc)
-                try:
-                    bar.update(bar_max_val - q_len)
-                except (ZeroDivisionError, ValueError):
-                    bar.update(0)
-            time.sleep(1)
 
-        if bar:
-            bar.finish()
+        # wait for bots to be done with dir calc jobs
+        wait_for_jobs(tracker, [] if cliargs['local'] else [q_calc], logger, showbar=bar is not None)
         
         elapsed = get_time(time.time() - starttime)
         logger.info('Finished calculating %s directory sizes in %s' % (dircount, elapsed))
@@ -1469,49 +1663,286 @@ def calc_dir_sizes(cliargs, logger, path=None):
         sys.exit(0)
 
 
-def scandirwalk_worker():
+def scandir_listdir(path):
+    """This is the scandir list directory function.
+    It is used by the tree walk threads to get the
+    sub directory and file names in path. File names are
+    sorted by inode (inodeorder in config) so bots stat
+    them in inode order.
+    """
     dirs = []
     nondirs = []
-    while True:
-        path = q_paths.get()
-        try:
-            q_paths_in_progress.put(path)
-            for entry in scandir(path):
-                if entry.is_dir(follow_symlinks=False):
-                    dirs.append(entry.name)
-                if not cliargs['dirsonly']:
-                    if entry.is_file(follow_symlinks=False):
-                        nondirs.append(entry.name)
-            q_paths_results.put((path, dirs[:], nondirs[:]))
-        except (OSError, IOError) as e:
-            logger.warning("OS/IO Exception caused by: %s" % e)
-            pass
-        except Exception as e:
-            logger.warning("Exception caused by: %s" % e)
-            pass
-        finally:
-            q_paths_in_progress.get()
-        del dirs[:]
-        del nondirs[:]
-        q_paths.task_done()
-
-
-def scandirwalk(path):
-    q_paths.put(path)
-    while True:
-        entry = q_paths_results.get()
-        root, dirs, nondirs = entry
-        # yield before recursion
-        yield root, dirs, nondirs
-        # recurse into subdirectories
-        for name in dirs:
-            new_path = os.path.join(root, name)
-            q_paths.put(new_path)
-        q_paths_results.task_done()
-        if q_paths_results.qsize() == 0 and q_paths.qsize() == 0:
-            time.sleep(.5)
-            if q_paths_results.qsize() == 0 and q_paths.qsize() == 0 and q_paths_in_progress.qsize() == 0:
-                break
+    for entry in scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            dirs.append(entry.name)
+        elif not cliargs['dirsonly'] and entry.is_file(follow_symlinks=False):
+            nondirs.append(entry)
+    if config['treewalk_inodeorder'] == "true":
+        nondirs.sort(key=lambda entry: entry.inode())
+    return path, dirs, [entry.name for entry in nondirs]
+
+
+def embed_file_stats(st, now):
+    """This is the embed file stats function.
+    It returns stats tuple sent to bots for file stat result st
+    or None if the file is smaller than minsize or outside of
+    mtime cli args. Times are ints like the lstat tuple bots use
+    without embeded stats.
+    """
+    stats = tuple(st[:10]) + (st.st_blocks,)
+    # Are we storing file size or on disk size
+    if cliargs['sizeondisk']:
+        size = st.st_blocks * cliargs['blocksize']
+    else:
+        size = st.st_size
+    # Skip files smaller than minsize cli flag
+    if size < cliargs['minsize']:
+        return None
+    # Convert time in days (mtime cli arg) to seconds
+    time_sec = cliargs['mtime'] * 86400
+    file_mtime_sec = now - stats[8]
+    if time_sec < 0:
+        # Only process files modified less than x days ago
+        if file_mtime_sec > (time_sec * -1):
+            return None
+    else:
+        # Only process files modified at least x days ago
+        if file_mtime_sec < time_sec:
+            return None
+    return stats
+
+
+def embed_dir_stats(path):
+    """This is the embed dir stats function.
+    It returns tuple of path and stats tuple sent to bots for
+    directory path.
+    """
+    return (path, tuple(os.lstat(path)[:10]))
+
+
+def scandir_listdir_stats(path):
+    """This is the scandir list directory with stats function.
+    It is used by the tree walk threads instead of scandir_listdir
+    when embedding stats (--embedstats). Returns root as a tuple of
+    path and directory stats and files as tuples of name and file
+    stats, files are filtered using minsize and mtime cli args.
+    Files are stat'd in inode order (inodeorder in config), files
+    removed before they are stat'd are skipped.
+    """
+    root = embed_dir_stats(path)
+    dirs = []
+    entries = []
+    nondirs = []
+    now = time.time()
+    for entry in scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            dirs.append(entry.name)
+        elif entry.is_file(follow_symlinks=False):
+            entries.append(entry)
+    if config['treewalk_inodeorder'] == "true":
+        entries.sort(key=lambda entry: entry.inode())
+    for entry in entries:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except (OSError, IOError):
+            continue
+        stats = embed_file_stats(st, now)
+        if stats:
+            nondirs.append((entry.name, stats))
+    return root, dirs, nondirs
+
+
+def getdents_listdir(path, splitfiles=0):
+    """This is the getdents list directory function.
+    It is used by the tree walk threads instead of scandir when
+    using --getdents, directory entries are read in large chunks
+    using getdents64 and d_type is used to check for dirs/files.
+    Files are sorted by d_ino (inodeorder in config). Directories
+    with more than splitfiles files get a DirFiles instead of a list
+    of files so their names aren't all kept in memory, they are read
+    again in chunks when the directory is split into batches.
+    """
+    if cliargs['embedstats']:
+        root = embed_dir_stats(path)
+    else:
+        root = path
+    dirs = []
+    nondirs = []
+    filecount = 0
+    for entries in getdents(path, config['treewalk_getdentsbufsize']):
+        for name, d_type, d_ino in entries:
+            # file system doesn't always fill in d_type, entry_type uses lstat then
+            try:
+                d_type = entry_type(path, name, d_type)
+            except (OSError, IOError):
+                continue
+            if d_type == DT_DIR:
+                dirs.append(name)
+            elif d_type == DT_REG and not cliargs['dirsonly']:
+                filecount += 1
+                if not splitfiles or filecount <= splitfiles:
+                    nondirs.append((d_ino, name))
+                elif nondirs:
+                    del nondirs[:]
+    if splitfiles and filecount > splitfiles:
+        return root, dirs, DirFiles(path, filecount, config['treewalk_getdentsbufsize'],
+                                    config['treewalk_inodeorder'] == "true")
+    if config['treewalk_inodeorder'] == "true":
+        nondirs.sort()
+    return root, dirs, getdents_files(path, [name for d_ino, name in nondirs])
+
+
+def getdents_files(path, names):
+    """Return files names in path, with their stats (name, stats)
+    when using --embedstats, files removed since the directory was
+    read are skipped."""
+    if not cliargs['embedstats']:
+        return names
+    now = time.time()
+    files = []
+    for name in names:
+        try:
+            st = os.lstat(os.path.join(path, name))
+        except (OSError, IOError):
+            continue
+        stats = embed_file_stats(st, now)
+        if stats:
+            files.append((name, stats))
+    return files
+
+
+def load_walk_priority(cliargs, logger):
+    """This is the load walk priority function.
+    It gets directory items or crawl_time (priorityfield in config)
+    from prev index down to prioritydepth and returns a priority
+    function for the tree walker, so the largest (or slowest) sub
+    trees are walked first. Dirs not in prev index use their parent
+    directory's priority.
+    """
+    if config['treewalk_priorityfield'] == 'crawl_time':
+        field = 1
+    else:
+        field = 0
+    try:
+        pathdict = index_get_docs(cliargs, logger, doctype='directory', index=cliargs['priorindex'],
+                                  maxdepth=config['treewalk_prioritydepth'] or None, priority=True)
+    except Exception as e:
+        logger.warning("Error getting walk order from %s, walking in default order: %s" % (cliargs['priorindex'], e))
+        return None
+    if not pathdict:
+        logger.warning("No directory docs found in %s, walking in default order" % cliargs['priorindex'])
+        return None
+    priority = dict((path, values[field]) for path, values in pathdict.items())
+    logger.info("Walking %s dirs in %s order from %s (--priorindex)"
+                % (len(priority), config['treewalk_priorityfield'], cliargs['priorindex']))
+    return priority.get
+
+
+def resume_crawl(cliargs, logger, reindex_dict):
+    """This is the resume crawl function.
+    It loads the crawl checkpoint, waits for bots to finish any
+    batches left in the queue by the stopped crawl and deletes
+    docs in the directories of batches bots did not finish, so
+    they can be crawled again (existing tags go in reindex_dict).
+    Returns pending dirs, dirs to crawl again and crawl time.
+    """
+    checkpoint = load_checkpoint(cliargs['index'], config, redis_conn)
+    logger.info('Resuming crawl checkpointed at %s (crawl time %s)'
+                % (checkpoint['indexing_date'], get_time(checkpoint['crawltime'])))
+    logger.info('Waiting for diskover worker bots to finish batches from stopped crawl...')
+    while worker_bots_busy([q_crawl]):
+        time.sleep(1)
+    # bots may still be sending docs of finished jobs (bulk buffer), jobs whose
+    # docs are never sent (bot died) are crawled again
+    starttime = time.time()
+    deferred = deferred_jobs(redis_conn, checkpoint.get('tracker'))
+    while deferred and time.time() - starttime < 600:
+        time.sleep(1)
+        deferred = deferred_jobs(redis_conn, checkpoint.get('tracker'))
+    redo = set(checkpoint['roots'])
+    for job_id in unfinished_jobs(list(checkpoint['jobs']), redis_conn, deferred):
+        redo.update(checkpoint['jobs'][job_id])
+    for path in redo:
+        if cliargs['replacepath']:
+            path = replace_path(path)
+        reindex_dict = index_delete_path(path, cliargs, logger, reindex_dict)
+    logger.info('Found %s pending dirs to walk and %s dirs to crawl again' % (len(checkpoint['pending']), len(redo)))
+    return checkpoint['pending'], redo, checkpoint['crawltime']
+
+
+def bulk_enqueuer(queue, tracker=None):
+    """This is the bulk enqueuer function.
+    It returns a BulkEnqueuer for queue using the enqueue flush
+    settings in config, jobs are counted by tracker if given.
+    """
+    return BulkEnqueuer(queue, config['redis_enqueueflushsize'], config['redis_enqueueflushinterval'],
+                        result_ttl=config['redis_ttl'], tracker=tracker)
+
+
+def job_tracker(cliargs, name):
+    """This is the job tracker function.
+    It returns a JobTracker for the jobs of crawl phase name.
+    """
+    return JobTracker(redis_conn, cliargs['index'] + '_' + name, config['redis_settingsttl'])
+
+
+def wait_for_jobs(tracker, queues, logger, showbar=False):
+    """This is the wait for jobs function.
+    It waits for bots to be done with all the jobs counted by
+    tracker, showing a progress bar of done jobs (updated every
+    2 sec) if showbar. Stops waiting if the counters stop changing
+    and worker_bots_busy(queues) is False. Returns the counters and
+    the bots' crawl stats totals of the jobs (STATS_FIELDS).
+    """
+    counts = tracker.counts()
+    if showbar and not tracker.done(counts):
+        startdone = counts['finished'] + counts['failed']
+        bar = progressbar.ProgressBar(max_value=counts['enqueued'] - startdone)
+        bar.start()
+
+        def update_bar(counts):
+            try:
+                bar.update(counts['finished'] + counts['failed'] - startdone)
+            except (ZeroDivisionError, ValueError):
+                bar.update(0)
+    else:
+        bar = None
+        update_bar = None
+    counts = tracker.wait(callback=update_bar, interval=2, idlecheck=lambda: worker_bots_busy(queues),
+                          logger=logger)
+    if bar:
+        update_bar(counts)
+        bar.finish()
+    counts.update(tracker.stats())
+    tracker.delete()
+    if counts['failed'] > 0:
+        logger.warning('%s of %s jobs failed, see %s' % (counts['failed'], counts['enqueued'],
+                       'rq failed queue' if queues else 'errors above'))
+    return counts
+
+
+def local_jobs(cliargs):
+    """This is the local jobs function.
+    It returns a LocalJobs for a crawl phase using --local processes,
+    the pool is started the first time.
+    """
+    global local_pool
+    if local_pool is None:
+        local_pool = LocalPool(cliargs['local'])
+    return local_pool.jobs()
+
+
+def crawl_job_args(batch, cliargs, reindex_dict):
+    """This is the crawl job args function.
+    It returns the args for a scrape_tree_meta crawl job, the batch
+    is compact encoded and cliargs is replaced with the ref to the
+    crawl settings record in Redis so it's only stored once.
+    Local jobs (--local) get the batch and cliargs as is.
+    """
+    if cliargs['local']:
+        return (batch, cliargs, reindex_dict)
+    return (encode_batch(batch, config['redis_payloadcompression']),
+            settings_ref(cliargs, redis_conn, config['redis_settingsttl']), reindex_dict)
 
 
 def treewalk(top, num_sep, level, batchsize, cliargs, logger, reindex_dict):
@@ -1527,11 +1958,122 @@ def treewalk(top, num_sep, level, batchsize, cliargs, logger, reindex_dict):
     totalfiles = 0
     starttime = time.time()
 
-    # set up threads for tree walk
-    for i in range(cliargs['walkthreads']):
-        t = Thread(target=scandirwalk_worker)
-        t.daemon = True
-        t.start()
+    # split directories with more files than this across batches, not when using
+    # index2 since bots copy all of a directory's files from index2 when times are same
+    if cliargs['index2']:
+        splitfiles = 0
+    else:
+        splitfiles = config['treewalk_splitfiles']
+
+    def file_chunks(path, files, size):
+        # yield lists of up to size files of directory path
+        if isinstance(files, DirFiles):
+            for names in files.chunks(size):
+                yield getdents_files(path, names)
+        else:
+            for i in range(0, len(files), size):
+                yield files[i:i + size]
+
+    def embed_paths(root, files):
+        # bots get full paths with embeded stats
+        if cliargs['embedstats']:
+            return [(os.path.join(root, name), stats) for name, stats in files]
+        return files
+
+    def descend(root):
+        # same checks as below, called by walk threads (and processes) when they list root
+        if cliargs['embedstats']:
+            root = root[0]
+        # dirs from unfinished batches when resuming are crawled again without descending
+        if root in redo:
+            return False
+        if cliargs['replacepath']:
+            root = replace_path(root)
+        if dir_excluded(root, config, cliargs):
+            return False
+        if cliargs['maxdepth'] and num_sep + level <= root.count(os.path.sep):
+            return False
+        return True
+
+    if cliargs['getdents']:
+        listdir = lambda path: getdents_listdir(path, splitfiles)
+    elif cliargs['embedstats']:
+        listdir = scandir_listdir_stats
+    else:
+        listdir = scandir_listdir
+
+    # walk order from prev index
+    if cliargs['priorindex']:
+        priority = load_walk_priority(cliargs, logger)
+    else:
+        priority = None
+
+    # crawl checkpoints, pending dirs in walk processes can't be checkpointed
+    checkpoint = None
+    redo = set()
+    crawltime = 0
+    if config['treewalk_checkpointinterval'] > 0 or cliargs['maxcrawltime'] or cliargs['resume']:
+        if cliargs['walkprocs'] > 1:
+            logger.warning("Crawl checkpoints not supported using --walkprocs, not checkpointing")
+        elif cliargs['local']:
+            logger.warning("Crawl checkpoints not supported using --local, not checkpointing")
+        elif not cliargs['reindex'] and not cliargs['reindexrecurs'] and not cliargs['crawlbot']:
+            if cliargs['resume']:
+                top, redo, crawltime = resume_crawl(cliargs, logger, reindex_dict)
+                pending = set(top)
+                redo = set(path for path in redo if path not in pending)
+                top += list(redo)
+            else:
+                delete_checkpoint(cliargs['index'], config, redis_conn)
+            checkpoint = CrawlCheckpoint(cliargs, config, redis_conn, logger, crawltime)
+            if config['treewalk_checkpointinterval'] > 0:
+                logger.info("Checkpointing crawl every %s sec" % config['treewalk_checkpointinterval'])
+            if cliargs['maxcrawltime']:
+                logger.info("Stopping crawl at a checkpoint after %s sec (--max-crawl-time)" % cliargs['maxcrawltime'])
+
+    # adaptive walk threads and iops limit
+    if (cliargs['adaptivewalk'] or cliargs['maxiops']) and cliargs['walkprocs'] <= 1:
+        if cliargs['adaptivewalk']:
+            minthreads = 1
+        else:
+            minthreads = cliargs['walkthreads']
+        controller = WalkController(minthreads, cliargs['walkthreads'], config['treewalk_targetlatency'] / 1000,
+                                    maxiops=cliargs['maxiops'], interval=config['treewalk_adaptiveinterval'],
+                                    logger=logger, verbose=cliargs['verbose'] or cliargs['debug'])
+        if cliargs['embedstats']:
+            cost = lambda result: 1 + len(result[2])
+        else:
+            cost = None
+        if cliargs['adaptivewalk']:
+            logger.info("Adapting walk threads (up to %s) to %s ms target latency (--adaptivewalk)"
+                        % (cliargs['walkthreads'], config['treewalk_targetlatency']))
+        if cliargs['maxiops']:
+            logger.info("Limiting tree walk to %s metadata ops/sec (--maxiops)" % cliargs['maxiops'])
+    else:
+        if cliargs['adaptivewalk'] or cliargs['maxiops']:
+            logger.warning("--adaptivewalk and --maxiops not supported using --walkprocs")
+        controller = None
+        cost = None
+
+    # set up work stealing threads (and processes) for tree walk
+    if cliargs['walkprocs'] > 1:
+        walker = ProcessTreeWalker(listdir, cliargs['walkprocs'],
+                                   max(1, cliargs['walkthreads'] // cliargs['walkprocs']), descend, logger,
+                                   priority)
+        logger.info("Walking tree using %s processes (--walkprocs)" % cliargs['walkprocs'])
+    else:
+        walker = TreeWalker(listdir, cliargs['walkthreads'], logger, priority, track=checkpoint is not None,
+                            controller=controller, cost=cost, descend=descend)
+    batchroots = []
+    stopped = False
+    if cliargs['local']:
+        tracker = enqueuer = queue = local_jobs(cliargs)
+    else:
+        tracker = job_tracker(cliargs, 'crawl')
+        enqueuer = bulk_enqueuer(q_crawl, tracker)
+        queue = q_crawl
+    if checkpoint:
+        checkpoint.tracker = tracker
 
     # set up progress bar
     if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
@@ -1544,7 +2086,8 @@ def treewalk(top, num_sep, level, batchsize, cliargs, logger, reindex_dict):
         bar = None
 
     bartimestamp = time.time()
-    for root, dirs, files in scandirwalk(top):
+    walk = walker.walk(top)
+    for root, dirs, files in walk:
         dircount += 1
         totaldirs += 1
         files_len = len(files)
@@ -1554,38 +2097,77 @@ def treewalk(top, num_sep, level, batchsize, cliargs, logger, reindex_dict):
             if dirs_len == 0 and files_len == 0:
                 continue
         totalfiles += files_len
+        if cliargs['embedstats']:
+            root, rootstats = root
+        walkroot = root
         # replace path if cliarg
         if cliargs['replacepath']:
             root = replace_path(root)
         if not dir_excluded(root, config, cliargs):
+            # check if at maxdepth level
+            if cliargs['maxdepth']:
+                maxdepth_reached = num_sep + level <= root.count(os.path.sep)
+            else:
+                maxdepth_reached = False
+            if checkpoint:
+                batchroots.append(walkroot)
+            if isinstance(files, DirFiles) and maxdepth_reached:
+                # huge dir listed with --getdents which isn't split, read all it's files
+                files = [f for chunk in file_chunks(walkroot, files, splitfiles) for f in chunk]
+            if cliargs['embedstats']:
+                root_entry = (root, rootstats)
+            else:
+                root_entry = root
             if cliargs['dirsonly']:
-                batch.append((root, dirs))
+                batch.append((root_entry, dirs))
+            elif splitfiles and files_len > splitfiles and not maxdepth_reached:
+                # split oversized directory's files into sub batches which get sent to other bots,
+                # the batch with the first files also gets the directory, files of huge dirs listed
+                # with --getdents are read again chunk by chunk (DirFiles)
+                chunks = file_chunks(walkroot, files, splitfiles)
+                nchunks = int(math.ceil(float(files_len) / splitfiles))
+                batch.append((root_entry, dirs, embed_paths(root, next(chunks, [])), nchunks))
+                for chunk in chunks:
+                    job = enqueuer.enqueue(scrape_tree_meta,
+                                           args=crawl_job_args([(root_entry, None, embed_paths(root, chunk))],
+                                                               cliargs, reindex_dict))
+                    if checkpoint:
+                        checkpoint.add_job(job.id, [walkroot])
+                totalfiles -= files_len - splitfiles
+                if cliargs['debug'] or cliargs['verbose']:
+                    logger.info("split %s files in %s into %s batches" % (files_len, root, nchunks))
             else:
-                batch.append((root, dirs, files))
+                files = embed_paths(root, files)
+                batch.append((root_entry, dirs, files))
             batch_len = len(batch)
             if batch_len >= batchsize or (cliargs['adaptivebatch'] and totalfiles >= config['adaptivebatch_maxfiles']):
-                q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,),
-                                      result_ttl=config['redis_ttl'])
+                job = enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
                 if cliargs['debug'] or cliargs['verbose']:
                     logger.info("enqueued batchsize: %s (batchsize: %s)" % (batch_len, batchsize))
                 del batch[:]
+                if checkpoint:
+                    checkpoint.add_job(job.id, batchroots)
+                    batchroots = []
+                    if checkpoint.due():
+                        # jobs need to be in Redis for checking if they are finished
+                        enqueuer.flush()
+                        checkpoint.save(walker.pending_paths(), walker.listed_paths())
                 totalfiles = 0
                 if cliargs['adaptivebatch']:
-                    batchsize = adaptive_batch(q_crawl, cliargs, batchsize)
+                    batchsize = adaptive_batch(queue, cliargs, batchsize)
                     if cliargs['debug'] or cliargs['verbose']:
                         logger.info("batchsize set to: %s" % batchsize)
 
-            # check if at maxdepth level and delete dirs/files lists to not
-            # descend further down the tree
-            if cliargs['maxdepth']:
-                num_sep_this = root.count(os.path.sep)
-                if num_sep + level <= num_sep_this:
-                    del dirs[:]
-                    del files[:]
+            # delete dirs/files lists, walk threads don't descend further down the tree (descend)
+            if maxdepth_reached:
+                del dirs[:]
+                del files[:]
 
         else:  # directory excluded
             del dirs[:]
-            del files[:]
+
+        # enqueue any buffered jobs if flush interval has gone by
+        enqueuer.tick()
 
         # update progress bar
         if bar:
@@ -1596,40 +2178,66 @@ def treewalk(top, num_sep, level, batchsize, cliargs, logger, reindex_dict):
                     widgets[4] = progressbar.FormatLabel(', ' + str(dirspersec) + ' dirs/sec) ')
                     bartimestamp = time.time()
                     dircount = 0
-                bar.update(len(q_crawl))
+                    counts = tracker.counts()
+                    bar.update(counts['enqueued'] - counts['finished'] - counts['failed'])
             except (ZeroDivisionError, ValueError):
                 bar.update(0)
 
+        # stop at a checkpoint when out of crawl time
+        if checkpoint and cliargs['maxcrawltime'] and time.time() - starttime >= cliargs['maxcrawltime']:
+            stopped = True
+            break
+
     # add any remaining in batch to queue
     if len(batch) > 0:
-        q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,), result_ttl=config['redis_ttl'])
+        job = enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
+        if checkpoint:
+            checkpoint.add_job(job.id, batchroots)
+    enqueuer.flush()
 
-    # set up progress bar with time remaining
-    if bar:
-        bar.finish()
-        bar_max_val = len(q_crawl)
-        bar = progressbar.ProgressBar(max_value=bar_max_val)
-        bar.start()
-
-    # update progress bar until bots are idle and queue is empty
-    while worker_bots_busy([q_crawl]):
-        if bar:
-            q_len = len(q_crawl)
-            try:
-                bar.update(bar_max_val - q_len)
-            except (ZeroDivisionError, ValueError):
-                bar.update(0)
-        time.sleep(1)
+    if stopped:
+        checkpoint.save(walker.pending_paths(), walker.listed_paths())
+        walk.close()
+        logger.info("Crawl time limit reached (--max-crawl-time), saved checkpoint")
 
     if bar:
         bar.finish()
 
+    # wait for bots to be done with crawl jobs
+    counts = wait_for_jobs(tracker, [] if cliargs['local'] else [q_crawl], logger, showbar=bar is not None)
+    # bots' dir/file docs, crawl and bulk time totals for crawlstat docs
+    crawl_stats.update(('bot_' + field, int(counts[field]) if field.endswith('_count') else round(counts[field], 6))
+                       for field in STATS_FIELDS)
+
     elapsed = time.time() - starttime
     dirspersec = round(totaldirs / elapsed, 3)
     elapsed = get_time(elapsed)
 
     logger.info("Finished crawling in %s, dirs walked %s (%s dirs/sec)" %
                 (elapsed, totaldirs, dirspersec))
+    logger.info("Tree walk listed %s dirs (%s dirs/sec) using %s threads, %s work steals" %
+                (walker.dircount, walker.dirs_per_sec(), walker.threads, walker.steals))
+    logger.info("Bots indexed %s dirs and %s files, crawl time %s sec, bulk time %s sec" %
+                (crawl_stats['bot_dir_count'], crawl_stats['bot_file_count'],
+                 crawl_stats['bot_crawl_time'], crawl_stats['bot_bulk_time']))
+    if controller:
+        crawl_stats.update(controller.stats())
+        logger.info("Adaptive walk ended with %s active threads, latency %s ms, %s iops, "
+                    "%s increases, %s decreases, throttled %s sec" %
+                    (crawl_stats['walk_threads'], round(crawl_stats['walk_latency'] * 1000, 3),
+                     crawl_stats['walk_iops'], crawl_stats['walk_increases'],
+                     crawl_stats['walk_decreases'], crawl_stats['walk_throttle_time']))
+
+    if stopped:
+        # save checkpoint again now bots are done so there are only failed batches in it
+        checkpoint.save(walker.pending_paths(), walker.listed_paths())
+        add_crawl_stats(es, cliargs['index'], rootdir_path, checkpoint.elapsed(), "checkpointed", crawl_stats)
+        tune_es_for_crawl(defaults=True)
+        logger.info("Stopped crawl at checkpoint, crawl time %s, run with --resume to continue. Sayonara!"
+                    % get_time(checkpoint.elapsed()))
+        sys.exit(0)
+    elif checkpoint:
+        delete_checkpoint(cliargs['index'], config, redis_conn)
 
 
 def crawl_tree(path, cliargs, logger, reindex_dict):
@@ -1638,8 +2246,11 @@ def crawl_tree(path, cliargs, logger, reindex_dict):
     """
 
     try:
-        wait_for_worker_bots(logger)
-        logger.info('Enqueueing crawl to diskover worker bots for %s...', path)
+        if cliargs['local']:
+            logger.info('Crawling %s using %s local processes (--local)...', path, cliargs['local'])
+        else:
+            wait_for_worker_bots(logger)
+            logger.info('Enqueueing crawl to diskover worker bots for %s...', path)
 
         if cliargs['autotag']:
             logger.info("Worker bots set to auto-tag (-A)")
@@ -1650,6 +2261,21 @@ def crawl_tree(path, cliargs, logger, reindex_dict):
         if cliargs['costpergb']:
             logger.info("Storing cost per GB (-G)")
 
+        if cliargs['getdents']:
+            if getdents_supported():
+                logger.info("Reading directories using getdents64 with %s byte buffer (--getdents)"
+                            % config['treewalk_getdentsbufsize'])
+            else:
+                logger.warning("getdents64 not supported on this system, using scandir")
+                cliargs['getdents'] = False
+
+        if cliargs['embedstats']:
+            if cliargs['dirsonly']:
+                logger.warning("Can't embed stats using --dirsonly, worker bots will stat files")
+                cliargs['embedstats'] = False
+            else:
+                logger.info("Embedding file/directory stats in batches sent to worker bots (--embedstats)")
+
         if cliargs['adaptivebatch']:
             batchsize = ab_start
             cliargs['batchsize'] = batchsize
@@ -1687,7 +2313,7 @@ def crawl_tree(path, cliargs, logger, reindex_dict):
         # qumulo api crawl
         if cliargs['qumulo']:
             from diskover_qumulo import qumulo_treewalk
-            qumulo_treewalk(path, q_crawl, num_sep, level, batchsize, cliargs, logger, reindex_dict)
+            qumulo_treewalk(path, qumulo_ip, qumulo_ses, q_crawl, num_sep, level, batchsize, cliargs, logger, reindex_dict)
         # regular crawl using scandir
         else:
             treewalk(path, num_sep, level, batchsize, cliargs, logger, reindex_dict)
@@ -1709,6 +2335,8 @@ def hotdirs():
     # look in index for all directory docs and add to queue
     dirlist = index_get_docs(cliargs, logger, doctype='directory', hotdirs=True, index=cliargs['index'])
     dirbatch = []
+    tracker = job_tracker(cliargs, 'hotdirs')
+    enqueuer = bulk_enqueuer(q, tracker)
     if cliargs['adaptivebatch']:
         batchsize = ab_start
     else:
@@ -1718,32 +2346,42 @@ def hotdirs():
     for d in dirlist:
         dirbatch.append(d)
         if len(dirbatch) >= batchsize:
-            q.enqueue(calc_hot_dirs, args=(dirbatch, cliargs,), result_ttl=config['redis_ttl'])
+            enqueuer.enqueue(calc_hot_dirs, args=(dirbatch, cliargs,))
             del dirbatch[:]
             if cliargs['adaptivebatch']:
                 batchsize = adaptive_batch(q, cliargs, batchsize)
 
     # add any remaining in batch to queue
-    q.enqueue(calc_hot_dirs, args=(dirbatch, cliargs,), result_ttl=config['redis_ttl'])
+    enqueuer.enqueue(calc_hot_dirs, args=(dirbatch, cliargs,))
+    enqueuer.flush()
 
-    if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
-        bar = progress_bar('Checking')
-        bar.start()
-    else:
-        bar = None
+    # wait for bots to be done with hot dirs jobs
+    wait_for_jobs(tracker, [q], logger,
+                  showbar=not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose'])
 
-    # update progress bar until all bots are idle and q queue is empty
-    while worker_bots_busy([q]):
-        if bar:
-            q_len = len(q)
-            try:
-                bar.update(bar_max_val - q_len)
-            except (ZeroDivisionError, ValueError):
-                bar.update(0)
-        time.sleep(1)
 
-    if bar:
-        bar.finish()
+def get_queues(namespace=None):
+    """This is the get queues function.
+    It returns the rq queues (diskover, diskover_crawl, diskover_calcdir)
+    for namespace or the shared queues if namespace is None.
+    """
+    names = [config['redis_queue'], config['redis_queue_crawl'], config['redis_queue_calcdir']]
+    if namespace:
+        names = namespaced(names, namespace)
+    return [Queue(name, connection=redis_conn, default_timeout=config['redis_rq_timeout']) for name in names]
+
+
+def use_queue_namespace(namespace, register=True):
+    """This is the use queue namespace function.
+    It switches this module's queues to namespace's queues and
+    registers namespace for bots until the dispatcher exits if
+    register, only once for __main__ and the imported module.
+    """
+    global q, q_crawl, q_calc
+    q, q_crawl, q_calc = get_queues(namespace)
+    if register:
+        register_namespace(namespace, redis_conn)
+        atexit.register(unregister_namespace, namespace, redis_conn)
 
 
 def worker_bots_busy(queues):
@@ -1752,11 +2390,14 @@ def worker_bots_busy(queues):
     else returns False when bots are all idle and queues are empty.
     """
     workers_busy = False
-    workers = SimpleWorker.all(connection=redis_conn)
-    for worker in workers:
-        if worker._state == "busy":
-            workers_busy = True
-            break
+    # bots work on other crawls' queues when using queue namespaces, only
+    # this crawl's queues and running jobs are checked
+    if config['redis_queuenamespaces'] != "true":
+        workers = SimpleWorker.all(connection=redis_conn)
+        for worker in workers:
+            if worker._state == "busy":
+                workers_busy = True
+                break
     q_len = 0
     running_jobs = 0
     for qname in queues:
@@ -1834,7 +2475,7 @@ def post_crawl_tasks():
     """
 
     # add elapsed time crawl stat to es
-    add_crawl_stats(es, cliargs['index'], rootdir_path, (time.time() - starttime), "finished_crawl")
+    add_crawl_stats(es, cliargs['index'], rootdir_path, (time.time() - starttime), "finished_crawl", crawl_stats)
 
     # calculate directory sizes and items
     if cliargs['reindex'] or cliargs['reindexrecurs'] or cliargs['crawlbot']:
@@ -1852,6 +2493,12 @@ def post_crawl_tasks():
         while worker_bots_busy([q, q_crawl, q_calc]):
             time.sleep(1)
 
+    if cliargs['local']:
+        local_pool.close()
+    else:
+        # remove any reindex tags from Redis
+        delete_tags(reindex_dict, redis_conn)
+
     # set Elasticsearch index settings back to default
     tune_es_for_crawl(defaults=True)
 
@@ -1871,7 +2518,8 @@ def pre_crawl_tasks():
         logger.info('Using %s for metadata cache (-I)' % cliargs['index2'][0])
 
     # add disk space info to es index
-    if not cliargs['reindex'] and not cliargs['reindexrecurs'] and not cliargs['crawlbot']:
+    if not cliargs['reindex'] and not cliargs['reindexrecurs'] and not cliargs['crawlbot'] \
+            and not cliargs['resume']:
         if cliargs['qumulo']:
             from diskover_qumulo import qumulo_add_diskspace
             qumulo_add_diskspace(es, cliargs['index'], rootdir_path, qumulo_ip, qumulo_ses, logger)
@@ -1905,16 +2553,25 @@ from diskover_connections import redis_conn
 listen = [config['redis_queue'], config['redis_queue_crawl'], config['redis_queue_calcdir']]
 
 # set up Redis q
-q = Queue(listen[0], connection=redis_conn, default_timeout=config['redis_rq_timeout'])
-q_crawl = Queue(listen[1], connection=redis_conn, default_timeout=config['redis_rq_timeout'])
-q_calc = Queue(listen[2], connection=redis_conn, default_timeout=config['redis_rq_timeout'])
-
-# queue for paths
-q_paths = PyQueue()
-q_paths_results = PyQueue()
-q_paths_in_progress = PyQueue()
+q, q_crawl, q_calc = get_queues()
+
 lock = Lock()
 
+# tree walk stats added to crawl stats docs
+crawl_stats = {}
+
+# pool of local processes for --local
+local_pool = None
+
+# called with the secs each es bulk add took (set in bots started by diskover_bot_supervisor.py)
+bulk_timer = None
+
+# BulkIndexer used by index_bulk_add
+bulk_indexer = None
+
+# last time es health was checked before a bulk add (wait setting)
+last_health_check = 0
+
 
 if __name__ == "__main__":
     # parse cli arguments into cliargs dictionary
@@ -1935,6 +2592,13 @@ if __name__ == "__main__":
         list_plugins()
         sys.exit(0)
 
+    # use this crawl's own queues (and in diskover module imported by other modules)
+    if config['redis_queuenamespaces'] == "true" and not cliargs['listen'] and not cliargs['local']:
+        use_queue_namespace(cliargs['index'])
+        import diskover
+        diskover.use_queue_namespace(cliargs['index'], register=False)
+        logger.info("Using rq queues %s" % ', '.join(queue.name for queue in (q, q_crawl, q_calc)))
+
     # run just dir calcs if cli arg
     if cliargs['dircalcsonly']:
         calc_dir_sizes(cliargs, logger)
@@ -2004,12 +2668,14 @@ if __name__ == "__main__":
         logger.info('Copying tags from %s to %s', cliargs['copytags'], cliargs['index'])
         # look in index2 for all directory docs with tags and add to queue
         dirlist = index_get_docs(cliargs, logger, doctype='directory', copytags=True, index=cliargs['copytags'])
-        for path in dirlist:
-            q.enqueue(tag_copier, args=(path, cliargs,), result_ttl=config['redis_ttl'])
+        with bulk_enqueuer(q) as enqueuer:
+            for path in dirlist:
+                enqueuer.enqueue(tag_copier, args=(path, cliargs,))
         # look in index2 for all file docs with tags and add to queue
         filelist = index_get_docs(cliargs, logger, doctype='file', copytags=True, index=cliargs['copytags'])
-        for path in filelist:
-            q.enqueue(tag_copier, args=(path, cliargs,), result_ttl=config['redis_ttl'])
+        with bulk_enqueuer(q) as enqueuer:
+            for path in filelist:
+                enqueuer.enqueue(tag_copier, args=(path, cliargs,))
         if len(dirlist) == 0 and len(filelist) == 0:
             logger.info('No tags to copy')
         else:
@@ -2127,9 +2793,37 @@ if __name__ == "__main__":
     if cliargs['minsize'] == 0:
         logger.warning('You are indexing 0 Byte empty files (-s 0)')
 
+    # local processes don't have Redis for reindex tags, checkpoints, the crawl bot or dir times cache
+    if cliargs['local']:
+        if cliargs['reindex'] or cliargs['reindexrecurs'] or cliargs['crawlbot'] or cliargs['resume'] \
+                or cliargs['qumulo'] or cliargs['listentwc'] or cliargs['index2']:
+            logger.error("Can't use --local with -r, -R, --crawlbot, --resume, --qumulo, -L or -I, exiting")
+            sys.exit(1)
+        if config['redis_cachedirtimes'] == "true":
+            logger.error("Can't use --local with cachedirtimes = True in diskover.cfg, exiting")
+            sys.exit(1)
+
+    # check for checkpoint if resuming crawl
+    if cliargs['resume']:
+        if cliargs['reindex'] or cliargs['reindexrecurs'] or cliargs['crawlbot'] or cliargs['qumulo'] \
+                or cliargs['listentwc'] or cliargs['walkprocs'] > 1:
+            logger.error("Can't --resume using -r, -R, --crawlbot, --qumulo, -L or --walkprocs, exiting")
+            sys.exit(1)
+        checkpoint = load_checkpoint(cliargs['index'], config, redis_conn)
+        if checkpoint is None:
+            logger.error("No checkpoint found for index %s, exiting" % cliargs['index'])
+            sys.exit(1)
+        if checkpoint['rootdir'] != rootdir_path:
+            logger.error("Checkpoint for index %s is for rootdir %s, exiting" % (cliargs['index'], checkpoint['rootdir']))
+            sys.exit(1)
+
     # check if we are reindexing and remove existing docs in Elasticsearch
     # before crawling and reindexing
-    reindex_dict = {'file': [], 'directory': []}
+    reindex_dict = reindex_ref(cliargs['index'])
+    if not cliargs['resume'] and not cliargs['local']:
+        # remove any tags left over from a previous crawl (a resumed crawl
+        # still needs the tags from before it was checkpointed)
+        delete_tags(reindex_dict, redis_conn)
     if cliargs['reindex']:
         reindex_dict = index_delete_path(rootdir_path, cliargs, logger, reindex_dict)
     elif cliargs['reindexrecurs']:
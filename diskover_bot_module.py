@@ -11,19 +11,25 @@ diskover is released under the Apache 2.0 license. See
 LICENSE for the full license text.
 """
 
-from diskover import config, escape_chars, index_bulk_add, plugins, IS_PY3
+from diskover import config, escape_chars, index_bulk_add, get_bulk_indexer, plugins, IS_PY3
+from diskover_matchers import AutoTagger, CostMatcher
+from diskover_reindex import apply_tags
+from diskover_payload import decode_batch, load_settings
+from diskover_jobs import track_job, defer_job_done, add_job_stats
+from diskover_bulk import BulkBuffer, WorkerStats
 from datetime import datetime
 from scandir import scandir
 from threading import Thread
 from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import argparse
+import atexit
 import os
 import hashlib
 import socket
 import pwd
 import grp
 import time
-import re
 import base64
 import warnings
 
@@ -43,6 +49,20 @@ gids = []
 owners = {}
 groups = {}
 
+# thread pool for stat'ing files in parallel (statthreads setting)
+stat_pool = None
+
+# buffer for crawl docs across jobs (bulkbuffer setting)
+bulk_buffer = None
+
+# worker docs stats, sent with bulk adds every workerstatsinterval sec
+worker_stats = WorkerStats(config['es_workerstatsinterval'])
+
+# compiled auto tag and cost per gb rules
+autotagger = AutoTagger(config['autotag_files'], config['autotag_dirs'])
+costmatcher = CostMatcher(config['costpergb'], config['costpergb_base'], config['costpergb_paths'],
+                          config['costpergb_times'], config['costpergb_priority'])
+
 
 def parse_cliargs_bot():
     """This is the parse CLI arguments function.
@@ -70,224 +90,7 @@ def auto_tag(metadict, type, mtime, atime, ctime):
     and updates the meta dict for file or directory
     to include the new tags.
     """
-    extpass = True
-    namepass = True
-    pathpass = True
-    timepass = True
-
-    if type == 'file':
-        for pattern in config['autotag_files']:
-            try:
-                for name in pattern['name_exclude']:
-                    if name == metadict['filename']:
-                        return metadict
-
-                    if name.startswith('*') and name.endswith('*'):
-                        name = name.replace('*', '')
-                    elif name.startswith('*'):
-                        name = name + '$'
-                    elif name.endswith('*'):
-                        name = '^' + name
-
-                    if re.search(name, metadict['filename']):
-                        return metadict
-            except KeyError:
-                pass
-
-            try:
-                for path in pattern['path_exclude']:
-                    if path == metadict['path_parent']:
-                        return metadict
-
-                    if path.startswith('*') and path.endswith('*'):
-                        path = path.replace('*', '')
-                    elif path.startswith('*'):
-                        path = path + '$'
-                    elif path.endswith('*'):
-                        path = '^' + path
-
-                    if re.search(path, metadict['path_parent']):
-                        return metadict
-            except KeyError:
-                pass
-
-            try:
-                for ext in pattern['ext']:
-                    if ext == metadict['extension']:
-                        extpass = True
-                        break
-
-                    if ext.startswith('*') and ext.endswith('*'):
-                        ext = ext.replace('*', '')
-                    elif ext.startswith('*'):
-                        ext = ext + '$'
-                    elif ext.endswith('*'):
-                        ext = '^' + ext
-
-                    if re.search(ext, metadict['extension']):
-                        extpass = True
-                        break
-                    else:
-                        extpass = False
-            except KeyError:
-                pass
-
-            try:
-                for name in pattern['name']:
-                    if name == metadict['filename']:
-                        namepass = True
-                        break
-
-                    if name.startswith('*') and name.endswith('*'):
-                        name = name.replace('*', '')
-                    elif name.startswith('*'):
-                        name = name + '$'
-                    elif name.endswith('*'):
-                        name = '^' + name
-
-                    if re.search(name, metadict['filename']):
-                        namepass = True
-                        break
-                    else:
-                        namepass = False
-            except KeyError:
-                pass
-
-            try:
-                for path in pattern['path']:
-                    if path == metadict['path_parent']:
-                        pathpass = True
-                        break
-
-                    if path.startswith('*') and path.endswith('*'):
-                        path = path.replace('*', '')
-                    elif path.startswith('*'):
-                        path = path + '$'
-                    elif path.endswith('*'):
-                        path = '^' + path
-
-                    if re.search(path, metadict['path_parent']):
-                        pathpass = True
-                        break
-                    else:
-                        pathpass = False
-            except KeyError:
-                pass
-
-            timepass = time_check(pattern, mtime, atime, ctime)
-            if extpass and namepass and pathpass and timepass:
-                metadict['tag'] = pattern['tag']
-                metadict['tag_custom'] = pattern['tag_custom']
-                return metadict
-
-    elif type == 'directory':
-        for pattern in config['autotag_dirs']:
-            try:
-                for name in pattern['name_exclude']:
-                    if name == metadict['filename']:
-                        return metadict
-
-                    if name.startswith('*') and name.endswith('*'):
-                        name = name.replace('*', '')
-                    elif name.startswith('*'):
-                        name = name + '$'
-                    elif name.endswith('*'):
-                        name = '^' + name
-
-                    if re.search(name, metadict['filename']):
-                        return metadict
-            except KeyError:
-                pass
-
-            try:
-                for path in pattern['path_exclude']:
-                    if path == metadict['path_parent']:
-                        return metadict
-
-                    if path.startswith('*') and path.endswith('*'):
-                        path = path.replace('*', '')
-                    elif path.startswith('*'):
-                        path = path + '$'
-                    elif path.endswith('*'):
-                        path = '^' + path
-                    
-                    if re.search(path, metadict['path_parent']):
-                        return metadict
-            except KeyError:
-                pass
-
-            try:
-                for name in pattern['name']:
-                    if name == metadict['filename']:
-                        namepass = True
-                        break
-
-                    if name.startswith('*') and name.endswith('*'):
-                        name = name.replace('*', '')
-                    elif name.startswith('*'):
-                        name = name + '$'
-                    elif name.endswith('*'):
-                        name = '^' + name
-
-                    if re.search(name, metadict['filename']):
-                        namepass = True
-                        break
-                    else:
-                        namepass = False
-            except KeyError:
-                pass
-
-            try:
-                for path in pattern['path']:
-                    if path == metadict['path_parent']:
-                        pathpass = True
-                        break
-
-                    if path.startswith('*') and path.endswith('*'):
-                        path = path.replace('*', '')
-                    elif path.startswith('*'):
-                        path = path + '$'
-                    elif path.endswith('*'):
-                        path = '^' + path
-
-                    if re.search(path, metadict['path_parent']):
-                        pathpass = True
-                        break
-                    else:
-                        pathpass = False
-            except KeyError:
-                pass
-
-            timepass = time_check(pattern, mtime, atime, ctime)
-            if extpass and namepass and pathpass and timepass:
-                metadict['tag'] = pattern['tag']
-                metadict['tag_custom'] = pattern['tag_custom']
-                return metadict
-
-    return metadict
-
-
-def time_check(pattern, mtime, atime, ctime):
-    """This is the time check function.
-    It is used by the auto_tag and cost_per_gb
-    functions.
-    """
-    timepass = True
-
-    d = {'mtime': mtime, 'atime': atime, 'ctime': ctime}
-    for key, value in d.items():
-        try:
-            if pattern[key] > 0 and value:
-                # Convert time in days to seconds
-                time_sec = pattern[key] * 86400
-                file_time_sec = time.time() - value
-                if file_time_sec < time_sec:
-                    timepass = False
-                    break
-        except KeyError:
-            pass
-
-    return timepass
+    return autotagger.tag(metadict, type, mtime, atime, ctime)
 
 
 def cost_per_gb(metadict, fullpath, mtime, atime, ctime, doctype):
@@ -296,106 +99,11 @@ def cost_per_gb(metadict, fullpath, mtime, atime, ctime, doctype):
     and updates the meta dict for file or directory
     to include the cost per gb.
     """
-
-    # by default set the costpergb to be cost per gb value from config
-    costpergb = config['costpergb']
-    # determine if we are using base2 or base10 file sizes
-    base = config['costpergb_base']
-    if base == 10:
-        basen = 1000
-    else:
-        basen = 1024
-
     if doctype == 'file':
-        size_gb = metadict['filesize']/basen/basen/basen
-        metadict['costpergb'] = round(costpergb * size_gb, 2)
-    else:  # directory 
-        size_gb = metadict['doc']['filesize']/basen/basen/basen
-        metadict['doc']['costpergb'] = round(costpergb * size_gb, 2)
-
-    # if pattern lists are empty, return just cost per gb
-    if not config['costpergb_paths'] and not config['costpergb_times']:
-        return metadict
-
-    pathpass = False
-    timepass = False
-    costpergb_path = 0
-    costpergb_time = 0
-
-    filename = os.path.basename(fullpath)
-    parentdir = os.path.abspath(os.path.join(fullpath, os.pardir))
-
-    for pattern in config['costpergb_paths']:
-        if pathpass:
-            break
-        try:
-            for path in pattern['path_exclude']:
-                if path == parentdir or path == filename:
-                    return metadict
-
-                if path.startswith('*') and path.endswith('*'):
-                    path = path.replace('*', '')
-                elif path.startswith('*'):
-                    path = path + '$'
-                elif path.endswith('*'):
-                    path = '^' + path
-            
-                if re.search(path, parentdir) or re.search(path, filename):
-                    return metadict
-        except KeyError:
-            pass
-
-        try:
-            for path in pattern['path']:
-                if path == parentdir or path == filename:
-                    pathpass = True
-                    costpergb_path = pattern['costpergb']
-                    break
-                    
-                if path.startswith('*') and path.endswith('*'):
-                    path = path.replace('*', '')
-                elif path.startswith('*'):
-                    path = path + '$'
-                elif path.endswith('*'):
-                    path = '^' + path
-
-                if re.search(path, parentdir) or re.search(path, filename):
-                    pathpass = True
-                    costpergb_path = pattern['costpergb']
-                    break
-                else:
-                    pathpass = False
-        except KeyError:
-            pass
-
-    for pattern in config['costpergb_times']:
-        timepass = time_check(pattern, mtime, atime, ctime)
-        if timepass:
-            costpergb_time = pattern['costpergb']
-            break
-
-    if pathpass and timepass:
-        if config['costpergb_priority'] == 'path':
-            if doctype == 'file':
-                metadict['costpergb'] = round(costpergb_path * size_gb, 2)
-            else:
-                metadict['doc']['costpergb'] = round(costpergb_path * size_gb, 2)
-        else:
-            if doctype == 'file':
-                metadict['costpergb'] = round(costpergb_time * size_gb, 2)
-            else:
-                metadict['doc']['costpergb'] = round(costpergb_time * size_gb, 2)
-    elif pathpass:
-        if doctype == 'file':
-            metadict['costpergb'] = round(costpergb_path * size_gb, 2)
-        else:
-            metadict['doc']['costpergb'] = round(costpergb_path * size_gb, 2)
-    elif timepass:
-        if doctype == 'file':
-            metadict['costpergb'] = round(costpergb_time * size_gb, 2)
-        else:
-            metadict['doc']['costpergb'] = round(costpergb_time * size_gb, 2)
-
+        metadict['costpergb'] = costmatcher.costs([(fullpath, mtime, atime, ctime, metadict['filesize'])])[0]
+    else:  # directory
+        metadict['doc']['costpergb'] = costmatcher.costs([(fullpath, mtime, atime, ctime,
+                                                           metadict['doc']['filesize'])])[0]
     return metadict
 
 
@@ -555,12 +263,8 @@ def get_dir_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
         if cliargs['autotag'] and len(config['autotag_dirs']) > 0:
             dirmeta_dict = auto_tag(dirmeta_dict, 'directory', mtime, atime, ctime)
 
-        # search for and copy over any existing tags from reindex_dict
-        for sublist in reindex_dict['directory']:
-            if sublist[0] == dirpath:
-                dirmeta_dict['tag'] = sublist[1]
-                dirmeta_dict['tag_custom'] = sublist[2]
-                break
+        # copy over any existing tags from reindex tags hash in Redis
+        apply_tags(reindex_dict, 'directory', [dirmeta_dict], redis_conn)
 
     except (OSError, IOError) as e:
         warnings.warn("OS/IO Exception caused by: %s" % e)
@@ -577,11 +281,16 @@ def get_dir_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
     return dirmeta_dict
 
 
-def get_file_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
+def get_file_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False, costrecords=None,
+                  checkexcluded=True):
     """This is the get file meta data function.
     It scrapes file meta and ignores files smaller
     than minsize Bytes, newer than mtime
     and in excluded_files. Returns file meta dict.
+    If costrecords list is set, cost per gb is not added and
+    the file is added to costrecords to get cost for the batch.
+    excluded_files isn't checked if checkexcluded is False
+    (files already checked by stat_files).
     """
 
     try:
@@ -595,7 +304,7 @@ def get_file_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
         filename = os.path.basename(fullpath)
 
         # check if file is in exluded_files list
-        if file_excluded(filename):
+        if checkexcluded and file_excluded(filename):
             return None
         extension = os.path.splitext(filename)[1][1:].strip().lower()
 
@@ -685,14 +394,10 @@ def get_file_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
 
         # add cost per gb to filemeta_dict
         if cliargs['costpergb']:
-            filemeta_dict = cost_per_gb(filemeta_dict, fullpath, mtime, atime, ctime, 'file')
-
-        # search for and copy over any existing tags from reindex_dict
-        for sublist in reindex_dict['file']:
-            if sublist[0] == fullpath:
-                filemeta_dict['tag'] = sublist[1]
-                filemeta_dict['tag_custom'] = sublist[2]
-                break
+            if costrecords is None:
+                filemeta_dict = cost_per_gb(filemeta_dict, fullpath, mtime, atime, ctime, 'file')
+            else:
+                costrecords.append((filemeta_dict, (fullpath, mtime, atime, ctime, filemeta_dict['filesize'])))
 
     except (OSError, IOError) as e:
         warnings.warn("OS/IO Exception caused by: %s" % e)
@@ -704,6 +409,7 @@ def get_file_meta(worker_name, path, cliargs, reindex_dict, statsembeded=False):
     return filemeta_dict
 
 
+@track_job
 def calc_dir_size(dirlist, cliargs):
     """This is the calculate directory size worker function.
     It gets a directory list from the Queue search ES for all 
@@ -817,92 +523,302 @@ def calc_dir_size(dirlist, cliargs):
                     'items_files': totalitems_files,
                     'items_subdirs': totalitems_subdirs}
         }
-        # add total cost per gb to doc
-        if cliargs['costpergb']:
-            d = cost_per_gb(d, path[1], path[2], path[3], path[4], 'directory')
         doclist.append(d)
 
+    # add total cost per gb to docs
+    if cliargs['costpergb']:
+        costs = costmatcher.costs([(path[1], path[2], path[3], path[4], d['doc']['filesize'])
+                                   for path, d in zip(dirlist, doclist)])
+        for d, cost in zip(doclist, costs):
+            d['doc']['costpergb'] = cost
+
     index_bulk_add(es, doclist, config, cliargs)
 
 
 def es_bulk_add(worker_name, dirlist, filelist, cliargs, totalcrawltime=None):
+    """This is the es bulk add function.
+    It bulk adds crawl docs and the bot's worker docs if
+    workerstatsinterval has gone by (WorkerStats). Returns the
+    bulk time.
+    """
+    worker_stats.add(cliargs['index'], dir_count=len(dirlist), file_count=len(filelist),
+                     crawl_time=totalcrawltime or 0)
     starttime = time.time()
 
-    docs = dirlist + filelist
+    docs = dirlist + filelist + worker_stats.take(worker_name)
     index_bulk_add(es, docs, config, cliargs)
 
-    data = {"worker_name": worker_name, "dir_count": len(dirlist),
-            "file_count": len(filelist), "bulk_time": round(time.time() - starttime, 6),
-            "crawl_time": round(totalcrawltime, 6),
-            "indexing_date": datetime.utcnow().isoformat()}
-    es.index(index=cliargs['index'], doc_type='worker', body=data)
+    bulktime = time.time() - starttime
+    worker_stats.add(cliargs['index'], bulk_time=bulktime)
+    return bulktime
 
 
-def get_metadata(path, cliargs):
-    dir_source = ""
-    filename = escape_chars(os.path.basename(path))
-    parent_dir = escape_chars(os.path.abspath(os.path.join(path, os.pardir)))
-    fullpath = escape_chars(os.path.abspath(path))
+def send_worker_stats(worker_name):
+    """Index the bot's worker docs not sent with a bulk add yet."""
+    for doc in worker_stats.take(worker_name, force=True):
+        index = doc.pop('_index')
+        doc_type = doc.pop('_type')
+        es.index(index=index, doc_type=doc_type, body=doc)
 
-    data = {
-        "size": 1,
-        "query": {
-            "query_string": {
-                "query": "filename: " + filename + " AND path_parent: " + parent_dir
-            }
-        }
-    }
-    res = es.search(index=cliargs['index2'], doc_type='directory', body=data,
-                    request_timeout=config['es_timeout'])
+
+def get_bulk_buffer():
+    """This is the get bulk buffer function.
+    It returns the bot's BulkBuffer, it's started the first time
+    and docs left in it are sent when the bot exits.
+    """
+    global bulk_buffer
+    if bulk_buffer is None:
+        bulk_buffer = BulkBuffer(send_bulk_buffer, maxdocs=config['es_chunksize'],
+                                 maxbytes=config['es_bulkmaxbytes'],
+                                 flushinterval=config['es_bulkflushinterval'])
+    return bulk_buffer
+
+
+def send_bulk_buffer(cliargs, dirlist, filelist, crawltime):
+    """This is the send bulk buffer function.
+    It bulk adds docs from the bulk buffer, the buffer is sized for
+    a chunk for each bulk thread so chunks are sent in parallel.
+    """
+    es_bulk_add(worker, dirlist, filelist, cliargs, crawltime)
+    threads = get_bulk_indexer(es, config).threads
+    bulk_buffer.maxdocs = config['es_chunksize'] * threads
+    bulk_buffer.maxbytes = config['es_bulkmaxbytes'] * threads
+
+
+def close_bulk_buffer():
+    """Send any docs left in the bulk buffer and wait for them,
+    then the bot's worker docs, used when the bot exits."""
+    if bulk_buffer is not None:
+        bulk_buffer.close()
     try:
-        dir_source = res['hits']['hits'][0]['_source']
-    except IndexError:
-        pass
+        send_worker_stats(worker)
+    except Exception as e:
+        warnings.warn("Sending worker stats failed: %s" % e)
 
-    data = {
-        "query": {
-            "query_string": {
-                "query": "path_parent: " + fullpath
-            }
+
+atexit.register(close_bulk_buffer)
+
+
+def bulk_add(dirlist, filelist, cliargs, totalcrawltime, done=None):
+    """This is the bulk add function.
+    It adds crawl docs to the bot's bulk buffer, or bulk adds them
+    to es now if bulkbuffer setting is off.
+    """
+    add_job_stats(dir_count=len(dirlist), file_count=len(filelist), crawl_time=totalcrawltime)
+    if config['es_bulkbuffer'] == "true":
+        get_bulk_buffer().add(cliargs, dirlist, filelist, totalcrawltime, done)
+    elif len(dirlist) > 0 or len(filelist) > 0:
+        add_job_stats(bulk_time=es_bulk_add(worker, dirlist, filelist, cliargs, totalcrawltime))
+
+
+def get_dirs_metadata(paths, cliargs):
+    """This is the get dirs metadata function.
+    It gets the directory docs (sources) of paths from index2 with
+    one _msearch for every chunksize paths. Returns dict of path to
+    doc source, paths not in index2 are left out.
+    """
+    dirs_source = {}
+    chunksize = config['es_chunksize']
+    for i in range(0, len(paths), chunksize):
+        chunk = paths[i:i + chunksize]
+        body = []
+        for path in chunk:
+            fullpath = os.path.abspath(path)
+            body.append({})
+            body.append({
+                "size": 1,
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"term": {"filename": os.path.basename(fullpath)}},
+                            {"term": {"path_parent": os.path.dirname(fullpath)}}
+                        ]
+                    }
+                }
+            })
+        res = es.msearch(body=body, index=cliargs['index2'], doc_type='directory',
+                         request_timeout=config['es_timeout'])
+        for path, response in zip(chunk, res['responses']):
+            if 'error' in response:
+                warnings.warn("Getting %s from %s failed: %s" % (path, cliargs['index2'], response['error']))
+                continue
+            hits = response['hits']['hits']
+            if hits:
+                dirs_source[path] = hits[0]['_source']
+    return dirs_source
+
+
+def iter_files_metadata(paths, cliargs):
+    """This is the iter files metadata function.
+    It gets the file docs (sources) in paths from index2 with a terms
+    scroll on path_parent for every chunksize paths. Yields lists of
+    doc sources as scroll pages arrive.
+    """
+    chunksize = config['es_chunksize']
+    for i in range(0, len(paths), chunksize):
+        data = {
+            "query": {
+                "terms": {
+                    "path_parent": [os.path.abspath(path) for path in paths[i:i + chunksize]]
+                }
+            },
+            "sort": ["_doc"]
         }
-    }
-    files_source = []
-    res = es.search(index=cliargs['index2'], doc_type='file', scroll='1m',
-                    size=config['es_scrollsize'], body=data, request_timeout=config['es_timeout'])
-
-    while res['hits']['hits'] and len(res['hits']['hits']) > 0:
-        for hit in res['hits']['hits']:
-            files_source.append(hit['_source'])
-        # get es scroll id
-        scroll_id = res['_scroll_id']
-        # use es scroll api
-        res = es.scroll(scroll_id=scroll_id, scroll='1m',
-                        request_timeout=config['es_timeout'])
+        res = es.search(index=cliargs['index2'], doc_type='file', scroll='1m',
+                        size=config['es_scrollsize'], body=data, request_timeout=config['es_timeout'])
+
+        while res['hits']['hits'] and len(res['hits']['hits']) > 0:
+            yield [hit['_source'] for hit in res['hits']['hits']]
+            # get es scroll id
+            scroll_id = res['_scroll_id']
+            # use es scroll api
+            res = es.scroll(scroll_id=scroll_id, scroll='1m',
+                            request_timeout=config['es_timeout'])
+
+
+def reuse_metadata(sametimes, cliargs, tree_dirs, tree_files, totalcrawltime):
+    """This is the reuse metadata function.
+    It adds the directory and file docs of a batch's directories
+    whose times haven't changed (sametimes list of (path, crawl
+    time)) from index2 to tree_dirs and tree_files, fetched for all
+    the directories at once and bulk added every chunksize docs as
+    scroll pages arrive. Returns the crawl time not bulk added yet.
+    """
+    starttime = time.time()
+    paths = [path for path, elapsed in sametimes]
+    dirs_source = get_dirs_metadata(paths, cliargs)
+    datenow = datetime.utcnow().isoformat()
+    # msearch time is shared by the directories
+    fetchtime = (time.time() - starttime) / len(sametimes)
+    for path, elapsed in sametimes:
+        dir_source = dirs_source.get(path)
+        if dir_source:
+            dir_source['_type'] = 'directory'
+            # update indexed at time
+            dir_source['indexing_date'] = datenow
+            # update worker name
+            dir_source['worker_name'] = worker
+            # update crawl time
+            dir_source['crawl_time'] = round(elapsed + fetchtime, 6)
+            tree_dirs.append(dir_source)
+
+    for files_source in iter_files_metadata(paths, cliargs):
+        for file_source in files_source:
+            file_source['_type'] = 'file'
+            file_source['indexing_date'] = datenow
+            file_source['worker_name'] = worker
+        tree_files.extend(files_source)
+        if len(tree_dirs) + len(tree_files) >= config['es_chunksize']:
+            totalcrawltime += time.time() - starttime
+            bulk_add(tree_dirs, tree_files, cliargs, totalcrawltime)
+            del tree_dirs[:]
+            del tree_files[:]
+            totalcrawltime = 0
+            starttime = time.time()
+
+    return totalcrawltime + time.time() - starttime
 
-    return dir_source, files_source
+
+def lstat_file(fullpath):
+    """This is the lstat file function.
+    It's run by the stat pool threads and returns (fullpath, stats)
+    like stats embeded by the tree walk or the exception if lstat
+    failed.
+    """
+    try:
+        s = os.lstat(fullpath)
+    except (OSError, IOError) as e:
+        return e
+    return fullpath, tuple(s[:10]) + (s.st_blocks,)
 
 
+def stat_files(root_path, files):
+    """This is the stat files function.
+    It lstats files in directory root_path using the bot's stat pool
+    (statthreads threads) so stat calls on high latency filers (nfs)
+    overlap, results are returned in order as they are done.
+    Excluded files are left out before they are handed to the pool.
+    """
+    global stat_pool
+    if stat_pool is None:
+        stat_pool = ThreadPool(config['treewalk_statthreads'])
+    return stat_pool.imap(lstat_file, [os.path.join(root_path, file) for file in files if not file_excluded(file)],
+                          config['treewalk_statchunksize'])
+
+
+def scrape_files_meta(root_path, files, cliargs, reindex_dict, statsembeded=False, qumulo=False):
+    """This is the scrape files meta function.
+    It gets file meta for files in directory root_path
+    and returns a list of file meta dicts.
+    """
+    if qumulo:
+        from diskover_qumulo import qumulo_get_file_meta
+    files_meta = []
+    # files to get cost per gb for all at once
+    costrecords = [] if cliargs['costpergb'] else None
+    # stat files in stat pool threads while getting meta for the files already stat'd
+    checkexcluded = True
+    if not qumulo and not statsembeded and config['treewalk_statthreads'] > 1 and len(files) > 1:
+        statsembeded = True
+        checkexcluded = False
+        files = stat_files(root_path, files)
+    for file in files:
+        if isinstance(file, Exception):
+            warnings.warn("OS/IO Exception caused by: %s" % file)
+            continue
+        if qumulo:
+            fmeta = qumulo_get_file_meta(worker, file, cliargs, reindex_dict)
+        elif statsembeded:
+            fmeta = get_file_meta(worker, file, cliargs, reindex_dict, statsembeded=True,
+                                  costrecords=costrecords, checkexcluded=checkexcluded)
+        else:
+            fmeta = get_file_meta(worker, os.path.join(root_path, file), cliargs,
+                                  reindex_dict, statsembeded=False, costrecords=costrecords)
+        if fmeta:
+            files_meta.append(fmeta)
+    if costrecords:
+        for (fmeta, record), cost in zip(costrecords, costmatcher.costs([r[1] for r in costrecords])):
+            fmeta['costpergb'] = cost
+    # copy over any existing tags from reindex tags hash in Redis for all files at once
+    apply_tags(reindex_dict, 'file', files_meta, redis_conn)
+    return files_meta
+
+
+@track_job
 def scrape_tree_meta(paths, cliargs, reindex_dict):
     global worker
+    # compact encoded batch and crawl settings record ref from crawl_job_args
+    if not isinstance(paths, list):
+        paths = decode_batch(paths)
+    if not isinstance(cliargs, dict):
+        cliargs = load_settings(cliargs, redis_conn)
     tree_dirs = []
     tree_files = []
     if cliargs['qumulo']:
         qumulo = True
-        from diskover_qumulo import qumulo_get_dir_meta, qumulo_get_file_meta
+        from diskover_qumulo import qumulo_get_dir_meta
     else:
         qumulo = False
     totalcrawltime = 0
     statsembeded = False
+    # one time for auto tag time checks for the whole batch
+    if cliargs['autotag']:
+        autotagger.refresh_time()
+
+    # dirs with the same times as in index2
+    sametimes = []
 
     path_count = 0
     for path in paths:
         path_count += 1
         starttime = time.time()
         if not cliargs['dirsonly']:
-            root, dirs, files = path
+            root, dirs, files = path[:3]
         else:
             root, dirs = path
             files = []
+        # first batch of a directory which has been split up into multiple batches
+        splitdir = len(path) > 3
         if path_count == 1:
             if type(root) is tuple:
                 statsembeded = True
@@ -911,55 +827,51 @@ def scrape_tree_meta(paths, cliargs, reindex_dict):
                 root_path = root['path'].rstrip(os.path.sep)
             else:
                 root_path = root['path']
+        elif statsembeded:
+            root_path = root[0]
+        else:
+            root_path = root
+
+        # files only batch of a split directory, directory is in another batch
+        if dirs is None:
+            tree_files.extend(scrape_files_meta(root_path, files, cliargs, reindex_dict,
+                                                statsembeded=statsembeded, qumulo=qumulo))
+            totalcrawltime += time.time() - starttime
+            if len(tree_dirs) + len(tree_files) >= config['es_chunksize']:
+                bulk_add(tree_dirs, tree_files, cliargs, totalcrawltime)
+                del tree_dirs[:]
+                del tree_files[:]
+                totalcrawltime = 0
+            continue
+
+        if qumulo:
             dmeta = qumulo_get_dir_meta(worker, root, cliargs, reindex_dict, redis_conn)
         # check if stats embeded in data from diskover tree walk client
         elif statsembeded:
-            root_path = root[0]
             dmeta = get_dir_meta(worker, root, cliargs, reindex_dict, statsembeded=True)
         else:
-            root_path = root
             dmeta = get_dir_meta(worker, root_path, cliargs, reindex_dict, statsembeded=False)
 
         if dmeta == "sametimes":
-            # fetch meta data for directory and all it's files (doc sources) from index2 since
-            # directory times haven't changed
-            dir_source, files_source = get_metadata(root_path, cliargs)
-            datenow = datetime.utcnow().isoformat()
-            for file_source in files_source:
-                # update indexed at time
-                file_source['indexing_date'] = datenow
-                # update worker name
-                file_source['worker_name'] = worker
-                tree_files.append(('file', file_source))
-            if dir_source:
-                # update indexed at time
-                dir_source['indexing_date'] = datenow
-                # update worker name
-                dir_source['worker_name'] = worker
-                # update crawl time
-                elapsed = time.time() - starttime
-                dir_source['crawl_time'] = round(elapsed, 6)
-                tree_dirs.append(dir_source)
-                totalcrawltime += elapsed
+            # meta data for directory and all it's files (doc sources) is fetched from index2
+            # for all the batch's directories with unchanged times at once
+            elapsed = time.time() - starttime
+            sametimes.append((root_path, elapsed))
+            totalcrawltime += elapsed
         # get meta off disk since times different in Redis than on disk
         elif dmeta:
             # no files in batch, get them with scandir
             if cliargs['dirsonly']:
-                for entry in scandir(root):
-                    if entry.is_file(follow_symlinks=False) and not file_excluded(entry.name):
-                        files.append(entry.name)
-            filecount = 0
-            for file in files:
-                if qumulo:
-                    fmeta = qumulo_get_file_meta(worker, file, cliargs, reindex_dict)
-                elif statsembeded:
-                    fmeta = get_file_meta(worker, file, cliargs, reindex_dict, statsembeded=True)
-                else:
-                    fmeta = get_file_meta(worker, os.path.join(root_path, file), cliargs,
-                                         reindex_dict, statsembeded=False)
-                if fmeta:
-                    tree_files.append(fmeta)
-                    filecount += 1
+                entries = [entry for entry in scandir(root)
+                           if entry.is_file(follow_symlinks=False) and not file_excluded(entry.name)]
+                # stat files in inode order
+                if config['treewalk_inodeorder'] == "true":
+                    entries.sort(key=lambda entry: entry.inode())
+                files = [entry.name for entry in entries]
+            files_meta = scrape_files_meta(root_path, files, cliargs, reindex_dict,
+                                           statsembeded=statsembeded, qumulo=qumulo)
+            tree_files.extend(files_meta)
+            filecount = len(files_meta)
 
             # update crawl time=
             elapsed = time.time() - starttime
@@ -967,40 +879,41 @@ def scrape_tree_meta(paths, cliargs, reindex_dict):
             # check for empty dirs and dirsonly cli arg
             if cliargs['indexemptydirs']:
                 tree_dirs.append(dmeta)
-            elif not cliargs['indexemptydirs'] and (len(dirs) > 0 or filecount > 0):
+            elif not cliargs['indexemptydirs'] and (len(dirs) > 0 or filecount > 0 or splitdir):
                 tree_dirs.append(dmeta)
             totalcrawltime += elapsed
 
         # check if doc count is more than es chunksize and bulk add to es
         if len(tree_dirs) + len(tree_files) >= config['es_chunksize']:
-            es_bulk_add(worker, tree_dirs, tree_files, cliargs, totalcrawltime)
+            bulk_add(tree_dirs, tree_files, cliargs, totalcrawltime)
             del tree_dirs[:]
             del tree_files[:]
             totalcrawltime = 0
 
+    if sametimes:
+        totalcrawltime = reuse_metadata(sametimes, cliargs, tree_dirs, tree_files, totalcrawltime)
+
     # bulk add to es
-    if len(tree_dirs) > 0 or len(tree_files) > 0:
-        es_bulk_add(worker, tree_dirs, tree_files, cliargs, totalcrawltime)
+    if config['es_bulkbuffer'] == "true":
+        # job is counted done when it's docs have been sent by the bulk buffer,
+        # jobs which aren't tracked (--local) wait for them to be sent
+        done = defer_job_done()
+        bulk_add(tree_dirs, tree_files, cliargs, totalcrawltime, done=done)
+        if done is None:
+            starttime = time.time()
+            get_bulk_buffer().flush()
+            add_job_stats(bulk_time=time.time() - starttime)
+    else:
+        bulk_add(tree_dirs, tree_files, cliargs, totalcrawltime)
 
 
-def file_excluded(filename):
+def file_excluded(filename, extension=None):
     """Return True if path or ext in excluded_files set,
     False if not in the set"""
-    # return if filename in included list (whitelist)
-    if filename in config['included_files']:
-        return False
-    # check for filename in excluded_files set
-    if filename in config['excluded_files']:
-        return True
-    # check for extension in and . (dot) files in excluded_files
-    extension = os.path.splitext(filename)[1][1:].strip().lower()
-    if (not extension and 'NULLEXT' in config['excluded_files']) or \
-                            '*.' + extension in config['excluded_files'] or \
-            (filename.startswith('.') and u'.*' in config['excluded_files']):
-        return True
-    return False
+    return config['file_matcher'].excluded(filename, extension)
 
 
+@track_job
 def dupes_process_hashkey(hashkey, cliargs):
     """This is the duplicate file worker function.
     It processes hash keys in the dupes Queue.
@@ -1014,6 +927,7 @@ def dupes_process_hashkey(hashkey, cliargs):
         index_dupes(hashgroup, cliargs)
 
 
+@track_job
 def tag_copier(path, cliargs):
     """This is the tag copier worker function.
     It gets a path from the Queue and searches index for the
@@ -1071,6 +985,7 @@ def tag_copier(path, cliargs):
     index_bulk_add(es, doclist, config, cliargs)
 
 
+@track_job
 def calc_hot_dirs(dirlist, cliargs):
     """This is the calculate hotdirs worker function.
     It gets a directory list from the Queue, iterates over the path list
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from diskover import listen, version, config
+from diskover_namespaces import namespaced, get_namespaces
+from diskover_jobs import job_lost
+from diskover_worker_bot import new_worker
+from rq import Queue, SimpleWorker
+from rq.registry import StartedJobRegistry
+from multiprocessing import cpu_count
+from multiprocessing.sharedctypes import RawArray
+import argparse
+import logging
+import traceback
+import signal
+import errno
+import math
+import time
+import sys
+import os
+
+# import bot module in the supervisor so every bot forked from it
+# starts with config loaded, rules compiled and connections set up
+import diskover
+import diskover_bot_module
+from diskover_bot_module import redis_conn, get_worker_name
+
+# weight of the latest bulk add time in each bot's average
+BULK_LATENCY_WEIGHT = 0.2
+
+# bots which die this many sec after starting are crash looping,
+# their restarts are delayed
+MIN_BOT_UPTIME = 10
+
+
+def parse_cliargs_supervisor():
+    """This is the parse CLI arguments function.
+    It parses command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--minbots", type=int, default=config['botsupervisor_minbots'],
+                        help="Min number of worker bots (default from diskover.cfg)")
+    parser.add_argument("-N", "--maxbots", type=int, default=config['botsupervisor_maxbots'],
+                        help="Max number of worker bots, 0 is cpu cores x 2 (default from diskover.cfg)")
+    parser.add_argument("-b", "--burst", action="store_true",
+                        help="Burst mode (bots quit after all work is done, supervisor quits when all bots have)")
+    parser.add_argument("-l", "--loglevel", default="INFO",
+                        help="Set worker logging level to DEBUG, INFO, WARNING, ERROR (default is INFO)")
+    args = parser.parse_args()
+    return args
+
+
+class BotSupervisor(object):
+    """This is the bot supervisor class.
+    It forks worker bots from the supervisor process so they don't
+    each import diskover, load config and connect again. Every
+    scaleinterval sec the number of bots is scaled to the queued
+    and running jobs (jobsperbot jobs per bot, between minbots and
+    maxbots). Bots are removed when the average es bulk add time is
+    over maxbulklatency (es is the bottleneck) and not added when
+    the load average per cpu is over maxload. Bots which crash are
+    restarted, their job is moved to the rq failed queue.
+    """
+
+    def __init__(self, minbots, maxbots, logger, burst=False, loglevel="INFO",
+                 jobsperbot=10, scaleinterval=5.0, maxbulklatency=5.0, maxload=2.0):
+        self.maxbots = maxbots if maxbots > 0 else cpu_count() * 2
+        self.minbots = max(0, min(minbots, self.maxbots))
+        self.logger = logger
+        self.burst = burst
+        self.loglevel = loglevel
+        self.jobsperbot = max(1, jobsperbot)
+        self.scaleinterval = scaleinterval
+        self.maxbulklatency = maxbulklatency
+        self.maxload = maxload
+        # pid -> (slot, start time)
+        self.bots = {}
+        self.stopping = set()
+        # average bulk add time of the bot in each slot, shared with the bots
+        self.latency = RawArray('d', self.maxbots)
+        self.restarts = 0
+        self.restartdelay = 0
+        self.restartat = 0
+        self.running = True
+        self.signals = 0
+
+    def live_bots(self):
+        return len(self.bots) - len(self.stopping)
+
+    def free_slots(self):
+        # bots which are stopping keep their slot until they exit
+        return self.maxbots - len(self.bots)
+
+    def start_bot(self):
+        used = set(slot for slot, _ in self.bots.values())
+        free = set(range(self.maxbots)) - used
+        if not free:
+            return
+        slot = min(free)
+        self.latency[slot] = 0.0
+        pid = os.fork()
+        if pid == 0:
+            self.run_bot(slot)
+        self.bots[pid] = (slot, time.time())
+        self.logger.info('Started bot %s (pid %s), %s bots running', slot + 1, pid, self.live_bots())
+
+    def run_bot(self, slot):
+        # runs in the forked bot, never returns
+        code = 0
+        try:
+            # own process group so ctrl+c only goes to the supervisor which stops bots warm
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            latency = self.latency
+
+            def bulk_timer(secs):
+                if latency[slot] == 0.0:
+                    latency[slot] = secs
+                else:
+                    latency[slot] += BULK_LATENCY_WEIGHT * (secs - latency[slot])
+
+            diskover.bulk_timer = bulk_timer
+            # worker name for docs was set when the bot module was imported in the supervisor
+            diskover_bot_module.worker = get_worker_name()
+            w = new_worker(name=get_worker_name())
+            w.work(burst=self.burst, logging_level=self.loglevel)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                # os._exit doesn't run atexit
+                diskover_bot_module.close_bulk_buffer()
+            except Exception:
+                traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def stop_bot(self):
+        # warm shutdown of the newest bot, it finishes it's current job first
+        pids = [pid for pid in self.bots if pid not in self.stopping]
+        if not pids:
+            return
+        pid = max(pids, key=lambda pid: self.bots[pid][1])
+        self.stopping.add(pid)
+        os.kill(pid, signal.SIGTERM)
+        self.logger.info('Stopping bot %s (pid %s), %s bots running', self.bots[pid][0] + 1, pid,
+                         self.live_bots())
+
+    def bot_lost(self, pid):
+        # remove rq worker of crashed bot and move it's job to failed queue
+        name = '{0}.{1}'.format(get_worker_name().rpartition('.')[0], pid)
+        worker = SimpleWorker(listen, name=name, connection=redis_conn)
+        job = worker.get_current_job()
+        if job is not None:
+            StartedJobRegistry(job.origin, connection=redis_conn).remove(job)
+            worker.failed_queue.quarantine(job, exc_info='bot %s (pid %s) died running job' % (name, pid))
+            job_lost(job)
+            self.logger.warning('Moved job %s of bot pid %s to failed queue', job.id, pid)
+        worker.register_death()
+
+    def reap(self):
+        """Collect bots which exited, crashed bots are restarted."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    return
+                raise
+            if pid == 0:
+                return
+            if pid not in self.bots:
+                continue
+            slot, starttime = self.bots.pop(pid)
+            self.latency[slot] = 0.0
+            if pid in self.stopping:
+                self.stopping.discard(pid)
+                continue
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                # burst bot is done
+                continue
+            self.logger.warning('Bot %s (pid %s) died (status %s), restarting', slot + 1, pid, status)
+            try:
+                self.bot_lost(pid)
+            except Exception as e:
+                self.logger.warning('Error removing bot pid %s from rq: %s', pid, e)
+            self.restarts += 1
+            if time.time() - starttime < MIN_BOT_UPTIME:
+                self.restartdelay = min(60, max(1, self.restartdelay * 2))
+                self.logger.warning('Bot died %.1fs after starting, waiting %s sec before restart',
+                                    time.time() - starttime, self.restartdelay)
+            else:
+                self.restartdelay = 0
+            self.restartat = time.time() + self.restartdelay
+
+    def queued_jobs(self):
+        """Return number of queued and running jobs in all queues bots
+        listen on."""
+        names = list(listen)
+        if config['redis_queuenamespaces'] == "true":
+            for namespace in get_namespaces(redis_conn):
+                names.extend(namespaced(listen, namespace))
+        pipe = redis_conn.pipeline(transaction=False)
+        for name in names:
+            pipe.llen(Queue.redis_queue_namespace_prefix + name)
+            pipe.zcard(StartedJobRegistry.key_template.format(name))
+        return sum(pipe.execute())
+
+    def bulk_latency(self):
+        """Return average es bulk add time of bots in sec."""
+        times = [self.latency[slot] for slot, _ in self.bots.values() if self.latency[slot] > 0]
+        if not times:
+            return 0.0
+        return sum(times) / len(times)
+
+    def load(self):
+        """Return 1 min load average per cpu core."""
+        try:
+            return os.getloadavg()[0] / cpu_count()
+        except OSError:
+            return 0.0
+
+    def wanted_bots(self, jobs, latency, load):
+        """This is the wanted bots method.
+        It returns how many bots should be running for jobs queued
+        and running jobs, es bulk latency and load.
+        """
+        live = self.live_bots()
+        want = int(math.ceil(float(jobs) / self.jobsperbot))
+        want = max(self.minbots, min(self.maxbots, want))
+        if self.maxbulklatency > 0 and latency > self.maxbulklatency:
+            # es can't keep up, more bots would only make bulk adds slower
+            want = max(self.minbots, min(want, live - 1))
+        elif self.maxload > 0 and load > self.maxload:
+            want = min(want, max(self.minbots, live))
+        return want
+
+    def scale(self):
+        """Start or stop bots, bots are added all at once when
+        there's more jobs and removed one at a time."""
+        jobs = self.queued_jobs()
+        latency = self.bulk_latency()
+        load = self.load()
+        want = self.wanted_bots(jobs, latency, load)
+        live = self.live_bots()
+        if want == live or (want > live and ((self.burst and jobs == 0) or time.time() < self.restartat)):
+            return
+        self.logger.info('Scaling bots %s -> %s (jobs: %s, bulk latency: %.2fs, load: %.2f)',
+                         live, want, jobs, latency, load)
+        if want > live:
+            start = min(want - live, self.free_slots())
+            if start < want - live:
+                self.logger.info('%s bots are stopping, starting %s bots until they exit',
+                                 len(self.stopping), start)
+            for _ in range(start):
+                self.start_bot()
+        elif want < live:
+            self.stop_bot()
+
+    def handle_signal(self, signum, frame):
+        self.signals += 1
+        self.running = False
+        if self.signals > 1:
+            # second signal is a cold shutdown of the bots
+            self.logger.warning('Cold shut down of bots')
+            self.signal_bots()
+
+    def signal_bots(self):
+        for pid in list(self.bots):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            self.stopping.add(pid)
+
+    def run(self):
+        """This is the bot supervisor run method.
+        It starts minbots bots and supervises them until SIGINT or
+        SIGTERM (or all bots are done in burst mode), then stops
+        bots warm (second signal stops them cold).
+        """
+        signal.signal(signal.SIGINT, self.handle_signal)
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        for _ in range(max(1, self.minbots)):
+            self.start_bot()
+        lastscale = time.time()
+        while self.running:
+            self.reap()
+            if self.burst and not self.bots:
+                break
+            now = time.time()
+            if now - lastscale >= self.scaleinterval:
+                lastscale = now
+                try:
+                    self.scale()
+                except Exception as e:
+                    self.logger.warning('Error checking queues, not scaling: %s', e)
+            # replace crashed bots
+            if self.live_bots() < self.minbots and now >= self.restartat and not self.burst:
+                for _ in range(min(self.minbots - self.live_bots(), self.free_slots())):
+                    self.start_bot()
+            time.sleep(0.5)
+        self.logger.info('Stopping %s bots...', len(self.bots))
+        self.signal_bots()
+        while self.bots:
+            self.reap()
+            time.sleep(0.5)
+        self.logger.info('All bots stopped, %s bots restarted', self.restarts)
+
+
+if __name__ == "__main__":
+    # parse cli arguments into cliargs dictionary
+    cliargs_supervisor = vars(parse_cliargs_supervisor())
+
+    print("""\033[31m
+
+     ___  _ ____ _  _ ____ _  _ ____ ____     ;
+     |__> | ==== |-:_ [__]  \/  |=== |--<    ["]
+     ____ ____ ____ _  _ _    ___  ____ ___ /[_]\\
+     |___ |--< |--| |/\| |___ |==] [__]  |   ] [ v%s
+
+     Worker bot supervisor for diskover crawler
+     Scaling all your bots.
+
+    \033[0m""" % (version))
+
+    logging.basicConfig(format='%(asctime)s [%(levelname)s][%(name)s] %(message)s', level=logging.INFO)
+    logger = logging.getLogger('diskover_bot_supervisor')
+
+    supervisor = BotSupervisor(cliargs_supervisor['minbots'], cliargs_supervisor['maxbots'], logger,
+                               burst=cliargs_supervisor['burst'], loglevel=cliargs_supervisor['loglevel'],
+                               jobsperbot=config['botsupervisor_jobsperbot'],
+                               scaleinterval=config['botsupervisor_scaleinterval'],
+                               maxbulklatency=config['botsupervisor_maxbulklatency'],
+                               maxload=config['botsupervisor_maxload'])
+    supervisor.run()
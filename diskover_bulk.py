@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from diskover_connections import helpers, exceptions
+from collections import OrderedDict
+from datetime import datetime
+from threading import Thread, Lock
+from multiprocessing.pool import ThreadPool
+import warnings
+import json
+import time
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+# optional faster json serializers
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# only status and errors of bulk items are used, es leaves out the rest of the response
+BULK_FILTER_PATH = 'errors,items.*.status,items.*.error'
+
+
+# http status of bulk requests and items which are retried (es queues full)
+RETRY_STATUS = (429, 503)
+
+
+def retryable(e):
+    """Return True if bulk request exception e is es being busy or
+    unreachable (retry later) and not a bad request."""
+    return isinstance(e, exceptions.ConnectionError) or e.status_code in RETRY_STATUS
+
+
+def _encode(s):
+    # utf-8 bytes of json str, keeping surrogates of undecodable file names like stdlib json
+    if isinstance(s, bytes):
+        return s
+    try:
+        return s.encode('utf-8', 'surrogatepass')
+    except LookupError:
+        # python 2
+        return s.encode('utf-8')
+
+
+class BulkSerializer(object):
+    """This is the bulk serializer class.
+    It serializes bulk actions and docs to utf-8 json bytes for NDJSON
+    bulk bodies using orjson or ujson if they are installed (name
+    auto) or the one named, falling back to stdlib json if it isn't
+    installed or for docs it can't serialize. Docs which are already
+    json (str/bytes) are passed through.
+    """
+
+    def __init__(self, name='auto'):
+        if name == 'auto':
+            name = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+        elif (name == 'orjson' and orjson is None) or (name == 'ujson' and ujson is None):
+            warnings.warn("%s not installed, using json" % name)
+            name = 'json'
+        self.name = name
+        if name == 'orjson':
+            self._dumps = orjson.dumps
+        elif name == 'ujson':
+            self._dumps = lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        else:
+            self._dumps = self.json_dumps
+
+    @staticmethod
+    def json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    def dumps(self, obj):
+        """Return obj as utf-8 json bytes."""
+        if isinstance(obj, (bytes, type(u''))):
+            return _encode(obj)
+        try:
+            return _encode(self._dumps(obj))
+        except (TypeError, ValueError, OverflowError, UnicodeError):
+            # surrogates in file names or types orjson/ujson don't know
+            return _encode(self.json_dumps(obj))
+
+
+class BulkIndexer(object):
+    """This is the bulk indexer class.
+    It sends docs to es in bulk requests of up to chunksize docs and
+    maxchunkbytes bytes. Docs es rejects because it's busy (429) are
+    sent again with exponential backoff (initialbackoff sec doubling
+    up to maxbackoff) up to maxretries times, as are whole requests
+    which fail with 429/503 or a connection error, so a busy es slows
+    the crawl down instead of failing jobs. Chunks are sent by up to
+    maxthreads threads, the number of threads is adapted to bulk
+    latency (increased while under targetlatency, decreased when over
+    and halved when es rejects docs). Other doc errors are counted as
+    failed and don't raise. Bulk bodies are built as bytes with
+    serializer (BulkSerializer) and sent with filter_path so es only
+    returns item status and errors.
+    """
+
+    def __init__(self, es, chunksize=500, maxchunkbytes=10485760, maxretries=8, initialbackoff=1.0,
+                 maxbackoff=60.0, maxthreads=4, targetlatency=2.0, request_timeout=30, serializer=None):
+        self.es = es
+        self.serializer = serializer or BulkSerializer()
+        self.chunksize = max(1, chunksize)
+        self.maxchunkbytes = maxchunkbytes
+        self.maxretries = maxretries
+        self.initialbackoff = initialbackoff
+        self.maxbackoff = maxbackoff
+        self.maxthreads = max(1, maxthreads)
+        self.targetlatency = targetlatency
+        self.request_timeout = request_timeout
+        self.threads = 1
+        self.latency = None
+        self.lastadapt = 0
+        self.lock = Lock()
+        self.pool = None
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def chunks(self, docs):
+        """Yield chunks of docs as lists of (action, data) json lines."""
+        dumps = self.serializer.dumps
+        chunk = []
+        size = 0
+        for doc in docs:
+            action, data = helpers.expand_action(doc)
+            action = dumps(action)
+            if data is not None:
+                data = dumps(data)
+            docsize = len(action) + (len(data) + 1 if data is not None else 0) + 1
+            if chunk and (len(chunk) >= self.chunksize or size + docsize > self.maxchunkbytes):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append((action, data))
+            size += docsize
+        if chunk:
+            yield chunk
+
+    def adapt(self, latency=None, rejected=False):
+        """Adjust bulk threads for latency of a bulk request or es
+        rejecting docs, at most once a second (halving on reject
+        right away)."""
+        with self.lock:
+            now = time.time()
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency + 0.2 * (latency - self.latency)
+            if rejected:
+                self.rejected += 1
+                if now - self.lastadapt >= 1.0 and self.threads > 1:
+                    self.threads = max(1, self.threads // 2)
+                    self.lastadapt = now
+            elif now - self.lastadapt >= 1.0 and self.latency is not None:
+                if self.latency > self.targetlatency and self.threads > 1:
+                    self.threads -= 1
+                elif self.latency < self.targetlatency / 2.0 and self.threads < self.maxthreads:
+                    self.threads += 1
+                self.lastadapt = now
+
+    def send_chunk(self, chunk, index=None):
+        """This is the send chunk method.
+        It sends a chunk of docs in a bulk request, retrying rejected
+        docs with backoff. Returns (ok count, failed count, first
+        error). Raises the last exception if the request still fails
+        after maxretries.
+        """
+        ok = 0
+        failed = 0
+        error = None
+        for attempt in range(self.maxretries + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(min(self.maxbackoff, self.initialbackoff * 2 ** (attempt - 1)))
+            lines = []
+            for action, data in chunk:
+                lines.append(action)
+                if data is not None:
+                    lines.append(data)
+            lines.append(b'')
+            starttime = time.time()
+            try:
+                self.requests += 1
+                # bytes body sent with transport, es client's bulk only takes str
+                resp = self.es.transport.perform_request(
+                    'POST', '/' + index + '/_bulk' if index else '/_bulk', body=b'\n'.join(lines),
+                    params={'filter_path': BULK_FILTER_PATH, 'request_timeout': self.request_timeout})
+            except exceptions.TransportError as e:
+                if not retryable(e) or attempt == self.maxretries:
+                    raise
+                self.adapt(rejected=True)
+                continue
+            self.adapt(latency=time.time() - starttime)
+            if not resp.get('errors'):
+                ok += len(chunk)
+                break
+            retry = []
+            for entry, item in zip(chunk, resp['items']):
+                info = list(item.values())[0]
+                status = info.get('status', 500)
+                if 200 <= status < 300:
+                    ok += 1
+                elif status in RETRY_STATUS and attempt < self.maxretries:
+                    retry.append(entry)
+                else:
+                    failed += 1
+                    if error is None:
+                        error = info.get('error')
+            if not retry:
+                break
+            self.adapt(rejected=True)
+            chunk = retry
+        return ok, failed, error
+
+    def bulk(self, docs, index=None):
+        """This is the bulk method.
+        It sends docs (index is the default index) and returns (ok
+        count, failed count), a warning is shown for failed docs.
+        Chunks are sent by up to threads threads.
+        """
+        ok = 0
+        failed = 0
+        error = None
+        pending = []
+        for chunk in self.chunks(docs):
+            if self.maxthreads == 1:
+                results = [self.send_chunk(chunk, index)]
+            else:
+                if self.pool is None:
+                    self.pool = ThreadPool(self.maxthreads)
+                pending.append(self.pool.apply_async(self.send_chunk, (chunk, index)))
+                results = []
+                while len(pending) >= self.threads:
+                    results.append(pending.pop(0).get())
+            for chunkok, chunkfailed, chunkerror in results:
+                ok += chunkok
+                failed += chunkfailed
+                error = error or chunkerror
+        for result in pending:
+            chunkok, chunkfailed, chunkerror = result.get()
+            ok += chunkok
+            failed += chunkfailed
+            error = error or chunkerror
+        if failed:
+            warnings.warn("%s of %s docs failed to bulk add to %s: %s" % (failed, ok + failed, index, error))
+        return ok, failed
+
+
+class BulkBuffer(object):
+    """This is the bulk buffer class.
+    It buffers a bot's directory and file docs across rq jobs and a
+    sender thread sends them with send(cliargs, dirs, files, crawltime)
+    (one call per index) when maxdocs docs or about maxbytes bytes are
+    buffered or flushinterval sec after the first doc was added, so
+    bulk requests stay near chunksize and bots keep crawling while
+    docs are sent. done callbacks given with docs are called with ok
+    (True, or False if sending failed) and their share of the send
+    time after the docs are sent. When maxpending sends are waiting
+    add blocks so a slow es slows down the bot.
+    """
+
+    def __init__(self, send, maxdocs=500, maxbytes=10485760, flushinterval=1.0, maxpending=2):
+        self.send = send
+        self.maxdocs = max(1, maxdocs)
+        self.maxbytes = maxbytes
+        self.flushinterval = flushinterval
+        self.lock = Lock()
+        self.pending = Queue(max(1, maxpending))
+        self._reset()
+        self.sent = 0
+        self.sends = 0
+        # send time of docs sent without done callbacks, given to the next callbacks
+        self.sendtime = 0
+        self.thread = Thread(target=self._sender)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _reset(self):
+        # index -> [cliargs, dirs, files, crawltime]
+        self.batches = OrderedDict()
+        self.callbacks = []
+        self.docs = 0
+        self.bytes = 0
+        self.firstadd = None
+
+    def _take(self):
+        items = (self.batches, self.callbacks)
+        self._reset()
+        return items
+
+    def add(self, cliargs, dirs, files, crawltime=0, done=None):
+        """Add dirs and files docs (lists are copied) for index in
+        cliargs, done is called when they have been sent."""
+        with self.lock:
+            batch = self.batches.get(cliargs['index'])
+            if batch is None:
+                batch = self.batches[cliargs['index']] = [cliargs, [], [], 0]
+            batch[0] = cliargs
+            batch[1].extend(dirs)
+            batch[2].extend(files)
+            batch[3] += crawltime or 0
+            self.docs += len(dirs) + len(files)
+            if self.maxbytes > 0:
+                # repr is about the size of the json and a lot faster
+                self.bytes += sum(len(repr(doc)) for doc in dirs) + sum(len(repr(doc)) for doc in files)
+            if done is not None:
+                self.callbacks.append(done)
+            if self.firstadd is None:
+                self.firstadd = time.time()
+            if self.docs >= self.maxdocs or (self.maxbytes > 0 and self.bytes >= self.maxbytes):
+                items = self._take()
+            else:
+                items = None
+        if items is not None:
+            self.pending.put(items)
+
+    def flush(self, wait=True):
+        """Send buffered docs now, if wait block until all docs
+        added before have been sent."""
+        with self.lock:
+            items = self._take()
+        self.pending.put(items)
+        if wait:
+            self.pending.join()
+
+    def close(self):
+        """Send buffered docs and wait for them, used when the bot
+        exits."""
+        self.flush(wait=True)
+
+    def _sender(self):
+        while True:
+            try:
+                items = self.pending.get(timeout=self.flushinterval / 4.0)
+            except Empty:
+                with self.lock:
+                    if self.firstadd is None or time.time() - self.firstadd < self.flushinterval:
+                        continue
+                    items = self._take()
+                self._send(items)
+                continue
+            try:
+                self._send(items)
+            finally:
+                self.pending.task_done()
+
+    def _send(self, items):
+        batches, callbacks = items
+        ok = True
+        starttime = time.time()
+        for cliargs, dirs, files, crawltime in batches.values():
+            if not dirs and not files:
+                continue
+            try:
+                self.send(cliargs, dirs, files, crawltime)
+                self.sent += len(dirs) + len(files)
+                self.sends += 1
+            except Exception as e:
+                ok = False
+                warnings.warn("Bulk add of %s docs to %s failed: %s" % (len(dirs) + len(files), cliargs['index'], e))
+        self.sendtime += time.time() - starttime
+        if not callbacks:
+            return
+        sendtime = self.sendtime / len(callbacks)
+        self.sendtime = 0
+        for callback in callbacks:
+            try:
+                callback(ok, sendtime)
+            except Exception as e:
+                warnings.warn("Bulk buffer callback failed: %s" % e)
+
+
+class WorkerStats(object):
+    """This is the worker stats class.
+    It sums a bot's crawl stats (dir and file docs, crawl and bulk
+    time) per index in memory. take returns them as worker docs at
+    most every interval sec so they can be added to the bot's next
+    bulk request instead of indexing a worker doc after every bulk.
+    """
+
+    FIELDS = ('dir_count', 'file_count', 'crawl_time', 'bulk_time')
+
+    def __init__(self, interval=60.0):
+        self.interval = interval
+        self.lock = Lock()
+        self.stats = OrderedDict()
+        self.last = time.time()
+
+    def add(self, index, **stats):
+        """Add stats (FIELDS keyword args) for index."""
+        with self.lock:
+            totals = self.stats.get(index)
+            if totals is None:
+                totals = self.stats[index] = dict.fromkeys(self.FIELDS, 0)
+            for field, value in stats.items():
+                totals[field] += value
+
+    def take(self, worker_name, force=False):
+        """Return list of worker docs (one per index) of the stats
+        added since the last take if interval sec have gone by or
+        force, else an empty list."""
+        now = time.time()
+        with self.lock:
+            if not self.stats or (not force and now - self.last < self.interval):
+                return []
+            stats = self.stats
+            self.stats = OrderedDict()
+            self.last = now
+        datenow = datetime.utcnow().isoformat()
+        docs = []
+        for index, totals in stats.items():
+            docs.append({"_index": index, "_type": "worker", "worker_name": worker_name,
+                         "dir_count": totals['dir_count'], "file_count": totals['file_count'],
+                         "bulk_time": round(totals['bulk_time'], 6),
+                         "crawl_time": round(totals['crawl_time'], 6),
+                         "indexing_date": datenow})
+        return docs
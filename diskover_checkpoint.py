@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from rq.job import Job
+from datetime import datetime
+import json
+import time
+import os
+
+
+def checkpoint_key(index):
+    """Return the Redis key (or file name) for index's checkpoint."""
+    return 'diskover_checkpoint_' + index
+
+
+def _checkpoint_file(index, config):
+    return os.path.join(config['treewalk_checkpointpath'], checkpoint_key(index) + '.json')
+
+
+def save_checkpoint(data, config, redis_conn):
+    """This is the save checkpoint function.
+    It saves the checkpoint dict to a file in checkpointpath
+    (written to a temp file and renamed) or to Redis if
+    checkpointpath is not set.
+    """
+    s = json.dumps(data)
+    if config['treewalk_checkpointpath']:
+        checkpointfile = _checkpoint_file(data['index'], config)
+        tmpfile = checkpointfile + '.tmp'
+        with open(tmpfile, 'w') as f:
+            f.write(s)
+        os.rename(tmpfile, checkpointfile)
+    else:
+        redis_conn.set(checkpoint_key(data['index']), s)
+
+
+def load_checkpoint(index, config, redis_conn):
+    """This is the load checkpoint function.
+    It returns the checkpoint dict for index or None if there
+    is no checkpoint.
+    """
+    if config['treewalk_checkpointpath']:
+        try:
+            with open(_checkpoint_file(index, config), 'r') as f:
+                s = f.read()
+        except (OSError, IOError):
+            return None
+    else:
+        s = redis_conn.get(checkpoint_key(index))
+        if s is None:
+            return None
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+    return json.loads(s)
+
+
+def delete_checkpoint(index, config, redis_conn):
+    """This is the delete checkpoint function.
+    It removes index's checkpoint when the crawl is done.
+    """
+    if config['treewalk_checkpointpath']:
+        try:
+            os.remove(_checkpoint_file(index, config))
+        except (OSError, IOError):
+            pass
+    else:
+        redis_conn.delete(checkpoint_key(index))
+
+
+def unfinished_jobs(job_ids, redis_conn, deferred=()):
+    """This is the unfinished jobs function.
+    It gets the status of rq jobs in one Redis round trip and
+    returns the ids of jobs which are not finished. Jobs which
+    no longer exist finished and their result expired
+    (failed jobs are kept by rq). Jobs in deferred (finished in rq
+    but their docs not sent yet by the bot) are unfinished.
+    """
+    pipe = redis_conn.pipeline()
+    for job_id in job_ids:
+        pipe.hget(Job.key_for(job_id), 'status')
+    unfinished = []
+    for job_id, status in zip(job_ids, pipe.execute()):
+        if job_id in deferred:
+            unfinished.append(job_id)
+            continue
+        if status is None:
+            continue
+        if isinstance(status, bytes):
+            status = status.decode('utf-8')
+        if status != 'finished':
+            unfinished.append(job_id)
+    return unfinished
+
+
+class CrawlCheckpoint(object):
+    """This is the crawl checkpoint class.
+    It keeps track of the batches enqueued by the tree walk which
+    bots have not finished yet and periodically saves them together
+    with the tree walker's pending directories. Directories in
+    pending still need to be walked (recursive) and the roots of
+    unfinished batches and directories the walk listed (sub dirs
+    already pending) but didn't batch yet need to be crawled again
+    (non-recursive), everything else has been crawled by bots.
+    If tracker (JobTracker of the crawl jobs) is set, jobs stay
+    unfinished while they are deferred (bots' docs not sent yet)
+    and the tracker's key is saved for resuming.
+    """
+
+    def __init__(self, cliargs, config, redis_conn, logger, crawltime=0):
+        self.cliargs = cliargs
+        self.config = config
+        self.redis_conn = redis_conn
+        self.logger = logger
+        self.interval = config['treewalk_checkpointinterval']
+        self.crawltime = crawltime
+        self.starttime = time.time()
+        self.lastsave = self.starttime
+        self.jobs = {}
+        self.count = 0
+        self.tracker = None
+
+    def add_job(self, job_id, roots):
+        """Add an enqueued job and the directory roots in it's batch."""
+        self.jobs[job_id] = roots
+
+    def due(self):
+        """Return True if it's time for the next checkpoint."""
+        return self.interval > 0 and time.time() - self.lastsave >= self.interval
+
+    def elapsed(self):
+        """Return the crawl time including time before resuming."""
+        return self.crawltime + time.time() - self.starttime
+
+    def save(self, pending, extra_roots=None):
+        """This is the checkpoint save method.
+        It drops finished jobs and saves pending dirs and the roots
+        of unfinished batches (and extra_roots not enqueued yet, the
+        walker's listed dirs).
+        """
+        if self.tracker is not None:
+            deferred = self.tracker.deferred_jobs()
+        else:
+            deferred = set()
+        for job_id in set(self.jobs) - set(unfinished_jobs(list(self.jobs), self.redis_conn, deferred)):
+            del self.jobs[job_id]
+        data = {
+            'index': self.cliargs['index'],
+            'rootdir': self.cliargs['rootdir'],
+            'crawltime': round(self.elapsed(), 6),
+            'pending': list(pending),
+            'jobs': self.jobs,
+            'roots': list(extra_roots or []),
+            'tracker': self.tracker.key if self.tracker is not None else None,
+            'indexing_date': datetime.utcnow().isoformat()
+        }
+        save_checkpoint(data, self.config, self.redis_conn)
+        self.lastsave = time.time()
+        self.count += 1
+        if self.cliargs['debug'] or self.cliargs['verbose']:
+            self.logger.info("Saved checkpoint (pending dirs: %s, unfinished batches: %s)"
+                             % (len(data['pending']), len(self.jobs)))
+        return data
@@ -22,11 +22,57 @@ except ImportError:
         raise ImportError('elasticsearch module not installed')
 from redis import Redis, ConnectionPool
 from redis.connection import UnixDomainSocketConnection
+import inspect
+import zlib
 
 
 es_conn = None
 redis_conn = None
 
+# es connections for bulk requests (gzip compressed) for es connections
+bulk_conns = {}
+
+
+def gzip_body(body, level=1):
+    """Return body (str or bytes) gzip compressed."""
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class GzipHttpConnection(Urllib3HttpConnection):
+    """This is the gzip http connection class.
+    It's a urllib3 es connection which gzips request bodies, used for
+    bulk requests (which always have a body) when the es client can't
+    compress them itself (http_compress, elasticsearch-py 6.3+).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(GzipHttpConnection, self).__init__(*args, **kwargs)
+        self.headers['content-encoding'] = 'gzip'
+        self.headers['accept-encoding'] = 'gzip,deflate'
+
+    def perform_request(self, method, url, params=None, body=None, *args, **kwargs):
+        if body is not None:
+            body = gzip_body(body)
+        return super(GzipHttpConnection, self).perform_request(method, url, params, body, *args, **kwargs)
+
+
+def http_compress_supported(connection_class):
+    """Return True if connection_class can gzip request bodies itself."""
+    try:
+        args = inspect.getfullargspec(connection_class.__init__).args
+    except AttributeError:
+        args = inspect.getargspec(connection_class.__init__).args
+    return 'http_compress' in args
+
+
+def bulk_connection(es):
+    """Return the es connection to use for bulk requests for es
+    connection es, a compressed one if httpcompress is set."""
+    return bulk_conns.get(id(es), es)
+
 
 def connect_to_elasticsearch():
     from diskover import config
@@ -51,6 +97,28 @@ def connect_to_elasticsearch():
             timeout=config['es_timeout'], maxsize=config['es_maxsize'],
             max_retries=config['es_max_retries'], retry_on_timeout=True)
 
+    # gzip bulk request bodies, using es client's http_compress if it has it
+    if config['es_httpcompress'] == "true":
+        if config['aws'] == "true":
+            connection_class = RequestsHttpConnection
+            kwargs = {'use_ssl': True, 'verify_certs': True}
+        else:
+            connection_class = Urllib3HttpConnection
+            kwargs = {'http_auth': (config['es_user'], config['es_password'])}
+        if http_compress_supported(connection_class):
+            kwargs['http_compress'] = True
+        elif connection_class is Urllib3HttpConnection:
+            connection_class = GzipHttpConnection
+        else:
+            # requests connection of old es client can't compress
+            return
+        bulk_conns[id(es_conn)] = Elasticsearch(
+            hosts=config['es_host'],
+            port=config['es_port'],
+            connection_class=connection_class,
+            timeout=config['es_timeout'], maxsize=config['es_maxsize'],
+            max_retries=config['es_max_retries'], retry_on_timeout=True, **kwargs)
+
 
 def connect_to_redis():
     from diskover import config
@@ -11,13 +11,11 @@ diskover is released under the Apache 2.0 license. See
 LICENSE for the full license text.
 """
 
-from diskover import index_bulk_add, config, es, progress_bar, redis_conn
+from diskover import index_bulk_add, config, es, bulk_enqueuer, job_tracker, wait_for_jobs
 from diskover_bot_module import dupes_process_hashkey
-from rq import SimpleWorker
 import base64
 import hashlib
 import os
-import time
 try:
     from Queue import Queue as pyQueue
 except ImportError:
@@ -272,37 +270,13 @@ def dupes_finder(es, q, cliargs, logger):
     logger.info('Found %s duplicate file hashes, enqueueing...', len(res['aggregations']['dupe_filehash']['buckets']))
 
     # add hash keys to Queue
-    for bucket in res['aggregations']['dupe_filehash']['buckets']:
-        q.enqueue(dupes_process_hashkey, args=(bucket['key'], cliargs,), result_ttl=config['redis_ttl'])
+    tracker = job_tracker(cliargs, 'dupes')
+    with bulk_enqueuer(q, tracker) as enqueuer:
+        for bucket in res['aggregations']['dupe_filehash']['buckets']:
+            enqueuer.enqueue(dupes_process_hashkey, args=(bucket['key'], cliargs,))
 
     logger.info('All file hashes have been enqueued')
 
-    if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
-        bar = progress_bar('Checking')
-        bar.start()
-    else:
-        bar = None
-
-    # wait for queue to be empty and update progress bar
-    time.sleep(1)
-    while True:
-        workers_busy = False
-        workers = SimpleWorker.all(connection=redis_conn)
-        for worker in workers:
-            if worker._state == "busy":
-                workers_busy = True
-                break
-        q_len = len(q)
-        if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
-            try:
-                bar.update(q_len)
-            except ZeroDivisionError:
-                bar.update(0)
-            except ValueError:
-                bar.update(0)
-        if q_len == 0 and workers_busy == False:
-            break
-        time.sleep(.5)
-
-    if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
-        bar.finish()
+    # wait for bots to be done with dupes jobs
+    wait_for_jobs(tracker, [q], logger,
+                  showbar=not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose'])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from rq.job import JobStatus
+import time
+
+
+class BulkEnqueuer(object):
+    """This is the bulk enqueuer class.
+    It buffers rq jobs and enqueues them in one Redis pipeline
+    (MULTI/EXEC) when flushsize jobs are buffered or flushinterval
+    seconds have gone by since the last flush, instead of a Redis
+    round trip for every job. Job args are pickled when the job is
+    added so lists can be reused by the caller. Call flush before
+    waiting on the queue (or use it as a context manager). Jobs are
+    counted by tracker (JobTracker) if one is given.
+    """
+
+    def __init__(self, queue, flushsize=500, flushinterval=1.0, result_ttl=None, tracker=None):
+        self.queue = queue
+        self.tracker = tracker
+        self.flushsize = max(1, flushsize)
+        self.flushinterval = flushinterval
+        self.result_ttl = result_ttl
+        self.jobs = []
+        self.lastflush = time.time()
+        self.enqueued = 0
+        self.flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def enqueue(self, func, args=None, result_ttl=None, timeout=None):
+        """Add a job for func(*args) to the buffer and return the
+        job, it's id can be used before the job is flushed."""
+        if result_ttl is None:
+            result_ttl = self.result_ttl
+        job = self.queue.job_class.create(
+            func, args=args, connection=self.queue.connection,
+            result_ttl=result_ttl, status=JobStatus.QUEUED,
+            description=func.__name__, timeout=timeout or self.queue._default_timeout,
+            origin=self.queue.name, meta=self.tracker.meta() if self.tracker else None)
+        # pickle args now
+        job.data
+        self.jobs.append(job)
+        if len(self.jobs) >= self.flushsize or self.due():
+            self.flush()
+        return job
+
+    def due(self):
+        """Return True if there are buffered jobs older than flushinterval."""
+        return len(self.jobs) > 0 and time.time() - self.lastflush >= self.flushinterval
+
+    def tick(self):
+        """Flush if flushinterval has gone by, for callers which can go
+        a while without adding jobs."""
+        if self.due():
+            self.flush()
+
+    def flush(self):
+        """Enqueue all buffered jobs in one Redis pipeline."""
+        self.lastflush = time.time()
+        if not self.jobs:
+            return 0
+        pipe = self.queue.connection._pipeline()
+        for job in self.jobs:
+            self.queue.enqueue_job(job, pipeline=pipe)
+        if self.tracker:
+            self.tracker.add(len(self.jobs), pipeline=pipe)
+        pipe.execute()
+        count = len(self.jobs)
+        self.enqueued += count
+        self.flushes += 1
+        del self.jobs[:]
+        return count
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from rq import get_current_job
+from functools import wraps
+from threading import Lock
+import uuid
+import time
+
+# job meta key with the job counters key
+META_KEY = 'diskover_jobs'
+
+# deferred is the number of jobs whose docs bots are still sending (defer_job_done)
+FIELDS = ('enqueued', 'started', 'finished', 'failed', 'deferred')
+
+# deferred jobs have a field of this prefix and their job id in their tracker's hash
+DEFERRED_PREFIX = 'deferred_'
+
+# crawl stats jobs add to their tracker's hash (add_job_stats)
+STATS_FIELDS = ('dir_count', 'file_count', 'crawl_time', 'bulk_time')
+
+# counters state of the job the bot is running, for defer_job_done and add_job_stats
+_current = None
+_count_lock = Lock()
+
+
+def _done_channel(key):
+    return key + '_done'
+
+
+def _new_state(key, redis_conn, job_id=None):
+    return {'key': key, 'redis_conn': redis_conn, 'job_id': job_id, 'deferred': False, 'counted': False,
+            'stats': dict.fromkeys(STATS_FIELDS, 0)}
+
+
+def _count_done(state, ok, bulktime=0):
+    # count job as finished (or failed) once, add it's stats and signal the dispatcher
+    with _count_lock:
+        if state['counted']:
+            return
+        state['counted'] = True
+    state['stats']['bulk_time'] += bulktime
+    field = 'finished' if ok else 'failed'
+    pipe = state['redis_conn'].pipeline(transaction=False)
+    if state['deferred']:
+        pipe.hincrby(state['key'], 'deferred', -1)
+        pipe.hdel(state['key'], DEFERRED_PREFIX + state['job_id'])
+    for name, value in state['stats'].items():
+        if value:
+            pipe.hincrbyfloat(state['key'], name, value)
+    pipe.hincrby(state['key'], field, 1)
+    pipe.publish(_done_channel(state['key']), field)
+    pipe.execute()
+
+
+def track_job(func):
+    """This is the track job decorator.
+    It's used for bot job functions, jobs enqueued with a JobTracker
+    have the tracker's counters key in their meta and the bot
+    increments the started and finished (or failed) counters and
+    publishes a completion signal for the dispatcher.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        global _current
+        job = get_current_job()
+        key = job.meta.get(META_KEY) if job is not None else None
+        if key is None:
+            return func(*args, **kwargs)
+        redis_conn = job.connection
+        redis_conn.hincrby(key, 'started', 1)
+        state = _current = _new_state(key, redis_conn, job.id)
+        ok = False
+        try:
+            result = func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            _current = None
+            if not ok or not state['deferred']:
+                _count_done(state, ok)
+    return wrapper
+
+
+def defer_job_done():
+    """This is the defer job done function.
+    It's called by a job function whose results are sent after it
+    returns (BulkBuffer), track_job doesn't count the job when it
+    returns and the returned function counts it as finished (or
+    failed if called with False) instead. Returns None if the job
+    isn't tracked. The returned function also takes the job's bulk
+    time so it's added to the job's stats. The job is counted as
+    deferred (and it's id kept in the tracker's hash for crawl
+    checkpoints) until then so the dispatcher keeps waiting for it.
+    """
+    state = _current
+    if state is None or state['key'] is None:
+        return None
+    if not state['deferred']:
+        pipe = state['redis_conn'].pipeline(transaction=False)
+        pipe.hincrby(state['key'], 'deferred', 1)
+        pipe.hset(state['key'], DEFERRED_PREFIX + state['job_id'], 1)
+        pipe.execute()
+        state['deferred'] = True
+    return lambda ok=True, bulktime=0: _count_done(state, ok, bulktime)
+
+
+def add_job_stats(**stats):
+    """This is the add job stats function.
+    It adds crawl stats (STATS_FIELDS keyword args) of the job the bot
+    is running, they are added to the job's tracker with it's finished
+    counter so the dispatcher gets totals for all bots without
+    searching worker docs. Does nothing if the job isn't tracked or
+    run with run_job_stats.
+    """
+    state = _current
+    if state is None:
+        return
+    for name, value in stats.items():
+        state['stats'][name] += value
+
+
+def run_job_stats(func, *args):
+    """Run untracked job function func (--local) and return the
+    stats it added with add_job_stats."""
+    global _current
+    state = _current = _new_state(None, None)
+    try:
+        func(*args)
+    finally:
+        _current = None
+    return state['stats']
+
+
+def deferred_jobs(redis_conn, key):
+    """Return set of ids of the deferred jobs (docs not sent yet)
+    of the tracker with counters key."""
+    if not key:
+        return set()
+    fields = redis_conn.hkeys(key)
+    fields = [f.decode('utf-8') if isinstance(f, bytes) else f for f in fields]
+    return set(f[len(DEFERRED_PREFIX):] for f in fields if f.startswith(DEFERRED_PREFIX))
+
+
+def job_lost(job):
+    """Count job as failed for it's tracker, used when the bot
+    running the job died before track_job could count it."""
+    key = job.meta.get(META_KEY)
+    if key is None:
+        return
+    pipe = job.connection.pipeline(transaction=False)
+    pipe.hincrby(key, 'failed', 1)
+    pipe.publish(_done_channel(key), 'failed')
+    pipe.execute()
+
+
+class JobTracker(object):
+    """This is the job tracker class.
+    It keeps enqueued, started, finished and failed counters for
+    the jobs of one crawl phase in a Redis hash. BulkEnqueuer
+    increments enqueued in the same pipeline as the jobs, bots
+    increment the rest (track_job) so the dispatcher knows exactly
+    when the phase's jobs are done without polling every worker
+    and other queues' jobs.
+    """
+
+    def __init__(self, redis_conn, name, ttl=604800):
+        self.redis_conn = redis_conn
+        self.key = 'diskover_jobs_' + name + '_' + uuid.uuid4().hex
+        self.channel = _done_channel(self.key)
+        self.ttl = ttl
+
+    def meta(self):
+        """Return the meta dict for jobs of this tracker."""
+        return {META_KEY: self.key}
+
+    def add(self, count, pipeline=None):
+        """Increment enqueued counter by count."""
+        conn = pipeline if pipeline is not None else self.redis_conn
+        conn.hincrby(self.key, 'enqueued', count)
+        conn.expire(self.key, self.ttl)
+
+    def counts(self):
+        """Return dict of the job counters."""
+        values = self.redis_conn.hmget(self.key, FIELDS)
+        return dict((field, int(value or 0)) for field, value in zip(FIELDS, values))
+
+    def stats(self):
+        """Return dict of the crawl stats totals of the jobs."""
+        values = self.redis_conn.hmget(self.key, STATS_FIELDS)
+        return dict((field, float(value or 0)) for field, value in zip(STATS_FIELDS, values))
+
+    def done(self, counts=None):
+        """Return True if all enqueued jobs are finished or failed."""
+        if counts is None:
+            counts = self.counts()
+        return counts['finished'] + counts['failed'] >= counts['enqueued']
+
+    def wait(self, callback=None, interval=2.0, idlecheck=None, idletimeout=30.0, deferredtimeout=600.0,
+             logger=None):
+        """This is the job tracker wait method.
+        It blocks on the completion channel until all enqueued jobs
+        are done, the counters are checked at most every 0.1 sec and
+        callback is called with them every interval sec. If the
+        counters haven't changed for idletimeout sec and idlecheck
+        (worker_bots_busy) says bots are idle, jobs were lost (bot
+        killed) and it stops waiting. Bots are idle while they send
+        deferred jobs' docs (bulk retries can take minutes) so
+        deferredtimeout is used instead while there are deferred jobs.
+        Returns the counters.
+        """
+        pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            last = None
+            lastchange = lastcallback = time.time()
+            while True:
+                counts = self.counts()
+                if self.done(counts):
+                    return counts
+                now = time.time()
+                if counts != last:
+                    last = counts
+                    lastchange = now
+                elif idlecheck is not None and \
+                        now - lastchange >= (deferredtimeout if counts['deferred'] > 0 else idletimeout) and \
+                        not idlecheck():
+                    if logger:
+                        logger.warning('Bots are idle but only %s of %s jobs are done, not waiting for the rest'
+                                       % (counts['finished'] + counts['failed'], counts['enqueued']))
+                    return counts
+                if callback and now - lastcallback >= interval:
+                    callback(counts)
+                    lastcallback = now
+                # block until a completion signal (or interval) and take any other signals
+                if pubsub.get_message(timeout=interval) is not None:
+                    while pubsub.get_message() is not None:
+                        pass
+                    time.sleep(max(0, 0.1 - (time.time() - now)))
+        finally:
+            pubsub.close()
+
+    def deferred_jobs(self):
+        """Return set of ids of the deferred jobs."""
+        return deferred_jobs(self.redis_conn, self.key)
+
+    def delete(self):
+        """Remove the counters from Redis. They are kept (until they
+        expire) if there are deferred jobs, a crawl checkpoint needs
+        them if the bots died before sending the jobs' docs."""
+        if not self.counts()['deferred']:
+            self.redis_conn.delete(self.key)
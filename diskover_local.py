@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from diskover_jobs import run_job_stats, STATS_FIELDS
+from collections import deque
+from multiprocessing import util
+import multiprocessing
+import traceback
+import warnings
+import pickle
+import time
+import sys
+import os
+
+# queue pool processes put (job id, pid) in when they start a job
+_started = None
+
+
+def _run_job(jobid, func, data):
+    # runs in pool process, returns (True if the job finished, job stats)
+    _started.put((jobid, os.getpid()))
+    try:
+        return True, run_job_stats(func, *pickle.loads(data))
+    except Exception:
+        traceback.print_exc()
+        sys.stderr.flush()
+        return False, {}
+
+
+def _init_proc(started):
+    global _started
+    _started = started
+    # pool processes don't run atexit, send the bot's buffered docs and worker stats when they exit
+    util.Finalize(None, _close_proc, exitpriority=10)
+
+
+def _close_proc():
+    bot_module = sys.modules.get('diskover_bot_module')
+    if bot_module is not None:
+        bot_module.close_bulk_buffer()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class LocalPool(object):
+    """This is the local pool class.
+    It's a pool of procs processes which run bot job functions
+    (scrape_tree_meta, calc_dir_size) for --local instead of rq
+    worker bots. Processes are started with spawn (python 3) so
+    they make their own es connections. Processes tell the pool
+    which job they are running so jobs of processes which died
+    (oom, signal) can be counted as failed, the pool replaces the
+    process but the job's result never comes.
+    """
+
+    def __init__(self, procs):
+        self.procs = procs
+        try:
+            ctx = multiprocessing.get_context('spawn')
+        except AttributeError:
+            # python 2 only has fork
+            ctx = multiprocessing
+        # written right away (no feeder thread) so it's there even if the process is killed
+        self.started = ctx.SimpleQueue()
+        # job id -> pid of the process running it
+        self.running = {}
+        self.jobcount = 0
+        self.lostcount = 0
+        self.pool = ctx.Pool(procs, initializer=_init_proc, initargs=(self.started,))
+
+    def apply(self, func, data):
+        """Run job func with pickled args data in the pool, returns
+        (job id, AsyncResult)."""
+        self.jobcount += 1
+        return self.jobcount, self.pool.apply_async(_run_job, (self.jobcount, func, data))
+
+    def lost(self, jobids):
+        """Return the job ids in jobids whose process died."""
+        while not self.started.empty():
+            jobid, pid = self.started.get()
+            self.running[jobid] = pid
+        lost = [jobid for jobid in jobids if jobid in self.running and not _pid_alive(self.running[jobid])]
+        self.lostcount += len(lost)
+        return lost
+
+    def jobs(self, maxpending=None):
+        """Return a LocalJobs for a crawl phase."""
+        return LocalJobs(self, maxpending or self.procs * 4)
+
+    def close(self):
+        if self.lostcount:
+            # pool waits forever for results of lost jobs when closed
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+
+class LocalJobs(object):
+    """This is the local jobs class.
+    It has the same enqueue/flush/tick methods as BulkEnqueuer and
+    counts/stats/done/wait/delete methods as JobTracker so tree walk and
+    dir calcs can use it in place of both. Args are pickled when the
+    job is added. When maxpending jobs are running enqueue waits for
+    the oldest one so the walk can't get far ahead of the pool.
+    """
+
+    def __init__(self, localpool, maxpending):
+        self.localpool = localpool
+        self.maxpending = maxpending
+        self.pending = deque()
+        self.enqueued = 0
+        self.finished = 0
+        self.failed = 0
+        self.jobstats = dict.fromkeys(STATS_FIELDS, 0)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _reap(self, block=False, timeout=None):
+        # collect results of done jobs (in order), if block wait for the oldest one
+        while self.pending:
+            jobid, result = self.pending[0]
+            if block:
+                result.wait(timeout)
+                block = False
+                if not result.ready():
+                    self._reap_lost()
+                    continue
+            if not result.ready():
+                break
+            self.pending.popleft()
+            self.localpool.running.pop(jobid, None)
+            try:
+                ok, stats = result.get()
+            except Exception:
+                ok, stats = False, {}
+            for field, value in stats.items():
+                self.jobstats[field] += value
+            if ok:
+                self.finished += 1
+            else:
+                self.failed += 1
+
+    def _reap_lost(self):
+        # count jobs of processes which died as failed
+        lost = set(self.localpool.lost([jobid for jobid, result in self.pending if not result.ready()]))
+        if not lost:
+            return
+        warnings.warn("%s local processes died, counting their jobs as failed" % len(lost))
+        self.pending = deque(item for item in self.pending if item[0] not in lost)
+        for jobid in lost:
+            self.localpool.running.pop(jobid, None)
+        self.failed += len(lost)
+
+    def enqueue(self, func, args=None):
+        data = pickle.dumps(tuple(args or ()), protocol=2)
+        self._reap()
+        while len(self.pending) >= self.maxpending:
+            self._reap(block=True, timeout=1)
+        self.pending.append(self.localpool.apply(func, data))
+        self.enqueued += 1
+
+    def flush(self):
+        return 0
+
+    def tick(self):
+        self._reap()
+
+    def counts(self):
+        self._reap()
+        return {'enqueued': self.enqueued, 'started': self.enqueued, 'finished': self.finished,
+                'failed': self.failed, 'deferred': 0}
+
+    def stats(self):
+        return dict(self.jobstats)
+
+    def done(self, counts=None):
+        if counts is None:
+            counts = self.counts()
+        return counts['finished'] + counts['failed'] >= counts['enqueued']
+
+    def wait(self, callback=None, interval=2.0, idlecheck=None, idletimeout=None, logger=None):
+        """Wait for all jobs to be done, calling callback with the
+        counters every interval sec. Returns the counters."""
+        lastcallback = time.time()
+        while self.pending:
+            self._reap(block=True, timeout=interval)
+            if callback and time.time() - lastcallback >= interval:
+                callback(self.counts())
+                lastcallback = time.time()
+        return self.counts()
+
+    def delete(self):
+        pass
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+import time
+import re
+import os
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class DirMatcher(object):
+    """This is the directory matcher class.
+    It compiles the excludes/includes dirs config once into a set
+    of exact dir names and paths, a dot dir flag (.*), tuples of
+    prefixes (str*) and suffixes (*str) for str.startswith and
+    str.endswith and one combined regex for *str* patterns.
+    """
+
+    def __init__(self, excluded_dirs, included_dirs):
+        self.included = set(included_dirs)
+        self.names = set()
+        self.dotdirs = False
+        prefixes = []
+        suffixes = []
+        contains = []
+        for d in excluded_dirs:
+            if d == '.*':
+                self.dotdirs = True
+            elif d.startswith('*') and d.endswith('*') and len(d) > 1:
+                contains.append(re.escape(d.strip('*')))
+            elif d.startswith('*'):
+                suffixes.append(d[1:])
+            elif d.endswith('*'):
+                prefixes.append(d[:-1])
+            else:
+                self.names.add(d)
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        if contains:
+            self.regex = re.compile('|'.join(contains))
+        else:
+            self.regex = None
+
+    def excluded(self, path):
+        """Return True if path is excluded."""
+        name = os.path.basename(path)
+        # return if directory in included list (whitelist)
+        if name in self.included or path in self.included:
+            return False
+        if name in self.names or path in self.names:
+            return True
+        if self.dotdirs and name.startswith('.'):
+            return True
+        # path ends with name so only path needs checking for suffixes and *str*
+        if self.prefixes and (name.startswith(self.prefixes) or path.startswith(self.prefixes)):
+            return True
+        if self.suffixes and path.endswith(self.suffixes):
+            return True
+        if self.regex is not None and self.regex.search(path):
+            return True
+        return False
+
+
+class FileMatcher(object):
+    """This is the file matcher class.
+    It compiles the excludes/includes files config once into sets
+    of exact file names and extensions (*.ext) and flags for files
+    without extensions (NULLEXT) and dot files (.*).
+    """
+
+    def __init__(self, excluded_files, included_files):
+        self.included = set(included_files)
+        self.names = set(excluded_files)
+        self.nullext = 'NULLEXT' in self.names
+        self.dotfiles = u'.*' in self.names
+        self.extensions = set(f[2:].lower() for f in excluded_files if f.startswith('*.'))
+        self.checkext = self.nullext or bool(self.extensions)
+
+    def excluded(self, filename, extension=None):
+        """Return True if filename is excluded, extension is
+        computed from filename if not given."""
+        # return if filename in included list (whitelist)
+        if filename in self.included:
+            return False
+        # check for filename in excluded_files set
+        if filename in self.names:
+            return True
+        if self.dotfiles and filename.startswith('.'):
+            return True
+        if self.checkext:
+            if extension is None:
+                extension = os.path.splitext(filename)[1][1:].strip().lower()
+            if extension:
+                return extension in self.extensions
+            return self.nullext
+        return False
+
+
+def autotag_regex(pattern):
+    """This is the autotag regex function.
+    It returns the regex string auto tag used for a wildcard
+    pattern, *str* searches for str, *str for str at the end
+    and str* for str at the start.
+    """
+    if pattern.startswith('*') and pattern.endswith('*'):
+        return pattern.replace('*', '')
+    elif pattern.startswith('*'):
+        return pattern[1:] + '$'
+    elif pattern.endswith('*'):
+        return '^' + pattern
+    return pattern
+
+
+class PatternList(object):
+    """This is the pattern list class.
+    It compiles a list of auto tag patterns into a set of exact
+    values and one combined regex. A value matches if it's equal
+    to one of the patterns or the regex for any of the patterns
+    is found in it.
+    """
+
+    def __init__(self, patterns):
+        self.exact = set(patterns)
+        if patterns:
+            self.regex = re.compile('|'.join('(?:%s)' % autotag_regex(p) for p in patterns))
+        else:
+            self.regex = None
+
+    def match(self, value):
+        return value in self.exact or (self.regex is not None and self.regex.search(value) is not None)
+
+
+class AutoTagRule(object):
+    """This is the auto tag rule class.
+    It's a compiled [autotag] pattern dict. Lists which are missing
+    or empty in the pattern dict are None and always pass.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.name_exclude = self._compile('name_exclude')
+        self.path_exclude = self._compile('path_exclude')
+        self.ext = self._compile('ext')
+        self.name = self._compile('name')
+        self.path = self._compile('path')
+        self.hasexcludes = self.name_exclude is not None or self.path_exclude is not None
+        # (index of mtime, atime, ctime arg, seconds)
+        self.times = []
+        for i, key in enumerate(('mtime', 'atime', 'ctime')):
+            if pattern.get(key, 0) > 0:
+                self.times.append((i, pattern[key] * 86400))
+
+    def _compile(self, key):
+        patterns = self.pattern.get(key)
+        if not patterns:
+            return None
+        return PatternList(patterns)
+
+    def excluded(self, metadict):
+        if self.name_exclude is not None and self.name_exclude.match(metadict['filename']):
+            return True
+        if self.path_exclude is not None and self.path_exclude.match(metadict['path_parent']):
+            return True
+        return False
+
+    def match(self, metadict, times, now):
+        if self.name is not None and not self.name.match(metadict['filename']):
+            return False
+        if self.path is not None and not self.path.match(metadict['path_parent']):
+            return False
+        for i, time_sec in self.times:
+            if times[i] and now - times[i] < time_sec:
+                return False
+        return True
+
+
+class AutoTagger(object):
+    """This is the auto tagger class.
+    It compiles the [autotag] files and dirs pattern dicts once and
+    tags file and directory meta dicts with the first matching
+    rule's tag. A rule's name/path excludes stop any later rules
+    from being checked. File rules are indexed by extension, the
+    rules which can match an extension (and rules with excludes)
+    are found once for each extension and cached.
+    refresh_time sets the time used for mtime/atime/ctime checks,
+    bots call it once per batch.
+    """
+
+    def __init__(self, autotag_files, autotag_dirs):
+        self.file_rules = [AutoTagRule(p) for p in autotag_files]
+        self.dir_rules = [(rule, True) for rule in (AutoTagRule(p) for p in autotag_dirs)]
+        self.ext_rules = {}
+        self.now = None
+
+    def refresh_time(self):
+        self.now = time.time()
+
+    def _file_rules(self, extension):
+        try:
+            return self.ext_rules[extension]
+        except KeyError:
+            pass
+        rules = []
+        for rule in self.file_rules:
+            canmatch = rule.ext is None or rule.ext.match(extension)
+            if canmatch or rule.hasexcludes:
+                rules.append((rule, canmatch))
+        self.ext_rules[extension] = rules
+        return rules
+
+    def tag(self, metadict, type, mtime, atime, ctime):
+        """Set tag and tag_custom in metadict from the first
+        matching rule and return metadict."""
+        if type == 'file':
+            rules = self._file_rules(metadict['extension'])
+        elif type == 'directory':
+            rules = self.dir_rules
+        else:
+            return metadict
+        now = self.now or time.time()
+        times = (mtime, atime, ctime)
+        for rule, canmatch in rules:
+            if rule.hasexcludes and rule.excluded(metadict):
+                return metadict
+            if canmatch and rule.match(metadict, times, now):
+                metadict['tag'] = rule.pattern['tag']
+                metadict['tag_custom'] = rule.pattern['tag_custom']
+                return metadict
+        return metadict
+
+
+class CostMatcher(object):
+    """This is the cost matcher class.
+    It compiles the [storagecost] paths and times pattern dicts
+    once and gets the cost per gb for batches of (fullpath, mtime,
+    atime, ctime, size) records. Path patterns are checked once
+    for each parent directory in a batch and only the file name
+    for each record, time patterns are checked for the whole batch
+    at once using NumPy (if installed).
+    """
+
+    def __init__(self, costpergb, base, paths, times, priority):
+        self.costpergb = costpergb
+        if base == 10:
+            self.basen = 1000
+        else:
+            self.basen = 1024
+        self.paths = []
+        for pattern in paths:
+            self.paths.append((PatternList(pattern.get('path_exclude') or []),
+                               PatternList(pattern.get('path') or []), pattern['costpergb']))
+        self.times = []
+        for pattern in times:
+            seconds = [pattern.get(key, 0) * 86400 if pattern.get(key, 0) > 0 else 0
+                       for key in ('mtime', 'atime', 'ctime')]
+            self.times.append((seconds, pattern['costpergb']))
+        self.priority = priority
+        self.enabled = bool(self.paths or self.times)
+
+    def _path_costs(self, fullpaths):
+        # cost per gb for each path from first path pattern matching parent dir or
+        # file name, False if excluded and None if no pattern matches
+        costs = []
+        parents = {}
+        for fullpath in fullpaths:
+            parentdir, sep, filename = fullpath.rpartition(os.path.sep)
+            if not parentdir:
+                parentdir = sep
+            try:
+                parentmatches = parents[parentdir]
+            except KeyError:
+                parentmatches = parents[parentdir] = [(exclude.match(parentdir), path.match(parentdir))
+                                                      for exclude, path, cost in self.paths]
+            cost = None
+            for (exclude, path, pathcost), (parentexcluded, parentmatched) in zip(self.paths, parentmatches):
+                if parentexcluded or exclude.match(filename):
+                    cost = False
+                    break
+                if parentmatched or path.match(filename):
+                    cost = pathcost
+                    break
+            costs.append(cost)
+        return costs
+
+    def _time_costs(self, times, now):
+        # cost per gb for each (mtime, atime, ctime) from first time pattern
+        # which passes, None if no pattern passes
+        if not self.times:
+            return [None] * len(times)
+        if np is not None and len(times) > 1:
+            # times which are None are nan
+            t = np.array(times, dtype=np.float64)
+            notime = np.isnan(t) | (t == 0)
+            age = now - t
+            result = np.full(len(times), np.nan)
+            done = np.zeros(len(times), dtype=bool)
+            for seconds, cost in self.times:
+                passed = ~done
+                for i, sec in enumerate(seconds):
+                    if sec:
+                        passed &= notime[:, i] | (age[:, i] >= sec)
+                result[passed] = cost
+                done |= passed
+            return [None if c != c else c for c in result.tolist()]
+        costs = []
+        for record in times:
+            cost = None
+            for seconds, patterncost in self.times:
+                for value, sec in zip(record, seconds):
+                    if sec and value and now - value < sec:
+                        break
+                else:
+                    cost = patterncost
+                    break
+            costs.append(cost)
+        return costs
+
+    def costs(self, records, now=None):
+        """This is the costs method.
+        It returns a list of cost per gb values (rounded to 2
+        decimals) for a list of (fullpath, mtime, atime, ctime,
+        size) records.
+        """
+        if not records:
+            return []
+        basen = self.basen
+        sizes_gb = [record[4]/basen/basen/basen for record in records]
+        if not self.enabled:
+            return [round(self.costpergb * size_gb, 2) for size_gb in sizes_gb]
+        now = now or time.time()
+        if self.paths:
+            pathcosts = self._path_costs([record[0] for record in records])
+        else:
+            pathcosts = [None] * len(records)
+        timecosts = self._time_costs([record[1:4] for record in records], now)
+        costs = []
+        for size_gb, pathcost, timecost in zip(sizes_gb, pathcosts, timecosts):
+            if pathcost is False:
+                # excluded path uses default cost per gb
+                cost = self.costpergb
+            elif pathcost is not None and timecost is not None:
+                if self.priority == 'path':
+                    cost = pathcost
+                else:
+                    cost = timecost
+            elif pathcost is not None:
+                cost = pathcost
+            elif timecost is not None:
+                cost = timecost
+            else:
+                cost = self.costpergb
+            costs.append(round(cost * size_gb, 2))
+        return costs
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from rq import SimpleWorker
+from rq.exceptions import DequeueTimeout
+from rq.worker import WorkerStatus
+import time
+
+# Redis set of crawl queue namespaces (index names) bots listen on
+NAMESPACES_KEY = 'diskover_namespaces'
+
+
+def namespaced(names, namespace):
+    """Return queue names for namespace."""
+    return [name + '_' + namespace for name in names]
+
+
+def register_namespace(namespace, redis_conn):
+    """Add namespace so bots start listening on it's queues."""
+    redis_conn.sadd(NAMESPACES_KEY, namespace)
+
+
+def unregister_namespace(namespace, redis_conn):
+    """Remove namespace when the crawl is done."""
+    redis_conn.srem(NAMESPACES_KEY, namespace)
+
+
+def get_namespaces(redis_conn):
+    """Return sorted list of registered namespaces."""
+    namespaces = []
+    for namespace in redis_conn.smembers(NAMESPACES_KEY):
+        if isinstance(namespace, bytes):
+            namespace = namespace.decode('utf-8')
+        namespaces.append(namespace)
+    return sorted(namespaces)
+
+
+class NamespaceWorker(SimpleWorker):
+    """This is the namespace worker class.
+    It's a rq SimpleWorker which listens on the shared queues and
+    the queues of every registered crawl namespace, namespaces are
+    checked every refresh_interval sec. Each time the worker takes
+    a job the namespaces are rotated (round robin) so one crawl
+    with a lot of jobs can't starve other crawls (fair share).
+    Queue priority (diskover, diskover_crawl, diskover_calcdir)
+    is kept within each namespace.
+    """
+
+    refresh_interval = 5
+
+    def __init__(self, queues, *args, **kwargs):
+        super(NamespaceWorker, self).__init__(queues, *args, **kwargs)
+        self.base_queues = list(self.queues)
+        self.namespace_queues = {}
+        self.namespaces = []
+        self.lastrefresh = 0
+        self.turn = 0
+
+    def refresh_namespaces(self):
+        self.namespaces = get_namespaces(self.connection)
+        self.lastrefresh = time.time()
+        for namespace in list(self.namespace_queues):
+            if namespace not in self.namespaces:
+                del self.namespace_queues[namespace]
+        for namespace in self.namespaces:
+            if namespace not in self.namespace_queues:
+                self.namespace_queues[namespace] = [
+                    self.queue_class(name, connection=self.connection, job_class=self.job_class)
+                    for name in namespaced([q.name for q in self.base_queues], namespace)]
+
+    def fair_queues(self):
+        """Return the queues to listen on, rotated one namespace
+        each call."""
+        groups = [self.base_queues] + [self.namespace_queues[ns] for ns in self.namespaces]
+        i = self.turn % len(groups)
+        self.turn += 1
+        queues = []
+        for group in groups[i:] + groups[:i]:
+            queues.extend(group)
+        return queues
+
+    def dequeue_job_and_maintain_ttl(self, timeout):
+        # same as rq's but with namespace queues, blocking dequeue times out
+        # every refresh_interval to pick up new namespaces
+        result = None
+        self.set_state(WorkerStatus.IDLE)
+        while True:
+            self.heartbeat()
+            if time.time() - self.lastrefresh >= self.refresh_interval:
+                self.refresh_namespaces()
+            self.queues = self.fair_queues()
+            self.procline('Listening on ' + ','.join(self.queue_names()))
+            if timeout is not None:
+                dequeue_timeout = max(1, int(min(timeout, self.refresh_interval)))
+            else:
+                dequeue_timeout = None
+            try:
+                result = self.queue_class.dequeue_any(self.queues, dequeue_timeout,
+                                                      connection=self.connection,
+                                                      job_class=self.job_class)
+                if result is not None:
+                    job, queue = result
+                    self.log.info('{0}: {1} ({2})'.format(queue.name, job.description, job.id))
+                break
+            except DequeueTimeout:
+                pass
+        self.heartbeat()
+        return result
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+import hashlib
+import pickle
+import time
+import zlib
+import os
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# first byte of encoded batches, compression used
+NONE = b'n'
+ZLIB = b'z'
+LZ4 = b'l'
+
+# batch encodings
+COMPACT = 1
+RAW = 2
+
+# settings records already stored in Redis (ref: time stored) and loaded by bots
+_settings_stored = {}
+_settings_loaded = {}
+
+
+def compression_supported(compression):
+    """Return True if compression (none, zlib or lz4) can be used."""
+    if compression == 'lz4':
+        return lz4frame is not None
+    return compression in ('none', 'zlib')
+
+
+def _common_root(paths):
+    # common parent directory of paths, ends with a separator
+    prefix = os.path.commonprefix(paths)
+    i = prefix.rfind(os.path.sep)
+    if i < 0:
+        return ''
+    return prefix[:i + 1]
+
+
+def _root_path(root):
+    if isinstance(root, tuple):
+        return root[0]
+    return root
+
+
+def _compact(batch):
+    # path-prefix compress the batch's roots against their common root and
+    # replace all names with indexes into a table of unique names
+    table = []
+    ids = {}
+
+    def intern(s):
+        try:
+            return ids[s]
+        except KeyError:
+            ids[s] = len(table)
+            table.append(s)
+            return ids[s]
+
+    prefix = _common_root([_root_path(entry[0]) for entry in batch])
+    plen = len(prefix)
+    items = []
+    for entry in batch:
+        root = entry[0]
+        rootpath = _root_path(root)
+        if isinstance(root, tuple):
+            root = (rootpath[plen:],) + root[1:]
+        else:
+            root = rootpath[plen:]
+        dirs = entry[1]
+        if dirs is not None:
+            dirs = [intern(d) for d in dirs]
+        files = []
+        rootprefix = os.path.join(rootpath, '')
+        rlen = len(rootprefix)
+        for f in entry[2] if len(entry) > 2 else []:
+            if isinstance(f, tuple):
+                # embeded stats (fullpath, stats), fullpath is root joined with name
+                fullpath = f[0]
+                if fullpath.startswith(rootprefix) and os.path.sep not in fullpath[rlen:]:
+                    files.append((intern(fullpath[rlen:]),) + f[1:])
+                else:
+                    files.append(f)
+            else:
+                files.append(intern(f))
+        items.append((root, dirs, files) + tuple(entry[3:]) if len(entry) > 2 else (root, dirs))
+    return prefix, table, items
+
+
+def _expand(prefix, table, items):
+    batch = []
+    for item in items:
+        root = item[0]
+        if isinstance(root, tuple):
+            rootpath = prefix + root[0]
+            root = (rootpath,) + root[1:]
+        else:
+            rootpath = root = prefix + root
+        rootprefix = os.path.join(rootpath, '')
+        dirs = item[1]
+        if dirs is not None:
+            dirs = [table[d] for d in dirs]
+        if len(item) == 2:
+            batch.append((root, dirs))
+            continue
+        files = []
+        for f in item[2]:
+            if isinstance(f, tuple):
+                if isinstance(f[0], int):
+                    f = (rootprefix + table[f[0]],) + f[1:]
+                files.append(f)
+            else:
+                files.append(table[f])
+        batch.append((root, dirs, files) + tuple(item[3:]))
+    return batch
+
+
+def encode_batch(batch, compression='none', level=1):
+    """This is the encode batch function.
+    It encodes a tree walk batch of (root, dirs, files) tuples for
+    a crawl job. Roots are stored relative to the batch's common
+    root, dir and file names are interned and the pickle is
+    compressed using zlib or lz4 (zlib if lz4 isn't installed).
+    Batches which don't have path roots (qumulo) are pickled as is.
+    """
+    try:
+        if not all(isinstance(_root_path(entry[0]), string_types) for entry in batch):
+            raise TypeError
+        data = (COMPACT,) + _compact(batch)
+    except (TypeError, IndexError, AttributeError):
+        data = (RAW, batch)
+    s = pickle.dumps(data, protocol=2)
+    if compression == 'lz4' and lz4frame is None:
+        compression = 'zlib'
+    if compression == 'zlib':
+        return ZLIB + zlib.compress(s, level)
+    elif compression == 'lz4':
+        return LZ4 + lz4frame.compress(s)
+    return NONE + s
+
+
+def decode_batch(data):
+    """This is the decode batch function.
+    It returns the batch list from an encoded batch.
+    """
+    compression, s = data[:1], data[1:]
+    if compression == ZLIB:
+        s = zlib.decompress(s)
+    elif compression == LZ4:
+        s = lz4frame.decompress(s)
+    data = pickle.loads(s)
+    if data[0] == RAW:
+        return data[1]
+    return _expand(*data[1:])
+
+
+def settings_key(cliargs):
+    """Return the Redis key for the crawl settings record of cliargs."""
+    s = pickle.dumps(sorted(cliargs.items()), protocol=2)
+    return 'diskover_settings_' + cliargs['index'] + '_' + hashlib.md5(s).hexdigest()
+
+
+def settings_ref(cliargs, redis_conn, ttl):
+    """This is the settings ref function.
+    It stores cliargs once in Redis as the crawl settings record
+    and returns it's key which crawl jobs have instead of cliargs.
+    The record's ttl is refreshed once half of it has gone by.
+    """
+    key = settings_key(cliargs)
+    now = time.time()
+    if now - _settings_stored.get(key, 0) >= ttl / 2:
+        redis_conn.set(key, pickle.dumps(cliargs, protocol=2), ex=ttl)
+        _settings_stored[key] = now
+    return key
+
+
+def load_settings(ref, redis_conn):
+    """This is the load settings function.
+    It returns cliargs from the crawl settings record ref, records
+    are loaded from Redis once per bot.
+    """
+    try:
+        return _settings_loaded[ref]
+    except KeyError:
+        pass
+    s = redis_conn.get(ref)
+    if s is None:
+        raise KeyError("crawl settings record %s not found in Redis" % ref)
+    cliargs = _settings_loaded[ref] = pickle.loads(s)
+    return cliargs
@@ -15,14 +15,12 @@ try:
     from qumulo.rest_client import RestClient
 except ImportError:
     raise ImportError("qumulo-api module not installed")
-from diskover import config, dir_excluded, plugins, adaptive_batch, redis_conn, worker_bots_busy
+from diskover import config, dir_excluded, plugins, adaptive_batch, redis_conn, crawl_job_args, \
+    bulk_enqueuer, job_tracker, wait_for_jobs
 from diskover_bot_module import scrape_tree_meta, auto_tag, uids, owners, gids, groups, file_excluded
+from diskover_walk import TreeWalker
+from diskover_reindex import apply_tags
 from rq import SimpleWorker
-from threading import Thread, Lock
-try:
-    from queue import Queue as PyQueue
-except ImportError:
-    from Queue import Queue as PyQueue
 import os
 import random
 import requests
@@ -125,34 +123,14 @@ def qumulo_api_listdir(top, ip, ses):
     return dirs, nondirs
 
 
-def qumulo_api_walk(path, ip, ses, q_paths, q_paths_results):
-    q_paths.put(path)
-    while True:
-        entry = q_paths_results.get()
-        root, dirs, nondirs = entry
-        # yield before recursion
-        yield root, dirs, nondirs
-        # recurse into subdirectories
-        for name in dirs:
-            new_path = os.path.join(root, name)
-            q_paths.put(new_path)
-        q_paths_results.task_done()
-        if q_paths_results.qsize() == 0 and q_paths.qsize() == 0:
-            time.sleep(.5)
-            if q_paths_results.qsize() == 0 and q_paths.qsize() == 0:
-                break
-
-
-def apiwalk_worker(ip, ses, q_paths, q_paths_results, lock):
-    while True:
-        path = q_paths.get()
-        dirs, nondirs = qumulo_api_listdir(path, ip, ses)
-
-        root = qumulo_get_file_attr(path, ip, ses)
-
-        q_paths_results.put((root, dirs, nondirs))
-
-        q_paths.task_done()
+def qumulo_listdir(path, ip, ses):
+    """This is the qumulo list directory function.
+    It is used by the tree walk threads to get the
+    directory attributes and it's sub dirs and files.
+    """
+    dirs, nondirs = qumulo_api_listdir(path, ip, ses)
+    root = qumulo_get_file_attr(path, ip, ses)
+    return root, dirs, nondirs
 
 
 def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs, logger, reindex_dict):
@@ -162,16 +140,22 @@ def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs,
     totalfiles = 0
     starttime = time.time()
 
-    # queue for paths
-    q_paths = PyQueue()
-    q_paths_results = PyQueue()
-    lock = Lock()
+    def descend(root):
+        # same checks as below, called by walk threads when they list root
+        if root['path'] != '/':
+            root_path = root['path'].rstrip(os.path.sep)
+        else:
+            root_path = root['path']
+        if dir_excluded(root_path, config, cliargs):
+            return False
+        if cliargs['maxdepth'] and num_sep + level <= root_path.count(os.path.sep):
+            return False
+        return True
 
-    # set up threads for tree walk
-    for i in range(cliargs['walkthreads']):
-        t = Thread(target=apiwalk_worker, args=(ip, ses, q_paths, q_paths_results, lock,))
-        t.daemon = True
-        t.start()
+    # set up work stealing threads for tree walk
+    walker = TreeWalker(lambda p: qumulo_listdir(p, ip, ses), cliargs['walkthreads'], logger, descend=descend)
+    tracker = job_tracker(cliargs, 'crawl')
+    enqueuer = bulk_enqueuer(q_crawl, tracker)
 
     # set up progress bar
     if not cliargs['quiet'] and not cliargs['debug'] and not cliargs['verbose']:
@@ -184,7 +168,7 @@ def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs,
         bar = None
 
     bartimestamp = time.time()
-    for root, dirs, files in qumulo_api_walk(path, ip, ses, q_paths, q_paths_results):
+    for root, dirs, files in walker.walk(path):
         dircount += 1
         totaldirs += 1
         files_len = len(files)
@@ -200,8 +184,7 @@ def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs,
             batch.append((root, dirs, files))
             batch_len = len(batch)
             if batch_len >= batchsize or (cliargs['adaptivebatch'] and totalfiles >= config['adaptivebatch_maxfiles']):
-                q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,),
-                                      result_ttl=config['redis_ttl'])
+                enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
                 if cliargs['debug'] or cliargs['verbose']:
                     logger.info("enqueued batchsize: %s (batchsize: %s)" % (batch_len, batchsize))
                 del batch[:]
@@ -222,6 +205,9 @@ def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs,
             del dirs[:]
             del files[:]
 
+        # enqueue any buffered jobs if flush interval has gone by
+        enqueuer.tick()
+
         # update progress bar
         if bar:
             try:
@@ -231,40 +217,29 @@ def qumulo_treewalk(path, ip, ses, q_crawl, num_sep, level, batchsize, cliargs,
                     widgets[4] = progressbar.FormatLabel(', ' + str(dirspersec) + ' dirs/sec) ')
                     bartimestamp = time.time()
                     dircount = 0
-                bar.update(len(q_crawl))
+                    counts = tracker.counts()
+                    bar.update(counts['enqueued'] - counts['finished'] - counts['failed'])
             except (ZeroDivisionError, ValueError):
                 bar.update(0)
 
     # add any remaining in batch to queue
-    q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,), result_ttl=config['redis_ttl'])
+    if len(batch) > 0:
+        enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
+    enqueuer.flush()
 
-    # set up progress bar with time remaining
     if bar:
         bar.finish()
-        bar_max_val = len(q_crawl)
-        bar = progressbar.ProgressBar(max_value=bar_max_val)
-        bar.start()
-    else:
-        bar = None
 
-    # update progress bar until bots are idle and queue is empty
-    while worker_bots_busy([q_crawl]):
-        if bar:
-            q_len = len(q_crawl)
-            try:
-                bar.update(bar_max_val - q_len)
-            except (ZeroDivisionError, ValueError):
-                bar.update(0)
-        time.sleep(1)
-
-    if bar:
-        bar.finish()
+    # wait for bots to be done with crawl jobs
+    wait_for_jobs(tracker, [q_crawl], logger, showbar=bar is not None)
 
     elapsed = round(time.time() - starttime, 3)
     dirspersec = round(totaldirs / elapsed, 3)
 
     logger.info("Finished crawling, elapsed time %s sec, dirs walked %s (%s dirs/sec)" %
                 (elapsed, totaldirs, dirspersec))
+    logger.info("Tree walk listed %s dirs (%s dirs/sec) using %s threads, %s work steals" %
+                (walker.dircount, walker.dirs_per_sec(), walker.threads, walker.steals))
 
 
 def qumulo_get_dir_meta(worker_name, path, cliargs, reindex_dict, redis_conn):
@@ -357,12 +332,8 @@ def qumulo_get_dir_meta(worker_name, path, cliargs, reindex_dict, redis_conn):
     if cliargs['autotag'] and len(config['autotag_dirs']) > 0:
         auto_tag(dirmeta_dict, 'directory', mtime_unix, None, ctime_unix)
 
-    # search for and copy over any existing tags from reindex_dict
-    for sublist in reindex_dict['directory']:
-        if sublist[0] == fullpath:
-            dirmeta_dict['tag'] = sublist[1]
-            dirmeta_dict['tag_custom'] = sublist[2]
-            break
+    # copy over any existing tags from reindex tags hash in Redis
+    apply_tags(reindex_dict, 'directory', [dirmeta_dict], redis_conn)
 
     # cache directory times in Redis
     if config['redis_cachedirtimes'] == 'True' or config['redis_cachedirtimes'] == 'true':
@@ -474,13 +445,6 @@ def qumulo_get_file_meta(worker_name, path, cliargs, reindex_dict):
     if cliargs['autotag'] and len(config['autotag_files']) > 0:
         auto_tag(filemeta_dict, 'file', mtime_unix, None, ctime_unix)
 
-    # search for and copy over any existing tags from reindex_dict
-    for sublist in reindex_dict['file']:
-        if sublist[0] == path['path']:
-            filemeta_dict['tag'] = sublist[1]
-            filemeta_dict['tag_custom'] = sublist[2]
-            break
-
     return filemeta_dict
 
 
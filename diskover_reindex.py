@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+import hashlib
+import json
+
+
+def reindex_key(index):
+    """Return the Redis hash key for index's reindex tags."""
+    return 'diskover_reindex_' + index
+
+
+def reindex_ref(index):
+    """This is the reindex ref function.
+    It returns a new reindex_dict which is the reference to the
+    Redis hash holding the existing tags of docs deleted for
+    reindexing and the number of tagged files and directories
+    in it. The dict is sent with every crawl job instead of the
+    tags themselves.
+    """
+    return {'key': reindex_key(index), 'file': 0, 'directory': 0}
+
+
+def tag_field(path):
+    """Return the hash field for path (md5 hex digest)."""
+    return hashlib.md5(path.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def doc_path(doc):
+    """Return the full path of a file or directory doc source."""
+    return doc['path_parent'] + '/' + doc['filename']
+
+
+def store_tags(reindex_dict, doctype, docs, redis_conn):
+    """This is the store tags function.
+    It adds the tags of doc sources which have a tag or tag_custom
+    to the reindex Redis hash in one pipelined round trip and
+    updates the doctype count in reindex_dict.
+    """
+    tags = {}
+    for doc in docs:
+        tag = doc.get('tag', '')
+        tag_custom = doc.get('tag_custom', '')
+        if tag or tag_custom:
+            tags[tag_field(doc_path(doc))] = json.dumps([tag, tag_custom])
+    if not tags:
+        return reindex_dict
+    pipe = redis_conn.pipeline()
+    pipe.hmset(reindex_dict['key'], tags)
+    pipe.execute()
+    reindex_dict[doctype] += len(tags)
+    return reindex_dict
+
+
+def apply_tags(reindex_dict, doctype, metas, redis_conn):
+    """This is the apply tags function.
+    It copies any existing tags from the reindex Redis hash to a
+    list of file or directory meta dicts, the tags for all the meta
+    dicts are fetched with one HMGET. Nothing is fetched if no docs
+    of doctype had tags.
+    """
+    if not reindex_dict or not reindex_dict.get(doctype) or not metas:
+        return metas
+    values = redis_conn.hmget(reindex_dict['key'], [tag_field(doc_path(meta)) for meta in metas])
+    for meta, value in zip(metas, values):
+        if value is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        meta['tag'], meta['tag_custom'] = json.loads(value)
+    return metas
+
+
+def delete_tags(reindex_dict, redis_conn):
+    """This is the delete tags function.
+    It removes the reindex Redis hash when the crawl is done.
+    """
+    redis_conn.delete(reindex_dict['key'])
+    reindex_dict['file'] = 0
+    reindex_dict['directory'] = 0
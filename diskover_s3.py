@@ -120,7 +120,7 @@ def process_line(row, tree_dirs, tree_files, cliargs):
     filename = os.path.basename(path)
     # check if file is in exluded_files list
     extension = os.path.splitext(filename)[1][1:].strip().lower()
-    if file_excluded(filename, extension, path, cliargs['verbose']):
+    if file_excluded(filename, extension):
         return tree_dirs, tree_files
     # Skip files smaller than minsize cli flag
     if not isdir and size < cliargs['minsize']:
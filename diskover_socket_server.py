@@ -11,7 +11,8 @@ diskover is released under the Apache 2.0 license. See
 LICENSE for the full license text.
 """
 
-from diskover import q_crawl, adaptive_batch, config, get_time
+from diskover import adaptive_batch, config, get_time, crawl_job_args, bulk_enqueuer, job_tracker, wait_for_jobs
+import diskover
 from diskover_bot_module import scrape_tree_meta
 import socket
 import subprocess
@@ -119,10 +120,11 @@ def recv_one_message(sock):
 
 
 def socket_thread_handler_twc(threadnum, q, q_kill, lock, rootdir, num_sep, level,
-                              batchsize, cliargs, logger, reindex_dict):
+                              batchsize, cliargs, logger, reindex_dict, tracker):
     """This is the socket thread handler tree walk client function.
     Stream of directory listings (pickle) from diskover treewalk
-    client connections are enqueued to redis rq queue.
+    client connections are enqueued to redis rq queue in bulk,
+    jobs are counted by tracker.
     """
 
     while True:
@@ -133,6 +135,9 @@ def socket_thread_handler_twc(threadnum, q, q_kill, lock, rootdir, num_sep, leve
             logger.debug(addr)
 
             totalfiles = 0
+            # queue looked up now since it's switched when using queue namespaces
+            q_crawl = diskover.q_crawl
+            enqueuer = bulk_enqueuer(q_crawl, tracker)
             while True:
                 data = recv_one_message(clientsock)
                 if not data:
@@ -156,8 +161,7 @@ def socket_thread_handler_twc(threadnum, q, q_kill, lock, rootdir, num_sep, leve
                     batch.append((root, dirs, files))
                     batch_len = len(batch)
                     if batch_len >= batchsize or (cliargs['adaptivebatch'] and totalfiles >= config['adaptivebatch_maxfiles']):
-                        q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,), 
-                                            result_ttl=config['redis_ttl'])
+                        enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
                         if cliargs['debug'] or cliargs['verbose']:
                             logger.info("enqueued batchsize: %s (batchsize: %s)" % (batch_len, batchsize))
                         del batch[:]
@@ -169,9 +173,14 @@ def socket_thread_handler_twc(threadnum, q, q_kill, lock, rootdir, num_sep, leve
 
                 if len(batch) > 0:
                     # add any remaining in batch to queue
-                    q_crawl.enqueue(scrape_tree_meta, args=(batch, cliargs, reindex_dict,), result_ttl=config['redis_ttl'])
+                    enqueuer.enqueue(scrape_tree_meta, args=crawl_job_args(batch, cliargs, reindex_dict))
                     del batch[:]
 
+                # enqueue any buffered jobs if flush interval has gone by
+                enqueuer.tick()
+
+            enqueuer.flush()
+
             # close connection to client
             clientsock.close()
             logger.info("[thread-%s]: %s closed connection" % (threadnum, str(addr)))
@@ -251,6 +260,8 @@ def start_socket_server_twc(rootdir_path, num_sep, level, batchsize, cliargs, lo
     q = Queue.Queue(maxsize=max_connections)
     q_kill = Queue.Queue()
     lock = threading.Lock()
+    # counts the crawl jobs of all client connections
+    tracker = job_tracker(cliargs, 'crawl')
 
     try:
         # create TCP socket object
@@ -272,7 +283,7 @@ def start_socket_server_twc(rootdir_path, num_sep, level, batchsize, cliargs, lo
             t = threading.Thread(
                 target=socket_thread_handler_twc,
                 args=(i, q, q_kill, lock, rootdir_path, num_sep, 
-                        level, batchsize, cliargs, logger, reindex_dict,))
+                        level, batchsize, cliargs, logger, reindex_dict, tracker,))
             t.daemon = True
             t.start()
 
@@ -282,6 +293,8 @@ def start_socket_server_twc(rootdir_path, num_sep, level, batchsize, cliargs, lo
                 logger.info("Received signal to shutdown socket server")
                 q.join()
                 serversock.close()
+                # wait for bots to be done with crawl jobs
+                wait_for_jobs(tracker, [diskover.q_crawl], logger)
                 return starttime
             logger.info("Waiting for connection, listening on %s port %s TCP (ctrl-c to shutdown)"
                         % (str(host), str(port)))
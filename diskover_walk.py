@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""diskover - Elasticsearch file system crawler
+diskover is a file system crawler that index's
+your file metadata into Elasticsearch.
+See README.md or https://github.com/shirosaidev/diskover
+for more information.
+
+Copyright (C) Chris Park 2017-2018
+diskover is released under the Apache 2.0 license. See
+LICENSE for the full license text.
+"""
+
+from collections import deque
+import heapq
+from threading import Thread, Condition, Lock, local
+try:
+    from queue import Queue as PyQueue, Empty
+except ImportError:
+    from Queue import Queue as PyQueue, Empty
+import multiprocessing
+import platform
+import logging
+import ctypes
+import ctypes.util
+import struct
+import stat
+import time
+import sys
+import os
+
+
+# linux getdents64 system call numbers
+SYS_GETDENTS64 = {'x86_64': 217, 'amd64': 217, 'i386': 220, 'i686': 220,
+                  'aarch64': 61, 'armv7l': 217, 'ppc64le': 202, 's390x': 220}
+
+# linux_dirent64 d_type values
+DT_UNKNOWN = 0
+DT_DIR = 4
+DT_REG = 8
+DT_LNK = 10
+
+# struct linux_dirent64 header, d_ino, d_off, d_reclen, d_type, followed by d_name
+DIRENT64 = struct.Struct('=QqHB')
+
+_syscall = None
+
+# getdents buffer of each thread
+_buffers = local()
+
+if sys.version_info >= (3, 0):
+    fsdecode = os.fsdecode
+else:
+    def fsdecode(name):
+        return name.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+
+
+class WalkController(object):
+    """This is the walk controller class.
+    It sets the number of active tree walk threads using an
+    additive increase/multiplicative decrease (AIMD) controller on
+    the average directory listing latency. Every interval seconds
+    the active threads are increased by one if the average latency
+    is under target latency, else they are multiplied by decrease.
+    If maxiops is set, listings (and stats) are also limited to
+    maxiops per second using a token bucket.
+    """
+
+    def __init__(self, minthreads, maxthreads, target, maxiops=0, interval=1.0, decrease=0.5,
+                 logger=None, verbose=False):
+        self.minthreads = max(1, minthreads)
+        self.maxthreads = max(self.minthreads, maxthreads)
+        self.target = target
+        self.maxiops = maxiops
+        self.interval = interval
+        self.decrease = decrease
+        self.logger = logger or logging.getLogger('diskover')
+        self.verbose = verbose
+        self.limit = max(self.minthreads, self.maxthreads // 2)
+        self.cond = Condition()
+        self.lock = Lock()
+        self.stopped = False
+        self.latency = 0.0
+        self.totallatency = 0.0
+        self.calls = 0
+        self.ops = 0
+        self.totalops = 0
+        self.increases = 0
+        self.decreases = 0
+        self.throttletime = 0.0
+        self.windowstart = time.time()
+        self.starttime = self.windowstart
+        self.tokens = float(maxiops)
+        self.tokentime = self.windowstart
+
+    def wait_active(self, i):
+        """Block walk thread i while it's not one of the active threads,
+        returns False if the walk was stopped."""
+        with self.cond:
+            while i >= self.limit:
+                if self.stopped:
+                    return False
+                self.cond.wait(1)
+        return True
+
+    def stop(self):
+        """Wake up waiting walk threads when the walk is stopped."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def acquire(self, n=1):
+        """Take n ops from the token bucket, waits until there are
+        enough tokens when using maxiops."""
+        if not self.maxiops:
+            return
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(float(self.maxiops), self.tokens + (now - self.tokentime) * self.maxiops)
+                self.tokentime = now
+                if self.tokens >= 0:
+                    self.tokens -= n
+                    return
+                wait = -self.tokens / self.maxiops
+                self.throttletime += wait
+            time.sleep(wait)
+
+    def update(self, latency, ops=1):
+        """Add a directory listing's latency and ops (ops after the
+        first are taken from the token bucket without waiting)."""
+        with self.lock:
+            self.totallatency += latency
+            self.calls += 1
+            self.ops += ops
+            self.totalops += ops
+            if ops > 1 and self.maxiops:
+                self.tokens -= ops - 1
+            now = time.time()
+            if now - self.windowstart < self.interval:
+                return
+            self.latency = self.totallatency / self.calls
+            iops = self.ops / (now - self.windowstart)
+            self.totallatency = 0.0
+            self.calls = 0
+            self.ops = 0
+            self.windowstart = now
+        with self.cond:
+            oldlimit = self.limit
+            if self.latency > self.target:
+                self.limit = max(self.minthreads, int(self.limit * self.decrease))
+                if self.limit < oldlimit:
+                    self.decreases += 1
+            elif self.limit < self.maxthreads:
+                self.limit += 1
+                self.increases += 1
+            self.cond.notify_all()
+        if self.verbose and self.limit != oldlimit:
+            self.logger.info("Walk threads %s -> %s (latency %.3f ms, target %.3f ms, %.0f iops)"
+                             % (oldlimit, self.limit, self.latency * 1000, self.target * 1000, iops))
+
+    def stats(self):
+        """Return dict of controller state for logs and crawl stats."""
+        elapsed = time.time() - self.starttime
+        return {
+            'walk_threads': self.limit,
+            'walk_latency': round(self.latency, 6),
+            'walk_iops': round(self.totalops / elapsed, 3) if elapsed else 0.0,
+            'walk_throttle_time': round(self.throttletime, 6),
+            'walk_increases': self.increases,
+            'walk_decreases': self.decreases
+        }
+
+
+class TreeWalker(object):
+    """This is the tree walker class.
+    It walks a directory tree using a pool of threads which each
+    have their own deque of paths to list. Threads take work from
+    the end of their own deque and when it is empty steal from the
+    start of the other threads' deques. An in-flight counter tracks
+    paths which have been queued but not handed back to the caller
+    yet, so the walk ends exactly when the last directory is done.
+
+    listdir is called by the walk threads with a path and must return
+    a (root, dirs, nondirs) tuple, dirs being names (or paths) of sub
+    directories relative to path.
+
+    If descend is set, it's called by the walk thread with each root
+    and the thread queues the sub directories on it's own deque
+    right after listing (unless descend returns False), so threads
+    mostly walk their own sub trees and only steal when they run out
+    of work. Without descend, sub directories are queued after the
+    caller is done with the directory like os.walk (removing names
+    from dirs stops the walk descending into them) on the deque of
+    the thread which listed it.
+
+    If priority is set, a shared priority queue is used instead of the
+    deques. priority is called with each path and returns a number
+    (or None to use the parent directory's number), paths with larger
+    numbers are walked first.
+
+    If track is True, paths which have been queued but whose sub
+    directories have not been queued yet are kept in a pending set
+    and, with descend, paths which have been listed and their sub
+    directories queued but not handed to the caller yet are kept in
+    a listed set for crawl checkpoints.
+
+    If controller is set (WalkController), only the controller's
+    active threads list directories and listings are timed. cost
+    returns the number of ops for a listing result (default 1).
+    """
+
+    def __init__(self, listdir, threads, logger=None, priority=None, track=False, controller=None, cost=None,
+                 descend=None):
+        self.listdir = listdir
+        self.descend = descend
+        self.threads = max(1, threads)
+        self.logger = logger or logging.getLogger('diskover')
+        self.priority = priority
+        self.heap = []
+        self.heapcount = 0
+        self.deques = [deque() for i in range(self.threads)]
+        self.results = PyQueue()
+        self.cond = Condition()
+        self.inflight = 0
+        self.stopped = False
+        self.dircount = 0
+        self.steals = 0
+        self.starttime = None
+        self.pending = set() if track else None
+        self.listed = set() if track else None
+        self.controller = controller
+        self.cost = cost
+
+    def put(self, path, owner=0, prio=0):
+        """Add path to thread owner's deque (or priority queue)."""
+        with self.cond:
+            self._put(path, owner, prio)
+            self.cond.notify()
+
+    def _put(self, path, owner, prio):
+        # called with cond held
+        self.inflight += 1
+        if self.pending is not None:
+            self.pending.add(path)
+        if self.priority:
+            self.heapcount += 1
+            heapq.heappush(self.heap, (-prio, self.heapcount, path))
+        else:
+            self.deques[owner].append((path, prio))
+
+    def put_children(self, path, dirs, owner=0, prio=0):
+        """Add sub directories dirs of path to thread owner's deque
+        (or priority queue) and move path from pending to listed."""
+        children = []
+        for name in dirs:
+            new_path = os.path.join(path, name)
+            children.append((new_path, self._priority(new_path, prio)))
+        with self.cond:
+            for new_path, new_prio in children:
+                self._put(new_path, owner, new_prio)
+            if self.pending is not None:
+                self.pending.discard(path)
+                self.listed.add(path)
+            if children:
+                self.cond.notify_all()
+
+    def task_done(self, path=None):
+        """Mark a queued path as done, when there are no more paths
+        in flight a None is put in the results queue to end the walk."""
+        with self.cond:
+            if self.pending is not None:
+                self.pending.discard(path)
+                self.listed.discard(path)
+            self.inflight -= 1
+            if self.inflight == 0:
+                self.results.put(None)
+
+    def pending_paths(self):
+        """Return a list of the pending paths."""
+        with self.cond:
+            return list(self.pending or [])
+
+    def listed_paths(self):
+        """Return a list of the listed paths."""
+        with self.cond:
+            return list(self.listed or [])
+
+    def stop(self):
+        """Stop the walk threads."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.controller:
+            self.controller.stop()
+
+    def _get(self, i):
+        if self.priority:
+            with self.cond:
+                while not self.heap:
+                    if self.stopped:
+                        return None
+                    self.cond.wait(1)
+                prio, n, path = heapq.heappop(self.heap)
+                return path, -prio
+        own = self.deques[i]
+        while True:
+            try:
+                return own.pop()
+            except IndexError:
+                pass
+            # steal oldest (closest to top of tree) path from another thread
+            for n in range(1, self.threads):
+                try:
+                    item = self.deques[(i + n) % self.threads].popleft()
+                    self.steals += 1
+                    return item
+                except IndexError:
+                    continue
+            with self.cond:
+                if self.stopped:
+                    return None
+                if not any(self.deques):
+                    self.cond.wait(1)
+
+    def _worker(self, i):
+        controller = self.controller
+        while True:
+            if controller:
+                if not controller.wait_active(i):
+                    return
+            item = self._get(i)
+            if item is None:
+                return
+            path, prio = item
+            try:
+                if controller:
+                    controller.acquire()
+                    start = time.time()
+                    result = self.listdir(path)
+                    controller.update(time.time() - start, self.cost(result) if self.cost else 1)
+                else:
+                    result = self.listdir(path)
+            except (OSError, IOError) as e:
+                self.logger.warning("OS/IO Exception caused by: %s" % e)
+                result = None
+            except Exception as e:
+                self.logger.warning("Exception caused by: %s" % e)
+                result = None
+            if result is None:
+                self.task_done(path)
+                continue
+            if self.descend is not None:
+                # queue sub dirs on this thread's deque so it keeps walking it's own sub tree
+                if self.descend(result[0]):
+                    self.put_children(path, result[1], i, prio)
+                else:
+                    self.put_children(path, [], i, prio)
+            self.results.put((i, path, prio, result))
+
+    def walk(self, top):
+        """This is the walk generator.
+        It yields root, dirs, nondirs for each directory under top
+        (a path or list of paths).
+        Without descend, like os.walk, removing names from dirs before
+        the next iteration stops the walk from descending into them.
+        """
+        self.starttime = time.time()
+        if not isinstance(top, list):
+            top = [top]
+        if not top:
+            return
+        # queue all roots before the threads start so a root failing to list
+        # can't end the walk before the rest are queued
+        roots = [(path, self._priority(path, 0)) for path in top]
+        with self.cond:
+            for n, (path, prio) in enumerate(roots):
+                self._put(path, n % self.threads, prio)
+        for i in range(self.threads):
+            t = Thread(target=self._worker, args=(i,))
+            t.daemon = True
+            t.start()
+        try:
+            while True:
+                item = self.results.get()
+                if item is None:
+                    break
+                i, path, prio, result = item
+                root, dirs, nondirs = result
+                self.dircount += 1
+                if self.descend is not None:
+                    # sub dirs were queued by the walk thread
+                    self.task_done(path)
+                    yield root, dirs, nondirs
+                    continue
+                # yield before recursion
+                yield root, dirs, nondirs
+                # recurse into subdirectories, queued on the thread that listed the parent
+                self.put_children(path, dirs, i, prio)
+                self.task_done(path)
+        finally:
+            self.stop()
+
+    def _priority(self, path, parent_prio):
+        if not self.priority:
+            return 0
+        prio = self.priority(path)
+        if prio is None:
+            return parent_prio
+        return prio
+
+    def dirs_per_sec(self):
+        """Return the number of dirs walked per second."""
+        try:
+            return round(self.dircount / (time.time() - self.starttime), 3)
+        except (TypeError, ZeroDivisionError):
+            return 0.0
+
+
+class ProcessTreeWalker(TreeWalker):
+    """This is the process tree walker class.
+    It walks the top of the tree in the calling process until there
+    are enough sub trees to split up and then walks the sub trees in
+    worker processes, each process running it's own threaded tree
+    walker. Processes take the next sub tree from a shared index and
+    stream (root, dirs, nondirs) batches back to the calling process.
+
+    Since sub trees are walked in other processes, removing names from
+    dirs after they are yielded has no effect there, descend is called
+    in the worker processes with each root and returning False stops
+    the walk from descending into that directory.
+    """
+
+    def __init__(self, listdir, procs, threads, descend, logger=None, priority=None, chunksize=100):
+        TreeWalker.__init__(self, listdir, threads, logger, priority)
+        self.procs = max(1, procs)
+        self.descend = descend
+        self.chunksize = chunksize
+        self.threads = self.procs * self.threads
+        try:
+            self.mp = multiprocessing.get_context('fork')
+        except AttributeError:  # python 2
+            self.mp = multiprocessing
+
+    def _proc(self, i, subtrees, nextidx, results):
+        batch = []
+        try:
+            while True:
+                with nextidx.get_lock():
+                    k = nextidx.value
+                    nextidx.value += 1
+                if k >= len(subtrees):
+                    break
+                walker = TreeWalker(self.listdir, self.threads // self.procs, self.logger, self.priority,
+                                    descend=self.descend)
+                for root, dirs, nondirs in walker.walk(subtrees[k]):
+                    batch.append((root, dirs, nondirs))
+                    if len(batch) >= self.chunksize:
+                        results.put(batch)
+                        batch = []
+        except Exception as e:
+            self.logger.warning("Exception in walk process caused by: %s" % e)
+        finally:
+            if batch:
+                results.put(batch)
+            # tell the calling process this walk process is done
+            results.put(i)
+
+    def walk(self, top):
+        """This is the walk generator.
+        It yields root, dirs, nondirs for each directory under top.
+        """
+        self.starttime = time.time()
+        # walk top of tree breadth first until there are enough sub trees
+        frontier = deque([top])
+        while frontier and len(frontier) < self.procs * 8:
+            path = frontier.popleft()
+            try:
+                root, dirs, nondirs = self.listdir(path)
+            except (OSError, IOError) as e:
+                self.logger.warning("OS/IO Exception caused by: %s" % e)
+                continue
+            self.dircount += 1
+            yield root, dirs, nondirs
+            if not self.descend(root):
+                continue
+            for name in dirs:
+                frontier.append(os.path.join(path, name))
+        if not frontier:
+            return
+
+        # walk the sub trees in worker processes
+        subtrees = list(frontier)
+        if self.priority:
+            subtrees.sort(key=lambda p: self._priority(p, 0), reverse=True)
+        nextidx = self.mp.Value('l', 0)
+        results = self.mp.Queue()
+        procs = []
+        for i in range(min(self.procs, len(subtrees))):
+            p = self.mp.Process(target=self._proc, args=(i, subtrees, nextidx, results,))
+            p.daemon = True
+            p.start()
+            procs.append(p)
+        done = set()
+        try:
+            while len(done) < len(procs):
+                try:
+                    batch = results.get(timeout=1)
+                except Empty:
+                    # walk processes killed (oom, signal) never say they are done
+                    for i, p in enumerate(procs):
+                        if i not in done and not p.is_alive() and p.exitcode != 0:
+                            done.add(i)
+                            self.logger.warning("Walk process %s died (exit code %s), sub trees it was "
+                                                "walking are incomplete" % (p.pid, p.exitcode))
+                    continue
+                if not isinstance(batch, list):
+                    done.add(batch)
+                    continue
+                for root, dirs, nondirs in batch:
+                    self.dircount += 1
+                    yield root, dirs, nondirs
+        finally:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+
+
+def getdents_supported():
+    """Return True if getdents64 can be used on this system."""
+    return sys.platform.startswith('linux') and platform.machine() in SYS_GETDENTS64
+
+
+def _getdents64():
+    global _syscall
+    if _syscall is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _syscall = libc.syscall
+        _syscall.restype = ctypes.c_long
+        _syscall.argtypes = [ctypes.c_long, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+    return _syscall
+
+
+def _buffer(bufsize):
+    # one buffer per thread, allocating (and zeroing) a large buffer for every directory is slow
+    buf = getattr(_buffers, 'buf', None)
+    if buf is None or len(buf) != bufsize:
+        buf = _buffers.buf = ctypes.create_string_buffer(bufsize)
+    return buf
+
+
+def getdents(path, bufsize=4194304):
+    """This is the getdents generator.
+    It reads the entries of directory path using the linux getdents64
+    system call (ctypes) into a large user buffer and yields a list of
+    (name, d_type, d_ino) tuples for each buffer read, so very large
+    directories are read in chunks with few system calls. The buffer
+    is allocated once per thread and only the bytes read are copied.
+    d_type is DT_UNKNOWN on some file systems, then callers need to
+    lstat the entry (entry_type).
+    """
+    syscall = _getdents64()
+    nr = SYS_GETDENTS64[platform.machine()]
+    buf = _buffer(bufsize)
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        while True:
+            n = syscall(nr, fd, buf, bufsize)
+            if n < 0:
+                e = ctypes.get_errno()
+                raise OSError(e, os.strerror(e), path)
+            if n == 0:
+                break
+            data = ctypes.string_at(buf, n)
+            entries = []
+            pos = 0
+            while pos < n:
+                d_ino, d_off, d_reclen, d_type = DIRENT64.unpack_from(data, pos)
+                name = data[pos + DIRENT64.size:data.index(b'\0', pos + DIRENT64.size)]
+                pos += d_reclen
+                if name == b'.' or name == b'..':
+                    continue
+                entries.append((fsdecode(name), d_type, d_ino))
+            yield entries
+    finally:
+        os.close(fd)
+
+
+def entry_type(path, name, d_type):
+    """Return d_type of directory entry name in path, lstat'ing it
+    if the file system doesn't fill in d_type (DT_UNKNOWN)."""
+    if d_type != DT_UNKNOWN:
+        return d_type
+    mode = os.lstat(os.path.join(path, name)).st_mode
+    if stat.S_ISDIR(mode):
+        return DT_DIR
+    if stat.S_ISREG(mode):
+        return DT_REG
+    return DT_UNKNOWN
+
+
+class DirFiles(object):
+    """This is the dir files class.
+    It stands in for the list of files of a directory with more files
+    than fit in a crawl batch (splitfiles), the tree walk only counts
+    them and they are read again from the directory with getdents in
+    chunks when the directory is split into batches, so huge
+    directories don't need all their names in memory. Files in each
+    chunk are sorted by inode number if inodeorder.
+    """
+
+    def __init__(self, path, count, bufsize=4194304, inodeorder=False):
+        self.path = path
+        self.count = count
+        self.bufsize = bufsize
+        self.inodeorder = inodeorder
+
+    def __len__(self):
+        return self.count
+
+    def chunks(self, size):
+        """Yield lists of up to size file names (regular files).
+        If reading the directory again fails (removed, permissions
+        changed) the files read so far are yielded and a warning is
+        logged."""
+        chunk = []
+        try:
+            for entries in getdents(self.path, self.bufsize):
+                for name, d_type, d_ino in entries:
+                    try:
+                        d_type = entry_type(self.path, name, d_type)
+                    except OSError:
+                        continue
+                    if d_type != DT_REG:
+                        continue
+                    chunk.append((d_ino, name))
+                    if len(chunk) >= size:
+                        yield self._names(chunk)
+                        chunk = []
+        except OSError as e:
+            logging.getLogger('diskover').warning("Reading files of %s again failed, not all of it's files "
+                                                  "are crawled: %s" % (self.path, e))
+        if chunk:
+            yield self._names(chunk)
+
+    def _names(self, chunk):
+        if self.inodeorder:
+            chunk.sort()
+        return [name for d_ino, name in chunk]
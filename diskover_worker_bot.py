@@ -12,6 +12,7 @@ LICENSE for the full license text.
 """
 
 from diskover import listen, version, config
+from diskover_namespaces import NamespaceWorker
 from rq import SimpleWorker, Connection
 from redis import exceptions
 from datetime import datetime
@@ -20,6 +21,16 @@ import diskover_bot_module
 from diskover_bot_module import redis_conn
 
 
+def new_worker(name=None):
+    """This is the new worker function.
+    It returns a rq worker listening on the diskover queues
+    (and crawl queue namespaces if enabled).
+    """
+    if config['redis_queuenamespaces'] == "true":
+        return NamespaceWorker(listen, name=name, connection=redis_conn)
+    return SimpleWorker(listen, name=name, connection=redis_conn)
+
+
 if __name__ == "__main__":
     # parse cli arguments into cliargs dictionary
     cliargs_bot = vars(diskover_bot_module.parse_cliargs_bot())
@@ -37,7 +48,7 @@ if __name__ == "__main__":
     \033[0m""" % (version))
 
     with Connection(redis_conn):
-        w = SimpleWorker(listen)
+        w = new_worker()
         if cliargs_bot['burst']:
             w.work(burst=True, logging_level=cliargs_bot['loglevel'])
         else:
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""diskover tests, the diskover modules are in the repo root."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_bot_supervisor bot scaling."""
+
+import logging
+import os
+
+import pytest
+
+try:
+    import diskover_bot_supervisor
+except (ImportError, SystemExit):
+    pytest.skip('diskover_bot_supervisor needs diskover.cfg and diskover requirements',
+                allow_module_level=True)
+
+from diskover_bot_supervisor import BotSupervisor
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    # bots aren't forked, fork returns the next fake pid and signals are dropped
+    pids = iter(range(1000, 2000))
+    monkeypatch.setattr(os, 'fork', lambda: next(pids))
+    monkeypatch.setattr(os, 'kill', lambda pid, sig: None)
+    supervisor = BotSupervisor(1, 4, logging.getLogger('diskover_test'), scaleinterval=0)
+    monkeypatch.setattr(supervisor, 'queued_jobs', lambda: 1000)
+    monkeypatch.setattr(supervisor, 'bulk_latency', lambda: 0.0)
+    monkeypatch.setattr(supervisor, 'load', lambda: 0.0)
+    return supervisor
+
+
+def slots(supervisor):
+    return sorted(slot for slot, starttime in supervisor.bots.values())
+
+
+def bot_exited(monkeypatch, supervisor, pid):
+    statuses = [(pid, 0)]
+    monkeypatch.setattr(os, 'waitpid', lambda p, options: statuses.pop() if statuses else (0, 0))
+    supervisor.reap()
+
+
+def test_scale_up(supervisor):
+    supervisor.scale()
+    assert supervisor.live_bots() == 4
+    assert slots(supervisor) == [0, 1, 2, 3]
+
+
+def test_start_bot_no_free_slot(supervisor):
+    for _ in range(5):
+        supervisor.start_bot()
+    assert len(supervisor.bots) == 4
+    assert slots(supervisor) == [0, 1, 2, 3]
+
+
+def test_scale_up_while_bots_stopping(monkeypatch, supervisor):
+    supervisor.scale()
+    supervisor.stop_bot()
+    supervisor.stop_bot()
+    assert supervisor.live_bots() == 2
+    # stopping bots still hold their slots, no bots can be started
+    supervisor.scale()
+    assert len(supervisor.bots) == 4
+    assert supervisor.live_bots() == 2
+    # a stopped bot's slot is used again once it exits
+    pid = min(supervisor.stopping)
+    bot_exited(monkeypatch, supervisor, pid)
+    assert len(supervisor.bots) == 3
+    supervisor.scale()
+    assert len(supervisor.bots) == 4
+    assert supervisor.live_bots() == 3
+    assert slots(supervisor) == [0, 1, 2, 3]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_enqueue bulk enqueuing of rq jobs."""
+
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+rq = pytest.importorskip('rq')
+
+from diskover_enqueue import BulkEnqueuer
+from diskover_jobs import JobTracker, META_KEY
+
+
+def job_func(*args):
+    return args
+
+
+@pytest.fixture
+def redis_conn():
+    conn = fakeredis.FakeStrictRedis()
+    conn.flushall()
+    return conn
+
+
+@pytest.fixture
+def queue(redis_conn):
+    return rq.Queue('diskover_test', connection=redis_conn)
+
+
+def test_buffers_until_flushsize(queue):
+    enqueuer = BulkEnqueuer(queue, flushsize=3, flushinterval=3600)
+    enqueuer.enqueue(job_func, args=(1,))
+    enqueuer.enqueue(job_func, args=(2,))
+    assert len(enqueuer) == 2
+    assert queue.count == 0
+    enqueuer.enqueue(job_func, args=(3,))
+    assert len(enqueuer) == 0
+    assert queue.count == 3
+    assert enqueuer.enqueued == 3
+    assert enqueuer.flushes == 1
+
+
+def test_flush_keeps_order(queue):
+    enqueuer = BulkEnqueuer(queue, flushsize=100, flushinterval=3600)
+    jobs = [enqueuer.enqueue(job_func, args=(i,)) for i in range(10)]
+    assert enqueuer.flush() == 10
+    assert queue.job_ids == [job.id for job in jobs]
+    assert [job.args for job in queue.jobs] == [(i,) for i in range(10)]
+    assert enqueuer.flush() == 0
+    assert enqueuer.flushes == 1
+
+
+def test_args_pickled_when_added(queue):
+    enqueuer = BulkEnqueuer(queue, flushsize=100, flushinterval=3600)
+    batch = ['/mnt/share/a', '/mnt/share/b']
+    enqueuer.enqueue(job_func, args=(batch,))
+    del batch[:]
+    enqueuer.flush()
+    assert queue.jobs[0].args == (['/mnt/share/a', '/mnt/share/b'],)
+
+
+def test_context_manager_flushes(queue):
+    with BulkEnqueuer(queue, flushsize=100, flushinterval=3600) as enqueuer:
+        enqueuer.enqueue(job_func, args=(1,))
+        assert queue.count == 0
+    assert queue.count == 1
+
+
+def test_tick_flushes_after_interval(queue):
+    enqueuer = BulkEnqueuer(queue, flushsize=100, flushinterval=3600)
+    enqueuer.enqueue(job_func, args=(1,))
+    enqueuer.tick()
+    assert queue.count == 0
+    enqueuer.lastflush = time.time() - 3600
+    assert enqueuer.due()
+    enqueuer.tick()
+    assert queue.count == 1
+    assert not enqueuer.due()
+
+
+def test_job_options(queue):
+    enqueuer = BulkEnqueuer(queue, flushsize=100, flushinterval=3600, result_ttl=60)
+    job = enqueuer.enqueue(job_func, args=(1,), timeout=120)
+    other = enqueuer.enqueue(job_func, args=(2,), result_ttl=0)
+    enqueuer.flush()
+    assert job.result_ttl == 60
+    assert job.timeout == 120
+    assert other.result_ttl == 0
+    assert job.origin == queue.name
+    assert job.get_status() == rq.job.JobStatus.QUEUED
+
+
+def test_tracker_counts_enqueued(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    enqueuer = BulkEnqueuer(queue, flushsize=4, flushinterval=3600, tracker=tracker)
+    jobs = [enqueuer.enqueue(job_func, args=(i,)) for i in range(6)]
+    assert tracker.counts()['enqueued'] == 4
+    enqueuer.flush()
+    assert tracker.counts() == {'enqueued': 6, 'started': 0, 'finished': 0, 'failed': 0, 'deferred': 0}
+    assert all(job.meta[META_KEY] == tracker.key for job in jobs)
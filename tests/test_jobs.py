@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_jobs crawl phase job counters."""
+
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+rq = pytest.importorskip('rq')
+
+import diskover_jobs
+from diskover_enqueue import BulkEnqueuer
+from diskover_jobs import JobTracker, track_job, defer_job_done, add_job_stats, run_job_stats, job_lost, deferred_jobs
+
+# deferred job done functions of the jobs run by the test worker
+deferred = []
+
+
+@track_job
+def job_ok(dirs, files):
+    add_job_stats(dir_count=dirs, file_count=files, crawl_time=0.5)
+    return dirs
+
+
+@track_job
+def job_error():
+    raise ValueError('job error')
+
+
+@track_job
+def job_deferred(ok):
+    add_job_stats(dir_count=1)
+    deferred.append((defer_job_done(), ok))
+
+
+@track_job
+def job_deferred_error():
+    defer_job_done()
+    raise ValueError('job error')
+
+
+@pytest.fixture
+def redis_conn():
+    conn = fakeredis.FakeStrictRedis()
+    conn.flushall()
+    del deferred[:]
+    return conn
+
+
+@pytest.fixture
+def queue(redis_conn):
+    return rq.Queue('diskover_test', connection=redis_conn)
+
+
+def run_jobs(tracker, queue, jobs):
+    with BulkEnqueuer(queue, tracker=tracker) as enqueuer:
+        jobs = [enqueuer.enqueue(func, args=args) for func, args in jobs]
+    rq.SimpleWorker([queue], connection=queue.connection).work(burst=True)
+    return jobs
+
+
+def test_counts_empty(redis_conn):
+    tracker = JobTracker(redis_conn, 'test')
+    assert tracker.counts() == {'enqueued': 0, 'started': 0, 'finished': 0, 'failed': 0, 'deferred': 0}
+    assert tracker.stats() == {'dir_count': 0, 'file_count': 0, 'crawl_time': 0, 'bulk_time': 0}
+    assert tracker.done()
+
+
+def test_trackers_are_separate(redis_conn):
+    tracker = JobTracker(redis_conn, 'test')
+    other = JobTracker(redis_conn, 'test')
+    tracker.add(3)
+    assert tracker.counts()['enqueued'] == 3
+    assert other.counts()['enqueued'] == 0
+    assert not tracker.done()
+    tracker.delete()
+    assert tracker.counts()['enqueued'] == 0
+
+
+def test_done():
+    tracker = JobTracker(None, 'test')
+    assert not tracker.done({'enqueued': 3, 'finished': 1, 'failed': 1})
+    assert tracker.done({'enqueued': 3, 'finished': 2, 'failed': 1})
+
+
+def test_tracked_jobs(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    run_jobs(tracker, queue, [(job_ok, (1, 10)), (job_ok, (2, 20)), (job_error, ())])
+    assert tracker.counts() == {'enqueued': 3, 'started': 3, 'finished': 2, 'failed': 1, 'deferred': 0}
+    assert tracker.stats() == {'dir_count': 3, 'file_count': 30, 'crawl_time': 1.0, 'bulk_time': 0}
+    assert tracker.done()
+
+
+def test_untracked_jobs(redis_conn, queue):
+    queue.enqueue(job_ok, 1, 10)
+    rq.SimpleWorker([queue], connection=redis_conn).work(burst=True)
+    assert diskover_jobs._current is None
+    assert redis_conn.keys('diskover_jobs_*') == []
+
+
+def test_deferred_jobs(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    run_jobs(tracker, queue, [(job_deferred, (True,)), (job_deferred, (False,))])
+    assert tracker.counts() == {'enqueued': 2, 'started': 2, 'finished': 0, 'failed': 0, 'deferred': 2}
+    assert tracker.stats()['dir_count'] == 0
+    for done, ok in deferred:
+        done(ok, bulktime=0.25)
+        # counted once
+        done(ok, bulktime=0.25)
+    assert tracker.counts() == {'enqueued': 2, 'started': 2, 'finished': 1, 'failed': 1, 'deferred': 0}
+    assert tracker.stats() == {'dir_count': 2, 'file_count': 0, 'crawl_time': 0, 'bulk_time': 0.5}
+    assert tracker.done()
+
+
+def test_deferred_job_ids(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    jobs = run_jobs(tracker, queue, [(job_deferred, (True,)), (job_deferred, (True,))])
+    assert tracker.deferred_jobs() == set(job.id for job in jobs)
+    assert deferred_jobs(redis_conn, tracker.key) == tracker.deferred_jobs()
+    assert deferred_jobs(redis_conn, None) == set()
+    done, ok = deferred[0]
+    done(ok)
+    assert tracker.deferred_jobs() == set([jobs[1].id])
+    # counters are kept while jobs are deferred
+    tracker.delete()
+    assert redis_conn.exists(tracker.key)
+    deferred[1][0](True)
+    assert tracker.deferred_jobs() == set()
+    tracker.delete()
+    assert not redis_conn.exists(tracker.key)
+
+
+def test_deferred_job_error(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    run_jobs(tracker, queue, [(job_deferred_error, ())])
+    assert tracker.counts() == {'enqueued': 1, 'started': 1, 'finished': 0, 'failed': 1, 'deferred': 0}
+
+
+def test_run_job_stats():
+    def job(dirs):
+        add_job_stats(dir_count=dirs, bulk_time=0.5)
+        assert defer_job_done() is None
+    assert run_job_stats(job, 4) == {'dir_count': 4, 'file_count': 0, 'crawl_time': 0, 'bulk_time': 0.5}
+    assert diskover_jobs._current is None
+    # stats outside of a job are ignored
+    add_job_stats(dir_count=1)
+
+
+def test_job_lost(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    with BulkEnqueuer(queue, tracker=tracker) as enqueuer:
+        job = enqueuer.enqueue(job_ok, args=(1, 1))
+    job_lost(job)
+    assert tracker.counts()['failed'] == 1
+    assert tracker.done()
+
+
+def test_wait_done(redis_conn, queue):
+    tracker = JobTracker(redis_conn, 'test')
+    run_jobs(tracker, queue, [(job_ok, (1, 1))])
+    assert tracker.wait(interval=0.05)['finished'] == 1
+
+
+def test_wait_idle(redis_conn):
+    tracker = JobTracker(redis_conn, 'test')
+    tracker.add(2)
+    starttime = time.time()
+    counts = tracker.wait(interval=0.05, idlecheck=lambda: False, idletimeout=0.2)
+    assert counts['enqueued'] == 2
+    assert 0.2 <= time.time() - starttime < 2
+
+
+def test_wait_idle_deferred(redis_conn, queue):
+    # bots are idle while they send deferred jobs' docs, wait uses deferredtimeout
+    tracker = JobTracker(redis_conn, 'test')
+    run_jobs(tracker, queue, [(job_deferred, (True,))])
+    starttime = time.time()
+    counts = tracker.wait(interval=0.05, idlecheck=lambda: False, idletimeout=0.1, deferredtimeout=0.5)
+    assert counts['deferred'] == 1
+    assert time.time() - starttime >= 0.5
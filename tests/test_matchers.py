@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_matchers exclusion, auto tag and storage cost matchers."""
+
+import os
+import re
+import time
+
+import pytest
+
+import diskover_matchers
+from diskover_matchers import DirMatcher, FileMatcher, AutoTagger, CostMatcher
+
+
+def baseline_dir_excluded(path, excluded_dirs, included_dirs):
+    # dir_excluded from diskover.py before DirMatcher (logging removed)
+    name = os.path.basename(path)
+    if name in included_dirs or path in included_dirs:
+        return False
+    if name in excluded_dirs or path in excluded_dirs:
+        return True
+    if name.startswith('.') and u'.*' in excluded_dirs:
+        return True
+    for d in excluded_dirs:
+        if d == '.*':
+            continue
+        if d.startswith('*') and d.endswith('*'):
+            d = d.replace('*', '')
+        elif d.startswith('*'):
+            d = d + '$'
+        elif d.endswith('*'):
+            d = '^' + d
+        else:
+            if d == name or d == path:
+                return True
+            continue
+        if re.search(d, name) or re.search(d, path):
+            return True
+    return False
+
+
+def baseline_file_excluded(filename, excluded_files, included_files):
+    # file_excluded from diskover_bot_module.py before FileMatcher
+    if filename in included_files:
+        return False
+    if filename in excluded_files:
+        return True
+    extension = os.path.splitext(filename)[1][1:].strip().lower()
+    if (not extension and 'NULLEXT' in excluded_files) or \
+            '*.' + extension in excluded_files or \
+            (filename.startswith('.') and u'.*' in excluded_files):
+        return True
+    return False
+
+
+# patterns which the baseline regex checks handle as intended
+DIR_EXCLUDES = ['.*', '.snapshot', '.zfs', '~snapshot', '$RECYCLE.BIN', 'System Volume Information',
+                '/mnt/share/skipme', 'tmp*', '*cache*', 'lost+found']
+DIR_INCLUDES = ['.keep', '/mnt/share/.config']
+
+DIR_PATHS = [
+    '/mnt/share', '/mnt/share/projects', '/mnt/share/.git', '/mnt/share/.keep', '/mnt/share/.config',
+    '/mnt/share/a/.config', '/mnt/share/.snapshot', '/mnt/share/b/.zfs', '/mnt/share/~snapshot',
+    '/mnt/share/$RECYCLE.BIN', '/mnt/share/System Volume Information', '/mnt/share/skipme',
+    '/mnt/share/skipme/child', '/mnt/other/skipme', '/mnt/share/tmp', '/mnt/share/tmpfiles',
+    '/mnt/share/temp', '/mnt/share/notmp', '/mnt/share/cache', '/mnt/share/webcache2',
+    '/mnt/share/cache/sub', '/mnt/share/lost+found', '/mnt/share/lost', '/', u'/mnt/share/répertoire',
+]
+
+FILE_EXCLUDES = ['Thumbs.db', '.DS_Store', '*.tmp', '*.swp', 'NULLEXT', '.*', 'desktop.ini']
+FILE_INCLUDES = ['.gitignore', 'README']
+
+FILE_NAMES = [
+    'Thumbs.db', 'thumbs.db', '.DS_Store', '.gitignore', '.bashrc', 'README', 'Makefile', 'file.tmp',
+    'FILE.TMP', 'file.tmp.gz', 'file.swp', 'file.txt', 'archive.tar.gz', 'desktop.ini', 'noext.',
+    'ext. ', u'fichier.tmp', u'données', 'tmp',
+]
+
+
+@pytest.mark.parametrize('path', DIR_PATHS)
+def test_dir_matcher_matches_baseline(path):
+    matcher = DirMatcher(DIR_EXCLUDES, DIR_INCLUDES)
+    assert matcher.excluded(path) == baseline_dir_excluded(path, DIR_EXCLUDES, DIR_INCLUDES)
+
+
+@pytest.mark.parametrize('path', DIR_PATHS)
+def test_dir_matcher_no_excludes(path):
+    assert DirMatcher([], []).excluded(path) is False
+
+
+def test_dir_matcher_suffix():
+    # *str raised a regex error before DirMatcher
+    matcher = DirMatcher(['*_old', '*.bak'], [])
+    assert matcher.excluded('/mnt/share/projects_old')
+    assert matcher.excluded('/mnt/share/site.bak')
+    assert not matcher.excluded('/mnt/share/site_bak')
+    assert not matcher.excluded('/mnt/share/projects_old/new')
+
+
+def test_dir_matcher_prefix_is_literal():
+    # str* was the regex ^str* so tmp* also matched tm and v1.2* matched v102
+    matcher = DirMatcher(['tmp*', 'v1.2*'], [])
+    assert matcher.excluded('/mnt/share/tmp')
+    assert matcher.excluded('/mnt/share/tmpfiles')
+    assert not matcher.excluded('/mnt/share/tm')
+    assert matcher.excluded('/mnt/share/v1.2.3')
+    assert not matcher.excluded('/mnt/share/v102')
+
+
+def test_dir_matcher_prefix_path():
+    matcher = DirMatcher(['/mnt/share/scratch*'], [])
+    assert matcher.excluded('/mnt/share/scratch')
+    assert matcher.excluded('/mnt/share/scratch2')
+    assert not matcher.excluded('/mnt/share/projects')
+
+
+def test_dir_matcher_contains_is_literal():
+    matcher = DirMatcher(['*a.b*'], [])
+    assert matcher.excluded('/mnt/share/data.bin')
+    assert not matcher.excluded('/mnt/share/daxbin')
+
+
+def test_dir_matcher_include_wins():
+    matcher = DirMatcher(['.*', '*cache*'], ['.cache'])
+    assert not matcher.excluded('/home/user/.cache')
+    assert matcher.excluded('/home/user/.local')
+    assert matcher.excluded('/home/user/webcache')
+
+
+@pytest.mark.parametrize('filename', FILE_NAMES)
+def test_file_matcher_matches_baseline(filename):
+    matcher = FileMatcher(FILE_EXCLUDES, FILE_INCLUDES)
+    assert matcher.excluded(filename) == baseline_file_excluded(filename, FILE_EXCLUDES, FILE_INCLUDES)
+
+
+@pytest.mark.parametrize('filename', FILE_NAMES)
+def test_file_matcher_extension_arg(filename):
+    matcher = FileMatcher(FILE_EXCLUDES, FILE_INCLUDES)
+    extension = os.path.splitext(filename)[1][1:].strip().lower()
+    assert matcher.excluded(filename, extension) == matcher.excluded(filename)
+
+
+@pytest.mark.parametrize('filename', FILE_NAMES)
+def test_file_matcher_no_excludes(filename):
+    assert FileMatcher([], []).excluded(filename) is False
+
+
+def test_file_matcher_uppercase_extension_pattern():
+    # *.TMP never matched before since extensions are lower case
+    matcher = FileMatcher(['*.TMP'], [])
+    assert matcher.excluded('file.tmp')
+    assert matcher.excluded('FILE.TMP')
+    assert not matcher.excluded('file.txt')
+
+
+def baseline_cost(fullpath, mtime, atime, ctime, size, costpergb, base, paths, times, priority):
+    # cost_per_gb from diskover_bot_module.py before CostMatcher, returns the
+    # cost instead of setting it in a meta dict
+    basen = 1000 if base == 10 else 1024
+    size_gb = size/basen/basen/basen
+    default = round(costpergb * size_gb, 2)
+    if not paths and not times:
+        return default
+    pathpass = False
+    timepass = False
+    costpergb_path = 0
+    costpergb_time = 0
+    filename = os.path.basename(fullpath)
+    parentdir = os.path.abspath(os.path.join(fullpath, os.pardir))
+    for pattern in paths:
+        if pathpass:
+            break
+        for key in ('path_exclude', 'path'):
+            for path in pattern.get(key, []):
+                matched = path == parentdir or path == filename
+                if not matched:
+                    if path.startswith('*') and path.endswith('*'):
+                        path = path.replace('*', '')
+                    elif path.startswith('*'):
+                        path = path + '$'
+                    elif path.endswith('*'):
+                        path = '^' + path
+                    matched = re.search(path, parentdir) or re.search(path, filename)
+                if matched and key == 'path_exclude':
+                    return default
+                if matched:
+                    pathpass = True
+                    costpergb_path = pattern['costpergb']
+                    break
+    for pattern in times:
+        timepass = True
+        for key, value in (('mtime', mtime), ('atime', atime), ('ctime', ctime)):
+            if pattern.get(key, 0) > 0 and value and time.time() - value < pattern[key] * 86400:
+                timepass = False
+                break
+        if timepass:
+            costpergb_time = pattern['costpergb']
+            break
+    if pathpass and timepass:
+        cost = costpergb_path if priority == 'path' else costpergb_time
+    elif pathpass:
+        cost = costpergb_path
+    elif timepass:
+        cost = costpergb_time
+    else:
+        return default
+    return round(cost * size_gb, 2)
+
+
+DAY = 86400
+GB = 1024 ** 3
+
+COST_PATHS = [
+    {'path': ['*/fastdisk/*', '*/fast*'], 'path_exclude': ['*/fastdisk/scratch*'], 'costpergb': 0.05},
+    {'path': ['/mnt/share/slow', '*archive*'], 'path_exclude': ['skipme.dat'], 'costpergb': 0.02},
+]
+COST_TIMES = [
+    {'mtime': 365, 'atime': 0, 'ctime': 365, 'costpergb': 0.01},
+    {'mtime': 30, 'atime': 30, 'costpergb': 0.015},
+]
+
+
+def cost_records(now):
+    old = now - 400 * DAY
+    month = now - 60 * DAY
+    new = now - DAY
+    return [
+        ('/mnt/share/fastdisk/a/file1', new, new, new, 10 * GB),
+        ('/mnt/share/fastdisk/scratch1/file2', old, old, old, 3 * GB),
+        ('/mnt/share/fastdisk/scratch', old, old, old, 3 * GB),
+        ('/mnt/share/fastdisk/a/file3', old, old, old, 7 * GB),
+        ('/mnt/share/slow/file4', month, month, month, 5 * GB),
+        ('/mnt/share/slow/skipme.dat', old, old, old, 5 * GB),
+        ('/mnt/share/archive2018/file5', new, old, new, GB // 3),
+        ('/mnt/share/other/file6', old, old, old, 100 * GB),
+        ('/mnt/share/other/file7', month, new, month, 2 * GB),
+        ('/mnt/share/other/file8', new, new, new, 2 * GB),
+        ('/mnt/share/other/file9', None, None, None, 4 * GB),
+        ('/mnt/share/other/file10', 0, 0, 0, 4 * GB),
+        ('/mnt/share/other/empty', old, old, old, 0),
+        ('/file11', old, old, old, GB),
+    ]
+
+
+COST_CONFIGS = {
+    'default only': ([], [], 'path'),
+    'paths': (COST_PATHS, [], 'path'),
+    'times': ([], COST_TIMES, 'path'),
+    'path priority': (COST_PATHS, COST_TIMES, 'path'),
+    'time priority': (COST_PATHS, COST_TIMES, 'time'),
+}
+
+
+@pytest.mark.parametrize('base', [2, 10])
+@pytest.mark.parametrize('config', sorted(COST_CONFIGS))
+def test_cost_matcher_matches_baseline(config, base):
+    paths, times, priority = COST_CONFIGS[config]
+    matcher = CostMatcher(0.03, base, paths, times, priority)
+    now = time.time()
+    records = cost_records(now)
+    expected = [baseline_cost(*(record + (0.03, base, paths, times, priority))) for record in records]
+    assert matcher.costs(records, now) == expected
+
+
+@pytest.mark.parametrize('config', sorted(COST_CONFIGS))
+def test_cost_matcher_numpy_and_python(monkeypatch, config):
+    pytest.importorskip('numpy')
+    paths, times, priority = COST_CONFIGS[config]
+    matcher = CostMatcher(0.03, 2, paths, times, priority)
+    now = time.time()
+    records = cost_records(now)
+    withnumpy = matcher.costs(records, now)
+    monkeypatch.setattr(diskover_matchers, 'np', None)
+    assert matcher.costs(records, now) == withnumpy
+    # single records use the pure Python checks
+    monkeypatch.undo()
+    assert [matcher.costs([record], now)[0] for record in records] == withnumpy
+
+
+def test_cost_matcher_empty():
+    assert CostMatcher(0.03, 2, COST_PATHS, COST_TIMES, 'path').costs([]) == []
+
+
+def baseline_autotag_search(patterns, value):
+    # wildcard checks of auto_tag before AutoTagger, None if patterns is missing
+    if patterns is None:
+        return None
+    found = False
+    for pattern in patterns:
+        if pattern == value:
+            return True
+        if pattern.startswith('*') and pattern.endswith('*'):
+            pattern = pattern.replace('*', '')
+        elif pattern.startswith('*'):
+            pattern = pattern + '$'
+        elif pattern.endswith('*'):
+            pattern = '^' + pattern
+        if re.search(pattern, value):
+            return True
+    return found
+
+
+def baseline_auto_tag(metadict, type, mtime, atime, ctime, autotag_files, autotag_dirs):
+    # auto_tag from diskover_bot_module.py before AutoTagger, the pass flags
+    # are kept from the previous pattern if a pattern doesn't have the list
+    extpass = namepass = pathpass = True
+    patterns = autotag_files if type == 'file' else autotag_dirs if type == 'directory' else []
+    for pattern in patterns:
+        if baseline_autotag_search(pattern.get('name_exclude'), metadict['filename']) or \
+                baseline_autotag_search(pattern.get('path_exclude'), metadict['path_parent']):
+            return metadict
+        if type == 'file' and pattern.get('ext'):
+            extpass = baseline_autotag_search(pattern['ext'], metadict['extension'])
+        if pattern.get('name'):
+            namepass = baseline_autotag_search(pattern['name'], metadict['filename'])
+        if pattern.get('path'):
+            pathpass = baseline_autotag_search(pattern['path'], metadict['path_parent'])
+        timepass = True
+        for key, value in (('mtime', mtime), ('atime', atime), ('ctime', ctime)):
+            if pattern.get(key, 0) > 0 and value and time.time() - value < pattern[key] * 86400:
+                timepass = False
+                break
+        if extpass and namepass and pathpass and timepass:
+            metadict['tag'] = pattern['tag']
+            metadict['tag_custom'] = pattern['tag_custom']
+            return metadict
+    return metadict
+
+
+# every pattern has ext (files), name and path so the old pass flags aren't
+# kept from the previous pattern
+AUTOTAG_FILES = [
+    {'name_exclude': ['*keep*'], 'path_exclude': ['/mnt/share/protected'], 'ext': ['tmp', 'temp'],
+     'name': ['.*'], 'path': ['.*'], 'mtime': 0, 'atime': 0, 'ctime': 0, 'tag': 'delete', 'tag_custom': 'tmp'},
+    {'name_exclude': ['README'], 'ext': ['log', '*gz*'], 'name': ['.*'], 'path': ['*/logs*'],
+     'mtime': 30, 'atime': 0, 'ctime': 0, 'tag': 'archive', 'tag_custom': 'old logs'},
+    {'ext': ['jpg', 'png'], 'name': ['.*'], 'path': ['/mnt/share/photos', '*photos*'],
+     'mtime': 0, 'atime': 0, 'ctime': 0, 'tag': 'keep', 'tag_custom': 'photos'},
+    {'ext': ['.*'], 'name': ['*tmp*', 'core'], 'path': ['.*'], 'mtime': 0, 'atime': 0, 'ctime': 7,
+     'tag': 'delete', 'tag_custom': 'tmp name'},
+]
+AUTOTAG_DIRS = [
+    {'name_exclude': ['.git'], 'path_exclude': ['*/archive*'], 'name': ['*cache*', 'tmp'], 'path': ['.*'],
+     'tag': 'delete', 'tag_custom': 'cache'},
+    {'name': ['.*'], 'path': ['/mnt/share/projects'], 'mtime': 365, 'atime': 0, 'ctime': 0,
+     'tag': 'archive', 'tag_custom': 'old projects'},
+]
+
+# filename, path_parent, age in days
+AUTOTAG_ITEMS = [
+    ('file.tmp', '/mnt/share', 1), ('keep.tmp', '/mnt/share', 1), ('FILE.TEMP', '/mnt/share/protected', 1),
+    ('app.log', '/mnt/share/logs', 60), ('app.log', '/mnt/share/logs', 1), ('app.log.gz', '/var/logs/old', 60),
+    ('README', '/mnt/share/logs', 60), ('tmp.log', '/mnt/share/logs', 60), ('tmp.log', '/mnt/share/logs', 1),
+    ('img.jpg', '/mnt/share/photos', 1), ('img.png', '/mnt/share/photos2018/a', 1), ('img.jpg', '/mnt/share', 1),
+    ('core', '/mnt/share/bin', 30), ('core', '/mnt/share/bin', 1), ('tmpdir', '/mnt/share', 30),
+    ('cache', '/mnt/share', 1), ('webcache', '/mnt/share/archive2018', 1), ('.git', '/mnt/share/cache', 1),
+    ('tmp', '/mnt/share', 1), ('old', '/mnt/share/projects', 400), ('new', '/mnt/share/projects', 10),
+    ('noext', '/mnt/share', 1), (u'données.tmp', u'/mnt/share/répertoire', 1),
+]
+
+
+def autotag_item(filename, path_parent):
+    return {'filename': filename, 'path_parent': path_parent,
+            'extension': os.path.splitext(filename)[1][1:].strip().lower(), 'tag': '', 'tag_custom': ''}
+
+
+@pytest.mark.parametrize('type', ['file', 'directory'])
+def test_auto_tagger_matches_baseline(type):
+    # one tagger for all items so rules cached for each extension are used again
+    tagger = AutoTagger(AUTOTAG_FILES, AUTOTAG_DIRS)
+    now = time.time()
+    for filename, path_parent, days in AUTOTAG_ITEMS * 2:
+        t = now - days * DAY
+        expected = baseline_auto_tag(autotag_item(filename, path_parent), type, t, t, t,
+                                     AUTOTAG_FILES, AUTOTAG_DIRS)
+        assert tagger.tag(autotag_item(filename, path_parent), type, t, t, t) == expected
+
+
+def auto_tag(tagger, filename, path_parent, days=1, type='file'):
+    t = time.time() - days * DAY
+    metadict = tagger.tag(autotag_item(filename, path_parent), type, t, t, t)
+    return metadict['tag'], metadict['tag_custom']
+
+
+def test_auto_tagger_exclude_stops_later_rules():
+    tagger = AutoTagger(AUTOTAG_FILES, AUTOTAG_DIRS)
+    # keep.tmp would be tagged by the tmp name rule
+    assert auto_tag(tagger, 'keep.tmp', '/mnt/share') == ('', '')
+    assert auto_tag(tagger, 'file.tmp', '/mnt/share/protected') == ('', '')
+    assert auto_tag(tagger, 'tmpfile', '/mnt/share/protected') == ('', '')
+    assert auto_tag(tagger, 'tmpfile', '/mnt/share', days=30) == ('delete', 'tmp name')
+    assert auto_tag(tagger, 'cache', '/mnt/share/archive', type='directory') == ('', '')
+
+
+def test_auto_tagger_first_match_wins():
+    tagger = AutoTagger(AUTOTAG_FILES, AUTOTAG_DIRS)
+    assert auto_tag(tagger, 'tmp.log', '/mnt/share/logs', days=60) == ('archive', 'old logs')
+    # too new for the logs rule, the tmp name rule is next
+    assert auto_tag(tagger, 'tmp.log', '/mnt/share/logs', days=10) == ('delete', 'tmp name')
+    assert auto_tag(tagger, 'tmp.log', '/mnt/share/logs', days=1) == ('', '')
+
+
+def test_auto_tagger_extension_cache():
+    tagger = AutoTagger(AUTOTAG_FILES, AUTOTAG_DIRS)
+    rules = tagger._file_rules('log')
+    assert tagger._file_rules('log') is rules
+    # rules with excludes are kept for every extension but can't match
+    assert [(rule.pattern['tag_custom'], canmatch) for rule, canmatch in rules] == \
+        [('tmp', False), ('old logs', True), ('tmp name', True)]
+    assert [rule.pattern['tag_custom'] for rule, canmatch in tagger._file_rules('jpg') if canmatch] == \
+        ['photos', 'tmp name']
+    assert sorted(tagger.ext_rules) == ['jpg', 'log']
+
+
+def test_auto_tagger_dirs_and_files():
+    tagger = AutoTagger(AUTOTAG_FILES, AUTOTAG_DIRS)
+    assert auto_tag(tagger, 'cache', '/mnt/share', type='directory') == ('delete', 'cache')
+    assert auto_tag(tagger, 'cache', '/mnt/share', type='file') == ('', '')
+    assert auto_tag(tagger, 'img.jpg', '/mnt/share/photos', type='directory') == ('', '')
+    assert auto_tag(tagger, 'img.jpg', '/mnt/share/photos', type='file') == ('keep', 'photos')
+    assert auto_tag(tagger, 'file.tmp', '/mnt/share', type='other') == ('', '')
+    assert auto_tag(AutoTagger([], []), 'file.tmp', '/mnt/share') == ('', '')
+
+
+def test_auto_tagger_missing_lists_pass():
+    # the old checks kept the pass flags from the previous pattern when a pattern
+    # didn't have ext, name or path, now missing or empty lists always pass
+    tagger = AutoTagger([{'ext': ['jpg'], 'name': ['nomatch'], 'tag': 'a', 'tag_custom': ''},
+                         {'path': ['*/photos*'], 'name': [], 'tag': 'b', 'tag_custom': ''}], [])
+    assert auto_tag(tagger, 'img.jpg', '/mnt/share/photos') == ('b', '')
+
+
+def test_auto_tagger_suffix_pattern():
+    # *str raised a regex error before AutoTagger
+    tagger = AutoTagger([{'name': ['*.bak'], 'tag': 'delete', 'tag_custom': 'backup'}], [])
+    assert auto_tag(tagger, 'file.bak', '/mnt/share') == ('delete', 'backup')
+    assert auto_tag(tagger, 'file.bak.txt', '/mnt/share') == ('', '')
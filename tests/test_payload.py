@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_payload batch encoding and settings records."""
+
+import pickle
+
+import pytest
+
+from diskover_payload import encode_batch, decode_batch, compression_supported, settings_key, \
+    COMPACT, RAW, NONE
+
+COMPRESSIONS = ['none', 'zlib'] + (['lz4'] if compression_supported('lz4') else [])
+
+STATS = (33188, 1234, 2049, 1, 1000, 1000, 4096, 1500000000, 1500000001, 1500000002, 8)
+
+
+def batch_of(*entries):
+    return list(entries)
+
+
+BATCHES = {
+    'dirs and files': batch_of(
+        ('/mnt/share/projects', ['a', 'b'], ['file1.txt', 'file2.jpg']),
+        ('/mnt/share/projects/a', [], ['file1.txt', 'other.dat']),
+        ('/mnt/share/projects/b', ['c'], []),
+    ),
+    'split dir 4-tuple': batch_of(
+        ('/mnt/share/big', ['sub'], ['f%s' % i for i in range(10)], 3),
+        ('/mnt/share/other', [], ['x']),
+    ),
+    'split files only': batch_of(
+        ('/mnt/share/big', None, ['f%s' % i for i in range(10, 20)]),
+    ),
+    'dirsonly 2-tuple': batch_of(
+        ('/mnt/share/projects', ['a', 'b']),
+        ('/mnt/share/projects/a', []),
+    ),
+    'embeded stats': batch_of(
+        (('/mnt/share/projects', STATS), ['a'],
+         [('/mnt/share/projects/file1.txt', STATS), ('/mnt/share/projects/file2.jpg', STATS)]),
+        (('/mnt/share/projects/a', STATS), [], [('/mnt/share/projects/a/x', STATS)]),
+    ),
+    'embeded stats split files only': batch_of(
+        (('/mnt/share/big', STATS), None, [('/mnt/share/big/f1', STATS), ('/mnt/share/big/f2', STATS)]),
+    ),
+    'unicode names': batch_of(
+        (u'/mnt/share/d\xe9j\xe0', [u'caf\xe9'], [u'日本.txt', u'na\xefve']),
+    ),
+    'root dir': batch_of(
+        ('/', ['mnt', 'tmp'], ['vmlinuz']),
+    ),
+    'relative roots': batch_of(
+        ('projects', ['a'], ['f']),
+        ('other', [], ['g']),
+    ),
+    'empty': batch_of(),
+}
+
+QUMULO_ROOT = {'path': '/projects/', 'id': '3', 'size': '0', 'modification_time': '2018-01-01T00:00:00Z'}
+QUMULO_FILE = {'path': '/projects/file1.txt', 'name': 'file1.txt', 'type': 'FS_FILE_TYPE_FILE'}
+
+
+def normalized(batch):
+    # decoded entries are tuples with lists of dirs/files like the tree walk's
+    return [tuple(list(x) if isinstance(x, (list, tuple)) and i in (1, 2) else x
+                  for i, x in enumerate(entry)) for entry in batch]
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('name', sorted(BATCHES))
+def test_round_trip(name, compression):
+    batch = BATCHES[name]
+    assert normalized(decode_batch(encode_batch(batch, compression))) == normalized(batch)
+
+
+@pytest.mark.parametrize('name', ['dirs and files', 'split dir 4-tuple', 'dirsonly 2-tuple', 'embeded stats'])
+def test_path_batches_are_compacted(name):
+    data = encode_batch(BATCHES[name], 'none')
+    assert data[:1] == NONE
+    assert pickle.loads(data[1:])[0] == COMPACT
+
+
+def test_compact_is_smaller():
+    batch = [('/mnt/share/projects/dir%s' % i, [], ['file%s.txt' % j for j in range(20)]) for i in range(50)]
+    assert len(encode_batch(batch, 'none')) < len(pickle.dumps(batch, protocol=2))
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_qumulo_raw_round_trip(compression):
+    batch = [(QUMULO_ROOT, ['a'], [QUMULO_FILE])]
+    data = encode_batch(batch, compression)
+    assert decode_batch(data) == batch
+    assert pickle.loads(encode_batch(batch, 'none')[1:])[0] == RAW
+
+
+def test_file_outside_root_kept_as_is():
+    # embeded stats files which aren't directly in root keep their full path
+    batch = [(('/mnt/a', STATS), [], [('/mnt/b/file', STATS), ('/mnt/a/sub/file', STATS)])]
+    assert normalized(decode_batch(encode_batch(batch))) == normalized(batch)
+
+
+def test_lz4_falls_back_to_zlib_when_not_installed(monkeypatch):
+    import diskover_payload
+    monkeypatch.setattr(diskover_payload, 'lz4frame', None)
+    data = encode_batch(BATCHES['dirs and files'], 'lz4')
+    assert data[:1] == diskover_payload.ZLIB
+    assert normalized(decode_batch(data)) == normalized(BATCHES['dirs and files'])
+
+
+def test_settings_key_is_stable():
+    cliargs = {'index': 'diskover-test', 'rootdir': '/mnt', 'minsize': 1}
+    assert settings_key(cliargs) == settings_key(dict(reversed(list(cliargs.items()))))
+    assert settings_key(cliargs) != settings_key(dict(cliargs, minsize=0))
+    assert settings_key(cliargs).startswith('diskover_settings_diskover-test_')
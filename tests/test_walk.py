@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Tests for diskover_walk tree walkers."""
+
+import os
+import time
+
+import pytest
+
+from diskover_walk import TreeWalker, DirFiles, getdents_supported
+
+
+def make_tree(base, depth=3, width=3):
+    # width sub dirs and one file in each dir, depth levels deep
+    paths = [str(base)]
+    dirs = [str(base)]
+    for level in range(depth):
+        subdirs = []
+        for path in dirs:
+            open(os.path.join(path, 'file'), 'w').close()
+            for n in range(width):
+                subdir = os.path.join(path, 'd%s' % n)
+                os.mkdir(subdir)
+                subdirs.append(subdir)
+        paths.extend(subdirs)
+        dirs = subdirs
+    return paths
+
+
+def listdir(path):
+    dirs = []
+    nondirs = []
+    for name in os.listdir(path):
+        if os.path.isdir(os.path.join(path, name)):
+            dirs.append(name)
+        else:
+            nondirs.append(name)
+    return path, dirs, nondirs
+
+
+def failing_listdir(bad):
+    def func(path):
+        if path == bad:
+            raise OSError(2, 'No such file or directory', path)
+        return listdir(path)
+    return func
+
+
+@pytest.mark.parametrize('descend', [None, lambda root: True])
+@pytest.mark.parametrize('threads', [1, 4])
+def test_walk(tmpdir, threads, descend):
+    paths = make_tree(tmpdir)
+    walker = TreeWalker(listdir, threads, descend=descend)
+    roots = [root for root, dirs, nondirs in walker.walk(str(tmpdir))]
+    assert sorted(roots) == sorted(paths)
+    assert walker.dircount == len(paths)
+
+
+def test_walk_prune(tmpdir):
+    make_tree(tmpdir)
+    walker = TreeWalker(listdir, 4)
+    roots = []
+    for root, dirs, nondirs in walker.walk(str(tmpdir)):
+        roots.append(root)
+        dirs[:] = [d for d in dirs if d != 'd0']
+    assert roots and not any(os.sep + 'd0' in root for root in roots)
+
+
+@pytest.mark.parametrize('descend', [None, lambda root: True])
+@pytest.mark.parametrize('threads', [1, 4])
+def test_walk_roots_first_fails(tmpdir, threads, descend):
+    # like --resume roots, the first root was removed since the checkpoint
+    paths = make_tree(tmpdir, depth=2)
+    bad = os.path.join(str(tmpdir), 'gone')
+    top = [bad] + [os.path.join(str(tmpdir), 'd%s' % n) for n in range(3)]
+
+    def priority(path):
+        # slow for roots, the bad root fails while the others are still being added
+        if path in top:
+            time.sleep(0.05)
+        return 0
+
+    for walker in (TreeWalker(failing_listdir(bad), threads, descend=descend),
+                   TreeWalker(failing_listdir(bad), threads, priority=priority, descend=descend)):
+        roots = [root for root, dirs, nondirs in walker.walk(list(top))]
+        assert sorted(roots) == sorted(p for p in paths if p != str(tmpdir))
+
+
+def test_walk_track(tmpdir):
+    make_tree(tmpdir, depth=2)
+    walker = TreeWalker(listdir, 2, track=True, descend=lambda root: True)
+    for root, dirs, nondirs in walker.walk(str(tmpdir)):
+        assert root not in walker.pending_paths()
+    assert walker.pending_paths() == []
+    assert walker.listed_paths() == []
+
+
+@pytest.mark.skipif(not getdents_supported(), reason='getdents64 not supported')
+@pytest.mark.parametrize('inodeorder', [False, True])
+def test_dir_files_chunks(tmpdir, inodeorder):
+    names = ['f%s' % n for n in range(25)]
+    for name in names:
+        open(os.path.join(str(tmpdir), name), 'w').close()
+    os.mkdir(os.path.join(str(tmpdir), 'subdir'))
+    files = DirFiles(str(tmpdir), len(names), 65536, inodeorder)
+    chunks = list(files.chunks(10))
+    assert len(files) == 25
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert sorted(name for chunk in chunks for name in chunk) == sorted(names)
+
+
+@pytest.mark.skipif(not getdents_supported(), reason='getdents64 not supported')
+def test_dir_files_removed(tmpdir):
+    path = os.path.join(str(tmpdir), 'gone')
+    files = DirFiles(path, 100)
+    assert list(files.chunks(10)) == []